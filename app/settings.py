@@ -92,6 +92,31 @@ MIDDLEWARE = [
      
 ]
 
+# Redis compartido entre workers (REDIS_URL); sin él, cache en memoria del proceso
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# El cache lo comparten todos los procesos (workers, cron, comandos). Los contadores de lead-metrics,
+# la versión del registro de LeadType, el feed del índice de sugerencias y el cache de resultados de
+# lead-search se coordinan por el cache: sin él se desactivan o degradan (ver README). Con locmem
+# solo es correcto en un despliegue de un solo proceso, y hay que activarlo explícitamente.
+SHARED_CACHE = config('SHARED_CACHE', default=bool(REDIS_URL), cast=bool)
+
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
 
@@ -120,6 +145,37 @@ WSGI_APPLICATION = 'app.wsgi.application'
 LOCAL = config('LOCAL', default=False, cast=bool)
 DOMAIN = config('DOMAIN', default='')
 
+# existence usa INSERT ... ON CONFLICT (una sentencia, tryet incrementado en la base)
+LEAD_ATOMIC_UPSERT = config('LEAD_ATOMIC_UPSERT', default=True, cast=bool)
+
+# Ruta del backend de lead_search; vacío = trigramas en PostgreSQL / FTS5 en SQLite
+LEAD_SEARCH_BACKEND = config('LEAD_SEARCH_BACKEND', default='')
+
+# Cada cuántos segundos el índice de lead-search/suggest revisa cambios de otros workers
+LEAD_SUGGEST_SYNC_SECONDS = config('LEAD_SUGGEST_SYNC_SECONDS', default=5, cast=int)
+
+# TTL en segundos del cache de resultados de lead-search; 0 lo desactiva
+LEAD_SEARCH_CACHE_TTL = config('LEAD_SEARCH_CACHE_TTL', default=0, cast=int)
+
+# Segundos que una respuesta de lead-metrics se sirve sin recalcular; 0 lo desactiva
+LEAD_METRICS_CACHE_TTL = config('LEAD_METRICS_CACHE_TTL', default=10, cast=int)
+# Segundos extra en que se sirve la respuesta vencida mientras un solo worker la recalcula
+LEAD_METRICS_CACHE_STALE_TTL = config('LEAD_METRICS_CACHE_STALE_TTL', default=300, cast=int)
+
+# Directorio del spool de ingesta de page_analytics; vacío = los accesos se insertan en la petición.
+# Con spool, create y batch escriben en disco y responden 202; un flusher los carga a la base.
+PAGE_ANALYTICS_SPOOL_DIR = config('PAGE_ANALYTICS_SPOOL_DIR', default='')
+# Un segmento se cierra (y queda listo para cargarse) al llegar a este tamaño o a esta edad
+PAGE_ANALYTICS_SPOOL_SEGMENT_BYTES = config('PAGE_ANALYTICS_SPOOL_SEGMENT_BYTES', default=4 * 1024 * 1024, cast=int)
+PAGE_ANALYTICS_SPOOL_SEGMENT_SECONDS = config('PAGE_ANALYTICS_SPOOL_SEGMENT_SECONDS', default=2, cast=float)
+# fsync en cada escritura: un 202 garantiza que el evento sobrevive a una caída del servidor
+PAGE_ANALYTICS_SPOOL_FSYNC = config('PAGE_ANALYTICS_SPOOL_FSYNC', default=True, cast=bool)
+# Hilo de carga dentro de cada worker; False si se corre flush_page_access_spool --loop aparte
+PAGE_ANALYTICS_SPOOL_FLUSHER_THREAD = config('PAGE_ANALYTICS_SPOOL_FLUSHER_THREAD', default=True, cast=bool)
+PAGE_ANALYTICS_SPOOL_FLUSH_SECONDS = config('PAGE_ANALYTICS_SPOOL_FLUSH_SECONDS', default=1, cast=float)
+# Intentos de carga de un segmento que falla por sus datos antes de apartarlo como .failed
+PAGE_ANALYTICS_SPOOL_MAX_ATTEMPTS = config('PAGE_ANALYTICS_SPOOL_MAX_ATTEMPTS', default=3, cast=int)
+
 if LOCAL:
     
     DATABASES = {
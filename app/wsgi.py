@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# Cada worker construye en segundo plano su índice de /lead-search/suggest/ al arrancar
+from lead_search.suggest import start_build  # noqa: E402
+
+start_build()
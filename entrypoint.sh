@@ -9,6 +9,8 @@ echo "Running makemigrations and migrate..."
 python manage.py makemigrations
 python manage.py makemigrations lead_type lead lead_search lead_metrics page_analytics expose
 python manage.py migrate
+# Índices de búsqueda (en PostgreSQL con CREATE INDEX CONCURRENTLY, sin bloquear escrituras)
+python manage.py setup_lead_search
 # Inicia el servidor con watchmedo
 echo "Starting the server with watchmedo..."
 watchmedo auto-restart --directory=./ --pattern=*.py --recursive -- gunicorn -b 0.0.0.0:8080 app.wsgi:application
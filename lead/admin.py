@@ -1,3 +1,35 @@
 from django.contrib import admin
+from lead.models import Lead, LeadStatusTransition
 
-# Register your models here.
+
+def set_status_action(value, label):
+    def action(modeladmin, request, queryset):
+        changed = queryset.set_status(value)
+        modeladmin.message_user(request, f'{changed} leads marcados como {label}')
+    action.__name__ = f'set_status_{value}'
+    action.short_description = f'Marcar como {label}'
+    return action
+
+
+@admin.register(Lead)
+class LeadAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'email', 'phone_number', 'lead_type', 'status', 'store_id', 'tryet', 'created_at']
+    list_filter = ['status', 'lead_type', 'store_id']
+    search_fields = ['email_normalized', 'phone_digits', 'name']
+    readonly_fields = ['created_at', 'tryet', 'email_normalized', 'phone_digits']
+    # Los cambios en bloque pasan por set_status para quedar en la bitácora
+    actions = [set_status_action(value, label) for value, label in Lead.STATUS_CHOICES]
+
+
+@admin.register(LeadStatusTransition)
+class LeadStatusTransitionAdmin(admin.ModelAdmin):
+    list_display = ['lead', 'from_status', 'to_status', 'changed_at', 'seconds_since_created']
+    list_filter = ['to_status']
+    raw_id_fields = ['lead']
+
+    # Bitácora de solo inserciones
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
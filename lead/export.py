@@ -0,0 +1,92 @@
+import csv
+import datetime
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from lead.models import Lead
+
+EXPORT_FIELDS = ['id', 'name', 'email', 'phone_number', 'lead_type_id', 'store_id', 'status',
+                 'tryet', 'products_interest_ids', 'created_at']
+EXPORT_FORMATS = ('csv', 'ndjson')
+# Filas por fetch del cursor del servidor y por bloque enviado al cliente
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Buffer falso para csv.writer: regresa la línea en lugar de guardarla"""
+
+    def write(self, value):
+        return value
+
+
+def parse_boundary(value, end=False):
+    """
+    Acepta fecha (YYYY-MM-DD) o fecha-hora ISO. Una fecha sola como límite
+    superior incluye el día completo.
+    """
+    day = parse_date(value)
+    if day is not None:
+        if end:
+            day += datetime.timedelta(days=1)
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_queryset(params):
+    """Queryset de exportación con los filtros de la petición; ValueError si alguno es inválido"""
+    queryset = Lead.objects.all()
+
+    for param, lookup in (('store_id', 'store_id'), ('lead_type', 'lead_type_id')):
+        if params.get(param):
+            queryset = queryset.filter(**{lookup: int(params[param])})
+
+    if params.get('status'):
+        queryset = queryset.filter(status=params['status'])
+
+    # Rango semiabierto [created_from, created_to)
+    if params.get('created_from'):
+        queryset = queryset.filter(created_at__gte=parse_boundary(params['created_from']))
+    if params.get('created_to'):
+        queryset = queryset.filter(created_at__lt=parse_boundary(params['created_to'], end=True))
+
+    return queryset.order_by('id')
+
+
+def iter_rows(queryset):
+    return queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+
+    created_at = EXPORT_FIELDS.index('created_at')
+    chunk = []
+    for row in iter_rows(queryset):
+        row = list(row)
+        row[created_at] = row[created_at].isoformat()
+        chunk.append(writer.writerow(row))
+        if len(chunk) == CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def stream_ndjson(queryset):
+    encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+    chunk = []
+    for row in iter_rows(queryset):
+        chunk.append(encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n')
+        if len(chunk) == CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
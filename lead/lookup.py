@@ -0,0 +1,46 @@
+import re
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db.models import Q
+
+# Dígitos que se conservan de un teléfono: los 10 del número nacional, sin lada de país
+PHONE_DIGITS = 10
+PHONE_SHAPE = re.compile(r'[\d\s()+.-]+')
+NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_email(email):
+    """Forma canónica del email para deduplicar: sin espacios y en minúsculas"""
+    if email is None:
+        return None
+    return email.strip().lower()
+
+
+def normalize_phone(phone_number):
+    """
+    Solo los dígitos del teléfono, y de ellos los últimos 10, para que
+    '+52 55 1234 5678', '(55) 1234-5678' y '5512345678' coincidan.
+    """
+    if not phone_number:
+        return None
+    digits = NON_DIGITS.sub('', phone_number)
+    return digits[-PHONE_DIGITS:] or None
+
+
+def exact_lookup(q):
+    """
+    Condición sobre las columnas normalizadas cuando q es un email o un
+    teléfono completos (búsqueda por índice); None si q es texto parcial.
+    """
+    q = (q or '').strip()
+    if '@' in q:
+        try:
+            validate_email(q)
+        except ValidationError:
+            return None
+        return Q(email_normalized=normalize_email(q))
+    if PHONE_SHAPE.fullmatch(q):
+        digits = normalize_phone(q)
+        if digits and len(digits) == PHONE_DIGITS:
+            return Q(phone_digits=digits)
+    return None
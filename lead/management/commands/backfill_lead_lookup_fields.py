@@ -0,0 +1,118 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from lead.lookup import normalize_email, normalize_phone
+from lead.models import Lead, LeadStatusTransition
+from lead.upsert import UPDATE_FIELDS
+
+BATCH_SIZE = 5000
+# Cuántos ids fusionados se listan al final
+MAX_REPORTED_MERGES = 50
+
+
+class Command(BaseCommand):
+    help = (
+        'Llena email_normalized y phone_digits de los leads existentes (recorre la tabla por id) '
+        'y fusiona los leads que repiten email normalizado y tipo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Leads por lote')
+        parser.add_argument('--dry-run', action='store_true', help='Solo contar, sin escribir')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        scanned = updated = 0
+        merged = []
+
+        while True:
+            leads = list(
+                Lead.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'email', 'phone_number', 'lead_type_id', 'email_normalized', 'phone_digits', 'tryet')
+                [:batch_size]
+            )
+            if not leads:
+                break
+            last_id = leads[-1].id
+            scanned += len(leads)
+
+            changed = [lead for lead in leads
+                       if lead.email_normalized != normalize_email(lead.email)
+                       or lead.phone_digits != normalize_phone(lead.phone_number)]
+            changed, duplicates = self.normalize(changed)
+            updated += len(changed)
+            groups = [sorted([owner_id, *(lead.id for lead in leads)]) for owner_id, leads in duplicates.items()]
+            # En cada grupo se queda el lead más antiguo
+            merged.extend(lead_id for ids in groups for lead_id in ids[1:])
+
+            if (changed or groups) and not options['dry_run']:
+                with transaction.atomic():
+                    # Las llaves de `changed` están libres; merge guarda después los leads que se quedan
+                    Lead.objects.bulk_update(changed, ['email_normalized', 'phone_digits'])
+                    for ids in groups:
+                        self.merge(ids)
+
+        prefix = '(dry-run) ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f"✅ {prefix}{updated} de {scanned} leads actualizados"))
+        if merged:
+            ids = ', '.join(str(lead_id) for lead_id in merged[:MAX_REPORTED_MERGES])
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {prefix}{len(merged)} leads duplicados (mismo email normalizado y tipo que otro lead) "
+                f"se fusionaron con él (se queda el más antiguo): {ids}"
+            ))
+
+    def normalize(self, leads):
+        """
+        Calcula las columnas derivadas. Si el email normalizado ya pertenece a otro
+        lead del mismo tipo (p. ej. 'Ana@x.com' y 'ana@x.com', o el lead que
+        existence insertó después del deploy para un lead previo), la llave única
+        no permite asignarlo y los leads se fusionan (ver merge). Regresa (leads a
+        actualizar, {id del lead que tiene la llave: [duplicados]}).
+        """
+        for lead in leads:
+            lead.normalize_lookup_fields()
+
+        owners = {
+            (email, lead_type_id): lead_id
+            for email, lead_type_id, lead_id in
+            Lead.objects.filter(email_normalized__in={lead.email_normalized for lead in leads})
+            .exclude(id__in=[lead.id for lead in leads])
+            .values_list('email_normalized', 'lead_type_id', 'id')
+        }
+
+        kept = []
+        duplicates = defaultdict(list)
+        for lead in leads:
+            key = (lead.email_normalized, lead.lead_type_id)
+            if lead.email_normalized is not None and key in owners:
+                duplicates[owners[key]].append(lead)
+            else:
+                owners[key] = lead.id
+                kept.append(lead)
+        return kept, duplicates
+
+    def merge(self, ids):
+        """
+        Fusiona los leads `ids` en el más antiguo (menor id), que conserva su
+        status, created_at y bitácora; del más reciente toma los datos que
+        existence sobrescribe (UPDATE_FIELDS, si no están vacíos), y suma los
+        tryet. Los demás se borran con delete() y el que se queda se guarda con
+        save(), para que métricas y contadores vean bajas y cambios de tienda.
+        """
+        leads = list(Lead.objects.filter(id__in=ids).order_by('id'))
+        keeper, others = leads[0], leads[1:]
+        if not others:
+            return
+        newest = others[-1]
+        for name in UPDATE_FIELDS:
+            value = getattr(newest, name)
+            if value not in (None, ''):
+                setattr(keeper, name, value)
+        keeper.tryet = sum(lead.tryet or 0 for lead in leads)
+
+        other_ids = [lead.id for lead in others]
+        LeadStatusTransition.objects.filter(lead_id__in=other_ids).update(lead_id=keeper.id)
+        # Primero se libera la llave única que tenga alguno de los borrados
+        Lead.objects.filter(id__in=other_ids).delete()
+        keeper.save()
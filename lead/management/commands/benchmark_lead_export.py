@@ -0,0 +1,112 @@
+import resource
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from lead.models import Lead
+from lead.signals import leads_created, notify_leads_changed
+from lead.views import LeadViewSet
+from lead_type.models import LeadType
+
+BENCH_STORE_ID = 999999
+BATCH_SIZE = 10000
+
+
+def current_rss_mb():
+    """RSS actual en MB (Linux); en otros sistemas usa el máximo histórico"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Mide memoria (RSS) y tiempo de lead/export/ sobre N leads generados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Leads a exportar (default: 1000000)')
+        parser.add_argument('--output', choices=['csv', 'ndjson'], default='csv', help='Formato de exportación')
+        parser.add_argument('--samples', type=int, default=10, help='Mediciones de RSS durante el streaming')
+        parser.add_argument('--keep', action='store_true', help='No borrar los leads generados al terminar')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        bench_leads = Lead.objects.filter(store_id=BENCH_STORE_ID)
+
+        existing = bench_leads.count()
+        if existing < rows:
+            self.generate(rows - existing, offset=existing)
+
+        view = LeadViewSet.as_view({'get': 'export'})
+        request = RequestFactory().get('/lead/export/', {'store_id': BENCH_STORE_ID, 'output': options['output']})
+
+        rss_start = current_rss_mb()
+        started = time.perf_counter()
+        response = view(request)
+
+        every = max(1, rows // options['samples'])
+        total_bytes = 0
+        lines = 0
+        next_sample = every
+        samples = []
+        for chunk in response.streaming_content:
+            total_bytes += len(chunk)
+            lines += chunk.count(b'\n')
+            if lines >= next_sample:
+                samples.append((lines, current_rss_mb()))
+                next_sample += every
+
+        elapsed = time.perf_counter() - started
+        rss_end = current_rss_mb()
+
+        self.stdout.write(f"\n📦 Exportación {options['output']}: {lines} líneas, {total_bytes / 1024 / 1024:.1f} MB en {elapsed:.1f}s")
+        self.stdout.write(f"   RSS inicial: {rss_start:.1f} MB")
+        for line_count, rss in samples:
+            self.stdout.write(f"   {line_count:>10} filas -> RSS {rss:.1f} MB")
+        self.stdout.write(f"   RSS final: {rss_end:.1f} MB (Δ {rss_end - rss_start:+.1f} MB)")
+
+        if not options['keep']:
+            deleted = self.cleanup(bench_leads)
+            self.stdout.write(self.style.SUCCESS(f"✅ Se eliminaron {deleted} leads de benchmark"))
+
+    def generate(self, count, offset):
+        lead_type, _ = LeadType.objects.get_or_create(name='Benchmark exportación')
+        now = timezone.now()
+        self.stdout.write(f"Generando {count} leads de benchmark...")
+
+        for start in range(0, count, BATCH_SIZE):
+            leads = [
+                Lead(
+                    name=f'Lead benchmark {offset + index}',
+                    email=f'bench{offset + index}@export.bench',
+                    phone_number='5512345678',
+                    lead_type=lead_type,
+                    store_id=BENCH_STORE_ID,
+                    products_interest_ids='[1, 3, 5]',
+                    created_at=now,
+                )
+                for index in range(start, min(start + BATCH_SIZE, count))
+            ]
+            # Igual que existence/batch: columnas de búsqueda y métricas al día
+            for lead in leads:
+                lead.normalize_lookup_fields()
+            with transaction.atomic():
+                Lead.objects.bulk_create(leads)
+                leads_created.send(sender=Lead, leads=leads)
+                notify_leads_changed(lead.pk for lead in leads)
+
+    def cleanup(self, bench_leads):
+        """Borra con delete() por lotes para que métricas, contadores e índices descuenten los leads"""
+        deleted = 0
+        while True:
+            ids = list(bench_leads.order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+            if not ids:
+                return deleted
+            with transaction.atomic():
+                _, by_model = Lead.objects.filter(id__in=ids).delete()
+            deleted += by_model.get(Lead._meta.label, 0)
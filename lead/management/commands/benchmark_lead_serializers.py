@@ -0,0 +1,56 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from lead.models import Lead
+from lead.row_serializers import LeadRowSerializer
+from lead.serializers import LeadSerializer
+from lead_search.serializers import LeadSearchRowSerializer, LeadSearchSerializer
+from lead_type.models import LeadType
+
+BENCH_STORE_ID = 999997
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark de filas/segundo: ModelSerializer vs serialización desde .values()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Filas por ronda (default: 1000)')
+        parser.add_argument('--rounds', type=int, default=20, help='Rondas por variante')
+        parser.add_argument('--keep', action='store_true', help='No borrar los leads generados al terminar')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        leads = Lead.objects.filter(store_id=BENCH_STORE_ID).order_by('-created_at', '-id')
+        missing = rows - leads.count()
+        if missing > 0:
+            lead_type, _ = LeadType.objects.get_or_create(name='benchmark serializers')
+            now = timezone.now()
+            Lead.objects.bulk_create([
+                Lead(name=f'Lead {i}', email=f'serializers{i}@enid.com', phone_number='5552967027',
+                     lead_type=lead_type, store_id=BENCH_STORE_ID, products_interest_ids='[1, 2, 3]',
+                     created_at=now)
+                for i in range(missing)
+            ], batch_size=5000)
+
+        row_serializer = LeadRowSerializer()
+        search_serializer = LeadSearchRowSerializer()
+        variants = [
+            ('lista: LeadSerializer', lambda: LeadSerializer(list(leads[:rows]), many=True).data),
+            ('lista: LeadRowSerializer', lambda: row_serializer.serialize(
+                leads.values(*row_serializer.columns())[:rows])),
+            ('búsqueda: LeadSearchSerializer', lambda: LeadSearchSerializer(list(leads[:rows]), many=True).data),
+            ('búsqueda: LeadSearchRowSerializer', lambda: search_serializer.serialize(
+                leads.values(*search_serializer.columns())[:rows])),
+        ]
+
+        self.stdout.write(f"\n⚡ {rows} filas x {options['rounds']} rondas (incluye la consulta)")
+        for name, run in variants:
+            run()
+            started = time.perf_counter()
+            for _ in range(options['rounds']):
+                run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"   {name:<36} {rows * options['rounds'] / elapsed:>12,.0f} filas/s")
+
+        if not options['keep']:
+            leads.delete()
@@ -1,7 +1,41 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from lead_type.models import LeadType
+from lead.lookup import normalize_email, normalize_phone
 import json
 
+# Ids por sentencia en set_status (límite de parámetros de SQLite)
+SET_STATUS_CHUNK = 500
+
+
+class LeadQuerySet(models.QuerySet):
+
+    def set_status(self, status):
+        """
+        Cambia el status de los leads del queryset en bloque, dejando registro en
+        LeadStatusTransition (update() por sí solo no pasa por save() ni signals).
+        Regresa cuántos leads cambiaron.
+        """
+        from lead.signals import leads_status_changed, notify_leads_changed
+
+        if status not in dict(Lead.STATUS_CHOICES):
+            raise ValueError(f'Status inválido: {status!r}')
+
+        changed_at = timezone.now()
+        with transaction.atomic(using=self.db):
+            rows = list(self.exclude(status=status).select_for_update()
+                        .values('id', 'status', 'lead_type_id', 'store_id', 'created_at'))
+            for start in range(0, len(rows), SET_STATUS_CHUNK):
+                ids = [row['id'] for row in rows[start:start + SET_STATUS_CHUNK]]
+                Lead.objects.using(self.db).filter(id__in=ids).update(status=status)
+
+            changes = [dict(row, from_status=row.pop('status'), to_status=status) for row in rows]
+            LeadStatusTransition.record(changes, changed_at)
+            leads_status_changed.send(sender=Lead, changes=changes)
+            notify_leads_changed(change['id'] for change in changes)
+        return len(changes)
+
+
 class Lead(models.Model):
     
     STATUS_CHOICES = (
@@ -21,14 +55,105 @@ class Lead(models.Model):
     products_interest_ids = models.TextField(null=True, blank=True)
     store_id = models.IntegerField(default=1,null=False, blank=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')        
+    # Columnas derivadas para búsquedas exactas / por prefijo y deduplicación (ver lead.lookup)
+    email_normalized = models.CharField(max_length=254, null=True, blank=True, editable=False, db_index=True)
+    phone_digits = models.CharField(max_length=20, null=True, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        constraints = [
+            # Llave del upsert de existence: un lead por email (normalizado) y tipo
+            models.UniqueConstraint(fields=['email_normalized', 'lead_type'],
+                                    name='lead_email_normalized_lead_type_unique'),
+        ]
+        indexes = [
+            # Orden de la paginación por cursor (lista y búsqueda por status)
+            models.Index(fields=['-created_at', '-id'], name='lead_created_id_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='lead_status_created_id_idx'),
+            # Métricas filtradas por tienda: solo se recorre el rango de fechas de esa tienda
+            models.Index(fields=['store_id', 'created_at'], name='lead_store_created_idx'),
+        ]
+
+    objects = LeadQuerySet.as_manager()
+
+    # Valores tal como se leyeron de la base, para comparar en post_save / post_delete
+    TRACKED_FIELDS = ('status', 'created_at', 'lead_type_id', 'store_id')
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.TRACKED_FIELDS and value is not models.DEFERRED
+        }
+        return instance
+
+    def loaded_value(self, name):
+        """Valor de `name` al leerse de la base (o del último save); None si se desconoce"""
+        return getattr(self, '_loaded_values', {}).get(name)
+
+    def save(self, *args, **kwargs):
+        self.normalize_lookup_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'email' in update_fields:
+                update_fields.add('email_normalized')
+            if 'phone_number' in update_fields:
+                update_fields.add('phone_digits')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        # Los receptores de post_save ya compararon contra los valores anteriores
+        self._loaded_values = {name: self.__dict__[name] for name in self.TRACKED_FIELDS if name in self.__dict__}
+
+    def normalize_lookup_fields(self):
+        """Recalcula las columnas derivadas; bulk_create/bulk_update deben llamarlo explícitamente"""
+        self.email_normalized = normalize_email(self.email)
+        self.phone_digits = normalize_phone(self.phone_number)
+
     def set_products_interest_ids(self, ids):
         self.products_interest_ids = json.dumps(ids)
     
     def get_products_interest_ids(self):
         if self.products_interest_ids:
             return json.loads(self.products_interest_ids)
-        return []
\ No newline at end of file
+        return []
+
+
+class LeadStatusTransition(models.Model):
+    """
+    Bitácora (solo inserciones) de cambios de status de un lead. Guarda el tipo,
+    la tienda y los segundos desde la creación del lead para que las métricas
+    de velocidad no necesiten JOIN con lead.
+    """
+    lead = models.ForeignKey(Lead, related_name='status_transitions', on_delete=models.CASCADE, db_index=False)
+    lead_type = models.ForeignKey(LeadType, related_name='+', on_delete=models.CASCADE, db_index=False)
+    store_id = models.IntegerField(default=1)
+    from_status = models.CharField(max_length=20, choices=Lead.STATUS_CHOICES, null=True, blank=True)
+    to_status = models.CharField(max_length=20, choices=Lead.STATUS_CHOICES)
+    changed_at = models.DateTimeField(default=timezone.now)
+    seconds_since_created = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['lead', 'changed_at'], name='lead_transition_lead_idx'),
+            models.Index(fields=['to_status', 'changed_at'], name='lead_transition_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.lead_id}: {self.from_status} -> {self.to_status}'
+
+    @classmethod
+    def record(cls, changes, changed_at=None):
+        """changes: dicts con id, lead_type_id, store_id, created_at, from_status y to_status"""
+        changed_at = changed_at or timezone.now()
+        return cls.objects.bulk_create([
+            cls(lead_id=change['id'], lead_type_id=change['lead_type_id'], store_id=change['store_id'],
+                from_status=change['from_status'],
+                to_status=change['to_status'], changed_at=changed_at,
+                seconds_since_created=max(0, int((changed_at - change['created_at']).total_seconds())))
+            for change in changes
+        ], batch_size=1000)
+
@@ -0,0 +1,121 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por cursor (keyset) ordenada por (-created_at, -id).
+
+    El cursor es opaco: codifica los valores de orden de la última fila entregada
+    y la siguiente página se obtiene con un WHERE sobre esos valores, así que una
+    página profunda cuesta lo mismo que la primera.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 30
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_position = None
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_position = [self.row_value(rows[-1], field) for field in self.fields]
+        return rows
+
+    def get_paginated_response(self, data, **envelope):
+        # envelope: datos comunes a todas las filas (p. ej. status_choices), una sola vez
+        return Response({
+            'next': self.get_next_link(),
+            **envelope,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    @property
+    def fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def position_filter(self, position):
+        """(a < x) OR (a = x AND b < y) ... respetando la dirección de cada campo"""
+        condition = Q()
+        for index, ordering in enumerate(self.ordering):
+            lookup = 'lt' if ordering.startswith('-') else 'gt'
+            branch = {field: value for field, value in zip(self.fields[:index], position)}
+            branch[f'{self.fields[index]}__{lookup}'] = position[index]
+            condition |= Q(**branch)
+        return condition
+
+    def row_value(self, row, field):
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    def encode_cursor(self, position):
+        values = []
+        for value in position:
+            if isinstance(value, (datetime.datetime, datetime.date)):
+                value = value.isoformat()
+            elif isinstance(value, decimal.Decimal):
+                value = str(value)
+            values.append(value)
+        payload = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            values = json.loads(payload)
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [self.output_field(queryset, field).to_python(value)
+                    for field, value in zip(self.fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+
+    def output_field(self, queryset, field):
+        if field in queryset.query.annotations:
+            return queryset.query.annotations[field].output_field
+        return queryset.model._meta.get_field(field)
@@ -0,0 +1,80 @@
+import json
+from operator import itemgetter
+from rest_framework import serializers
+from lead.models import Lead
+
+# Se envían una vez por respuesta (en el sobre) y no en cada fila
+STATUS_CHOICES = [{'value': value, 'label': label} for value, label in Lead.STATUS_CHOICES]
+STATUS_LABELS = dict(Lead.STATUS_CHOICES)
+
+_datetime_field = serializers.DateTimeField()
+
+
+class LeadRowSerializer:
+    """
+    Serializador de filas de .values() a dicts, para listas largas de leads.
+
+    Hace el mismo trabajo que un ModelSerializer pero sin instanciar modelos
+    ni campos por fila: `fields` declara nombre -> columnas que necesita, y
+    los campos calculados se implementan como get_<nombre>(row), igual que un
+    SerializerMethodField. Acepta un subconjunto de campos (?fields=).
+    """
+    fields = {
+        'id': ('id',),
+        'name': ('name',),
+        'email': ('email',),
+        'phone_number': ('phone_number',),
+        'lead_type': ('lead_type_id',),
+        'created_at': ('created_at',),
+        'status': ('status',),
+        'status_display': ('status',),
+        'products_interest': ('products_interest_ids',),
+        'tryet': ('tryet',),
+    }
+
+    def __init__(self, fields=None):
+        names = self.parse_fields(fields)
+        self.names = names
+        self.getters = [(name, self.getter(name)) for name in names]
+
+    @classmethod
+    def parse_fields(cls, fields):
+        """?fields=a,b,c -> lista validada (todos si viene vacío)"""
+        if not fields:
+            return list(cls.fields)
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in names if name not in cls.fields]
+        if unknown or not names:
+            raise serializers.ValidationError({
+                'fields': f"Campos desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(cls.fields)}"
+            })
+        return list(dict.fromkeys(names))
+
+    def getter(self, name):
+        method = getattr(self, f'get_{name}', None)
+        if method is not None:
+            return method
+        return itemgetter(self.fields[name][0])
+
+    def columns(self, *extra):
+        """Columnas para .values(): las de los campos pedidos más las de `extra` (p. ej. orden)"""
+        columns = dict.fromkeys(extra)
+        for name in self.names:
+            columns.update(dict.fromkeys(self.fields[name]))
+        return list(columns)
+
+    def to_representation(self, row):
+        return {name: getter(row) for name, getter in self.getters}
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+    def get_created_at(self, row):
+        return _datetime_field.to_representation(row['created_at'])
+
+    def get_status_display(self, row):
+        return STATUS_LABELS.get(row['status'], row['status'])
+
+    def get_products_interest(self, row):
+        value = row['products_interest_ids']
+        return json.loads(value) if value else []
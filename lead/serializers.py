@@ -1,8 +1,12 @@
 from rest_framework import serializers
 from lead.models import Lead
+from lead.row_serializers import STATUS_CHOICES
+from lead_type.registry import lead_types
+from lead_type.serializers import LeadTypeRegistryField
 import json
 
 class LeadSerializer(serializers.ModelSerializer):
+    lead_type = LeadTypeRegistryField()
     products_interest = serializers.SerializerMethodField()
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     status_choices = serializers.SerializerMethodField()
@@ -11,7 +15,8 @@ class LeadSerializer(serializers.ModelSerializer):
         model = Lead
         fields = ['id', 'name', 'email', 'phone_number', 'lead_type', 'created_at', 
                  'status', 'status_display', 'status_choices', 'products_interest', 
-                 'products_interest_ids']
+                 'products_interest_ids', 'tryet']
+        read_only_fields = ['tryet']
         extra_kwargs = {
             'products_interest_ids': {'write_only': True}
         }
@@ -22,23 +27,28 @@ class LeadSerializer(serializers.ModelSerializer):
         return []
 
     def get_status_choices(self, obj):
-        return [
-            {'value': status[0], 'label': status[1]} 
-            for status in Lead.STATUS_CHOICES
-        ]
+        return STATUS_CHOICES
 
 class LeadSearchSerializer(serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     status_choices = serializers.SerializerMethodField()
-    lead_type_name = serializers.CharField(source='lead_type.name', read_only=True)
+    lead_type_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Lead
         fields = ['id', 'name', 'email', 'phone_number', 'lead_type', 'lead_type_name', 
                  'created_at', 'status', 'status_display', 'status_choices']
 
+    def get_lead_type_name(self, obj):
+        return lead_types.name(obj.lead_type_id)
+
     def get_status_choices(self, obj):
-        return [
-            {'value': status[0], 'label': status[1]} 
-            for status in Lead.STATUS_CHOICES
-        ]
+        return STATUS_CHOICES
+
+class LeadBatchItemSerializer(serializers.Serializer):
+    """Validación ligera de cada lead en existence/batch (el tipo se resuelve en bloque)"""
+    name = serializers.CharField(max_length=100)
+    email = serializers.EmailField()
+    phone_number = serializers.CharField(max_length=20, required=False, allow_null=True, allow_blank=True)
+    lead_type = serializers.IntegerField()
+    products_interest = serializers.ListField(required=False)
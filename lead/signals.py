@@ -0,0 +1,68 @@
+import logging
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from lead.models import Lead, LeadStatusTransition
+from lead.version import bump_leads_version
+
+# Se envía (después del commit) con ids=[...] por cualquier escritura de leads,
+# incluidas las que no pasan por save(): el upsert de existence y existence/batch.
+leads_changed = Signal()
+
+# Se envía dentro de la transacción con leads=[...] por las altas que no pasan por
+# save() (upsert de existence y bulk_create de existence/batch).
+leads_created = Signal()
+
+# Se envía dentro de la transacción con moves=[{id, created_at, status, lead_type_id,
+# from_store_id, to_store_id}] por los cambios de tienda que no pasan por save()
+# (upsert de existence y bulk_update de existence/batch).
+leads_moved = Signal()
+
+# Se envía dentro de la transacción con changes=[{id, lead_type_id, store_id,
+# created_at, from_status, to_status}] por cada cambio de status (save() o set_status()).
+leads_status_changed = Signal()
+
+logger = logging.getLogger(__name__)
+
+
+def notify_leads_changed(ids):
+    ids = list(ids)
+    if ids:
+        # La versión cambia al escribir y otra vez al confirmar: una lectura concurrente
+        # que guardó datos previos al commit con la versión intermedia queda descartada.
+        bump_leads_version()
+        transaction.on_commit(lambda: send_leads_changed(ids))
+
+
+def send_leads_changed(ids):
+    # La escritura ya está confirmada: un receptor (índices, caches) que falla no debe
+    # convertirla en error ni provocar que quien llamó la reintente.
+    for receiver, response in leads_changed.send_robust(sender=Lead, ids=ids):
+        if isinstance(response, Exception):
+            logger.error('leads_changed: %r falló', receiver, exc_info=response)
+
+
+@receiver(post_save, sender=Lead)
+@receiver(post_delete, sender=Lead)
+def lead_saved_or_deleted(sender, instance, **kwargs):
+    notify_leads_changed([instance.pk])
+
+
+@receiver(post_save, sender=Lead)
+def log_status_change(sender, instance, created, raw=False, **kwargs):
+    # Admin, API y cualquier save(): se compara contra el status con que se leyó el lead
+    from_status = instance.loaded_value('status')
+    if created or raw or from_status is None or from_status == instance.status:
+        return
+    change = {
+        'id': instance.pk, 'lead_type_id': instance.lead_type_id, 'store_id': instance.store_id,
+        'created_at': instance.created_at,
+        'from_status': from_status, 'to_status': instance.status,
+    }
+    LeadStatusTransition.record([change])
+    leads_status_changed.send(sender=Lead, changes=[change])
+
+
+@receiver(leads_changed)
+def leads_changed_bump_version(sender, **kwargs):
+    bump_leads_version()
@@ -1,9 +1,25 @@
-from django.test import TestCase
-from rest_framework.test import APIClient
-from lead.models import Lead
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient, APIRequestFactory
+from lead.models import Lead, LeadStatusTransition
+from django.contrib.auth.models import User
 from lead_type.models import LeadType
 from faker import Faker
 from django.urls import reverse
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from lead.upsert import upsert_lead, _upsert_fallback
+from lead.lookup import normalize_email, normalize_phone
+from django.core.management import call_command
+from io import StringIO
+from lead.pagination import KeysetPagination
+from lead.row_serializers import STATUS_CHOICES, LeadRowSerializer
+from lead.serializers import LeadSerializer
+from lead.views import LeadViewSet
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.utils import timezone
+from unittest import mock
+import json
 
 class TestsLeadViewSet(TestCase):
     def setUp(self):
@@ -99,4 +115,561 @@ class TestsLeadViewSet(TestCase):
         
         self.assertEqual(response.data["tryet"], 2)
         self.assertEqual(response.status_code, 200)        
-        self.assertEqual(response.data["phone_number"], "5552967027")
\ No newline at end of file
+        self.assertEqual(response.data["phone_number"], "5552967027")
+
+
+class TestsLeadExistenceBatch(TestCase):
+    def setUp(self):
+        self.fake = Faker('es_MX')
+        self.client = APIClient()
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.other_type = LeadType.objects.create(name="Al registrar orden")
+        self.api_batch = reverse('lead-existence-batch')
+        self.headers = {'HTTP_X_STORE_ID': 1}
+
+    def build_lead(self, **kwargs):
+        data = {
+            'name': self.fake.name(),
+            'email': self.fake.unique.email(),
+            'phone_number': '5552967027',
+            'lead_type': self.lead_type.id,
+        }
+        data.update(kwargs)
+        return data
+
+    def test_success_batch_create_and_tryet(self):
+
+        existing = Lead.objects.create(
+            name='existente', email='existente@enid.com', lead_type=self.lead_type, store_id=1)
+
+        leads = [
+            self.build_lead(),
+            self.build_lead(email=existing.email),
+            self.build_lead(email=existing.email, lead_type=self.other_type.id),
+        ]
+        response = self.client.post(self.api_batch, leads, format='json', **self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 200, 201])
+        self.assertEqual(Lead.objects.count(), 3)
+        self.assertEqual(Lead.objects.filter(email=existing.email).count(), 2)
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.tryet, 2)
+        self.assertEqual(existing.phone_number, '5552967027')
+
+    def test_success_batch_repeated_email_in_same_request(self):
+
+        lead = self.build_lead()
+        response = self.client.post(
+            self.api_batch, {'leads': [lead, lead, lead]}, format='json', **self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Lead.objects.count(), 1)
+        self.assertEqual(Lead.objects.get().tryet, 3)
+
+    def test_success_batch_reports_invalid_items(self):
+
+        leads = [
+            self.build_lead(),
+            {'name': 'sin email', 'lead_type': self.lead_type.id},
+            self.build_lead(lead_type=999999),
+        ]
+        response = self.client.post(self.api_batch, leads, format='json', **self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['errors'], 2)
+        self.assertIn('email', response.data['results'][1]['errors'])
+        self.assertIn('lead_type', response.data['results'][2]['errors'])
+        self.assertEqual(Lead.objects.count(), 1)
+
+    def test_success_batch_handler_response_400s(self):
+
+        response = self.client.post(self.api_batch, [self.build_lead()], format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(self.api_batch, [], format='json', **self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_queries_do_not_grow_with_batch_size(self):
+
+        def count_queries(size):
+            leads = [self.build_lead() for _ in range(size)]
+            with CaptureQueriesContext(connection) as context:
+                self.client.post(self.api_batch, leads, format='json', **self.headers)
+            return len(context.captured_queries)
+
+        count_queries(1)
+        self.assertEqual(count_queries(5), count_queries(50))
+
+
+
+class TestsLeadAtomicUpsert(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.api_existence = reverse('lead-existence')
+        self.headers = {'HTTP_X_STORE_ID': 1}
+        self.data = {
+            'email': 'jmedrano@9006.com',
+            'lead_type': self.lead_type.id,
+            'name': 'jonathan Medrano',
+            'phone_number': '5552967027',
+        }
+
+    def test_success_existence_is_single_statement(self):
+
+        self.client.post(self.api_existence, self.data, format='json', **self.headers)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.api_existence, self.data, format='json', **self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tryet'], 2)
+        writes = [q for q in context.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(writes), 1)
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in context.captured_queries))
+
+    def test_success_existence_new_type_creates_lead(self):
+
+        other_type = LeadType.objects.create(name="other type")
+        self.client.post(self.api_existence, self.data, format='json', **self.headers)
+
+        response = self.client.post(
+            self.api_existence, {**self.data, 'lead_type': other_type.id}, format='json', **self.headers)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['tryet'], 1)
+        self.assertEqual(Lead.objects.filter(email=self.data['email']).count(), 2)
+
+    def test_success_fallback_increments_tryet(self):
+
+        values = {
+            'email': self.data['email'], 'lead_type_id': self.lead_type.id, 'name': 'a',
+            'phone_number': None, 'store_id': 1, 'products_interest_ids': '[]',
+        }
+        self.assertEqual(_upsert_fallback(values)[0].tryet, 1)
+        lead, created, previous_store_id = _upsert_fallback({**values, 'name': 'b', 'store_id': 2})
+        self.assertEqual((lead.tryet, created, previous_store_id), (2, False, 1))
+
+        lead = Lead.objects.get()
+        self.assertEqual(lead.name, 'b')
+        self.assertEqual(lead.tryet, 2)
+
+    def test_success_created_flag_does_not_depend_on_tryet(self):
+
+        lead = Lead.objects.create(name='a', email=self.data['email'], lead_type=self.lead_type)
+        # Filas previas al upsert pueden tener tryet en 0 (o reiniciado)
+        Lead.objects.filter(id=lead.id).update(tryet=0)
+
+        response = self.client.post(self.api_existence, self.data, format='json', **self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['id'], response.data['tryet']), (lead.id, 1))
+        self.assertEqual(Lead.objects.count(), 1)
+
+    @override_settings(LEAD_ATOMIC_UPSERT=False)
+    def test_success_fallback_email_with_several_types(self):
+
+        other_type = LeadType.objects.create(name="other type")
+        Lead.objects.create(name='a', email=self.data['email'], lead_type=self.lead_type)
+        Lead.objects.create(name='b', email=self.data['email'], lead_type=other_type)
+
+        response = self.client.post(self.api_existence, self.data, format='json', **self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tryet'], 2)
+        self.assertEqual(Lead.objects.count(), 2)
+
+
+class TestsLeadLookupFields(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.api_existence = reverse('lead-existence')
+        self.api_batch = reverse('lead-existence-batch')
+        self.headers = {'HTTP_X_STORE_ID': 1}
+        self.data = {
+            'email': 'JMedrano@9006.com',
+            'lead_type': self.lead_type.id,
+            'name': 'jonathan Medrano',
+            'phone_number': '+52 (55) 5296-7027',
+        }
+
+    def test_success_normalize(self):
+
+        self.assertEqual(normalize_email('  JMedrano@9006.COM '), 'jmedrano@9006.com')
+        self.assertEqual(normalize_phone('+52 55 5296 7027'), '5552967027')
+        self.assertEqual(normalize_phone('+52 1 55 5296 7027'), '5552967027')
+        self.assertEqual(normalize_phone('5552967027'), '5552967027')
+        self.assertEqual(normalize_phone('12-34'), '1234')
+        self.assertIsNone(normalize_phone('sin número'))
+        self.assertIsNone(normalize_phone(None))
+
+    def test_success_save_populates_lookup_fields(self):
+
+        lead = Lead.objects.create(name='a', email='A@Enid.com', phone_number='55 1234 5678',
+                                   lead_type=self.lead_type)
+        self.assertEqual((lead.email_normalized, lead.phone_digits), ('a@enid.com', '5512345678'))
+
+        lead.phone_number = '(55) 8765-4321'
+        lead.save(update_fields=['phone_number'])
+        lead.refresh_from_db()
+        self.assertEqual(lead.phone_digits, '5587654321')
+
+    def test_success_existence_dedupes_by_normalized_email(self):
+
+        first = self.client.post(self.api_existence, self.data, format='json', **self.headers)
+        second = self.client.post(
+            self.api_existence, {**self.data, 'email': 'jmedrano@9006.COM'}, format='json', **self.headers)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['tryet'], 2)
+        lead = Lead.objects.get()
+        self.assertEqual((lead.email_normalized, lead.phone_digits), ('jmedrano@9006.com', '5552967027'))
+
+    @override_settings(LEAD_ATOMIC_UPSERT=False)
+    def test_success_existence_fallback_dedupes_by_normalized_email(self):
+
+        self.client.post(self.api_existence, self.data, format='json', **self.headers)
+        response = self.client.post(
+            self.api_existence, {**self.data, 'email': 'jmedrano@9006.com'}, format='json', **self.headers)
+
+        self.assertEqual(response.data['tryet'], 2)
+        self.assertEqual(Lead.objects.count(), 1)
+
+    def test_success_batch_dedupes_by_normalized_email(self):
+
+        Lead.objects.create(name='a', email='jmedrano@9006.com', lead_type=self.lead_type)
+        response = self.client.post(self.api_batch, [
+            self.data, {**self.data, 'email': 'JMEDRANO@9006.com'},
+        ], format='json', **self.headers)
+
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(response.data['updated'], 2)
+        lead = Lead.objects.get()
+        self.assertEqual(lead.tryet, 3)
+        self.assertEqual(lead.phone_digits, '5552967027')
+
+    def test_success_backfill_command(self):
+
+        lead = Lead.objects.create(name='a', email='Ana@Enid.com', phone_number='55-1234-5678',
+                                   lead_type=self.lead_type)
+        duplicate = Lead.objects.create(name='b', email='otra@enid.com', lead_type=self.lead_type)
+        # Filas previas a las columnas derivadas (o escritas con update())
+        Lead.objects.filter(id=lead.id).update(email_normalized=None, phone_digits=None)
+        Lead.objects.filter(id=duplicate.id).update(email='ANA@enid.com', email_normalized=None)
+
+        out = StringIO()
+        call_command('backfill_lead_lookup_fields', batch_size=1, stdout=out)
+
+        lead.refresh_from_db()
+        self.assertEqual((lead.email_normalized, lead.phone_digits), ('ana@enid.com', '5512345678'))
+        # El duplicado se fusiona en el lead que ya tiene la llave (tryet y bitácora de status)
+        self.assertFalse(Lead.objects.filter(id=duplicate.id).exists())
+        self.assertEqual(lead.tryet, 2)
+        self.assertIn('1 leads duplicados', out.getvalue())
+
+    def test_success_backfill_command_moves_transitions_of_duplicates(self):
+
+        lead = Lead.objects.create(name='a', email='ana@enid.com', lead_type=self.lead_type)
+        duplicate = Lead.objects.create(name='b', email='otra@enid.com', lead_type=self.lead_type)
+        duplicate.status = 'contacted'
+        duplicate.save()
+        Lead.objects.filter(id=duplicate.id).update(email=' Ana@enid.com', email_normalized=None, tryet=3)
+
+        call_command('backfill_lead_lookup_fields', stdout=StringIO())
+
+        self.assertEqual(list(Lead.objects.values_list('id', 'tryet')), [(lead.id, 4)])
+        self.assertEqual(LeadStatusTransition.objects.get().lead_id, lead.id)
+
+    def test_success_backfill_keeps_legacy_lead_over_post_deploy_insert(self):
+
+        legacy = Lead.objects.create(name='antes', email='jmedrano@9006.com', lead_type=self.lead_type,
+                                     store_id=5, products_interest_ids='[1]')
+        legacy.status = 'converted'
+        legacy.save()
+        # Fila previa al deploy: sin email_normalized, existence no la encuentra e inserta otra
+        Lead.objects.filter(id=legacy.id).update(email_normalized=None, phone_digits=None)
+        response = self.client.post(self.api_existence, self.data, format='json', HTTP_X_STORE_ID=7)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Lead.objects.count(), 2)
+
+        out = StringIO()
+        call_command('backfill_lead_lookup_fields', stdout=out)
+
+        lead = Lead.objects.get()
+        self.assertEqual(lead.id, legacy.id)
+        self.assertEqual((lead.status, lead.created_at, lead.tryet), ('converted', legacy.created_at, 2))
+        # Datos de la última llamada a existence
+        self.assertEqual((lead.name, lead.store_id, lead.phone_digits, lead.email_normalized),
+                         ('jonathan Medrano', 7, '5552967027', 'jmedrano@9006.com'))
+        self.assertEqual(LeadStatusTransition.objects.get().lead_id, legacy.id)
+        self.assertIn('1 leads duplicados', out.getvalue())
+
+        # Ya con la llave, existence actualiza el lead original
+        self.client.post(self.api_existence, self.data, format='json', **self.headers)
+        self.assertEqual(list(Lead.objects.values_list('id', 'tryet')), [(legacy.id, 3)])
+
+
+class TestsLeadAtomicUpsertConcurrency(TransactionTestCase):
+
+    def test_parallel_identical_requests_keep_every_tryet(self):
+
+        lead_type = LeadType.objects.create(name="En intento de compra")
+        values = {
+            'email': 'paralelo@enid.com', 'lead_type_id': lead_type.id, 'name': 'paralelo',
+            'phone_number': '5552967027', 'store_id': 1, 'products_interest_ids': '[]',
+        }
+        requests = 20
+
+        def call(_):
+            try:
+                while True:
+                    try:
+                        return upsert_lead(**values)[1]
+                    except OperationalError:
+                        # SQLite en memoria (cache compartido) rechaza escrituras simultáneas
+                        # en lugar de esperar; la sentencia no se aplicó y se reintenta.
+                        if connection.vendor != 'sqlite':
+                            raise
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            created = list(executor.map(call, range(requests)))
+
+        self.assertEqual(created.count(True), 1)
+        self.assertEqual(Lead.objects.get(email=values['email']).tryet, requests)
+
+    def test_parallel_batches_keep_every_tryet(self):
+
+        lead_type = LeadType.objects.create(name="En intento de compra")
+        Lead.objects.create(name='previo', email='previo@enid.com', lead_type=lead_type, store_id=1)
+        leads = [{'name': 'lote', 'email': email, 'phone_number': '5552967027', 'lead_type': lead_type.id}
+                 for email in ('previo@enid.com', 'nuevo@enid.com', 'otro@enid.com')]
+        requests = 20
+        # La vista directo (sin el cliente de pruebas, que recibe las excepciones de todos los hilos)
+        view = LeadViewSet.as_view({'post': 'existence_batch'})
+
+        def call(_):
+            try:
+                while True:
+                    try:
+                        request = APIRequestFactory().post(reverse('lead-existence-batch'), leads, format='json',
+                                                           HTTP_X_STORE_ID=1)
+                        return [result['status'] for result in view(request).data['results']]
+                    except OperationalError:
+                        # Igual que arriba: SQLite en memoria rechaza escrituras simultáneas
+                        if connection.vendor != 'sqlite':
+                            raise
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(call, range(requests)))
+
+        # Cada llave nueva se crea una sola vez y ninguna petición pierde su tryet
+        self.assertEqual(sum(item.count(201) for item in statuses), 2)
+        self.assertEqual(dict(Lead.objects.values_list('email', 'tryet')),
+                         {'previo@enid.com': requests + 1, 'nuevo@enid.com': requests,
+                          'otro@enid.com': requests})
+
+
+
+class TestsLeadCursorPagination(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.api_list = reverse('lead-list')
+        created_at = timezone.now()
+        for index in range(7):
+            lead = Lead.objects.create(
+                name=f'lead {index}', email=f'lead{index}@enid.com', lead_type=self.lead_type)
+            # Varios leads con el mismo created_at: el desempate es por id
+            Lead.objects.filter(pk=lead.pk).update(created_at=created_at - timedelta(minutes=index // 2))
+
+    def test_success_walk_all_pages(self):
+
+        seen = []
+        response = self.client.get(self.api_list, {'limit': 3})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(lead['id'] for lead in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        expected = list(Lead.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_success_max_page_size(self):
+
+        with mock.patch.object(KeysetPagination, 'max_page_size', 4):
+            response = self.client.get(self.api_list, {'limit': 1000})
+
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_success_deep_page_is_a_single_query(self):
+
+        response = self.client.get(self.api_list, {'limit': 2})
+        response = self.client.get(response.data['next'])
+
+        with self.assertNumQueries(1):
+            self.client.get(response.data['next'])
+
+
+
+class TestsLeadRowSerializer(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.api_list = reverse('lead-list')
+        self.lead = Lead.objects.create(
+            name='Jonathan Medrano', email='jmedrano@9006.com', phone_number='5552967027',
+            lead_type=self.lead_type, products_interest_ids='[1, 2]', status='contacted')
+        Lead.objects.create(name='Otro', email='otro@enid.com', lead_type=self.lead_type)
+
+    def test_success_same_output_as_model_serializer(self):
+
+        response = self.client.get(self.api_list)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status_choices'], STATUS_CHOICES)
+        for row in response.data['results']:
+            expected = dict(LeadSerializer(Lead.objects.get(id=row['id'])).data)
+            expected.pop('status_choices')
+            self.assertEqual(row, expected)
+
+    def test_success_sparse_fields(self):
+
+        response = self.client.get(self.api_list, {'fields': 'id,status_display,products_interest'})
+
+        self.assertEqual(response.data['results'][-1], {
+            'id': self.lead.id, 'status_display': 'Contactado', 'products_interest': [1, 2]})
+
+        # El cursor funciona aunque las columnas de orden no se pidan
+        page = self.client.get(self.api_list, {'fields': 'name', 'limit': 1})
+        self.assertEqual(page.data['results'], [{'name': 'Otro'}])
+        self.assertEqual(self.client.get(page.data['next']).data['results'], [{'name': 'Jonathan Medrano'}])
+
+    def test_error_unknown_fields(self):
+
+        response = self.client.get(self.api_list, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', str(response.data['fields']))
+
+    def test_success_columns_include_ordering(self):
+
+        serializer = LeadRowSerializer('status_display')
+        self.assertEqual(serializer.columns('created_at', 'id'), ['created_at', 'id', 'status'])
+
+
+class TestsLeadStatusTransitions(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.leads = [
+            Lead.objects.create(name=f'lead {i}', email=f'lead{i}@enid.com', lead_type=self.lead_type)
+            for i in range(3)
+        ]
+        Lead.objects.filter(id=self.leads[0].id).update(created_at=timezone.now() - timedelta(hours=2))
+
+    def test_success_api_update_logs_transition(self):
+
+        lead = self.leads[0]
+        response = self.client.patch(reverse('lead-detail', args=[lead.id]), {'status': 'contacted'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.patch(reverse('lead-detail', args=[lead.id]), {'name': 'sin cambio de status'}, format='json')
+
+        transition = LeadStatusTransition.objects.get()
+        self.assertEqual((transition.lead_id, transition.lead_type_id, transition.from_status, transition.to_status),
+                         (lead.id, self.lead_type.id, 'pending', 'contacted'))
+        self.assertAlmostEqual(transition.seconds_since_created, 7200, delta=60)
+
+    def test_success_repeated_saves_log_each_change(self):
+
+        lead = Lead.objects.get(id=self.leads[1].id)
+        for value in ('contacted', 'contacted', 'converted'):
+            lead.status = value
+            lead.save()
+
+        self.assertEqual(list(LeadStatusTransition.objects.order_by('id').values_list('from_status', 'to_status')),
+                         [('pending', 'contacted'), ('contacted', 'converted')])
+
+    def test_success_bulk_set_status(self):
+
+        self.leads[2].status = 'converted'
+        self.leads[2].save()
+
+        changed = Lead.objects.filter(id__in=[lead.id for lead in self.leads]).set_status('converted')
+
+        self.assertEqual(changed, 2)
+        self.assertEqual(Lead.objects.filter(status='converted').count(), 3)
+        self.assertEqual(LeadStatusTransition.objects.filter(from_status='pending', to_status='converted').count(), 3)
+        with self.assertRaises(ValueError):
+            Lead.objects.all().set_status('perdido')
+
+    def test_success_admin_action_logs_transitions(self):
+
+        admin = User.objects.create_superuser('admin', 'admin@enid.com', 'password')
+        self.client.force_login(admin)
+
+        response = self.client.post(reverse('admin:lead_lead_changelist'), {
+            'action': 'set_status_contacted', '_selected_action': [self.leads[0].id, self.leads[1].id],
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(LeadStatusTransition.objects.filter(to_status='contacted').count(), 2)
+
+
+class TestsLeadExport(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.other_type = LeadType.objects.create(name="Al registrar orden")
+        self.api_export = reverse('lead-export')
+        Lead.objects.create(name='uno', email='uno@enid.com', lead_type=self.lead_type, store_id=1)
+        Lead.objects.create(name='dos', email='dos@enid.com', lead_type=self.other_type, store_id=1,
+                            status='converted')
+        Lead.objects.create(name='tres', email='tres@enid.com', lead_type=self.lead_type, store_id=2)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_success_export_csv(self):
+
+        response = self.client.get(self.api_export, {'store_id': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = self.read(response).splitlines()
+        self.assertTrue(lines[0].startswith('id,name,email'))
+        self.assertEqual(len(lines), 3)
+
+    def test_success_export_ndjson_with_filters(self):
+
+        response = self.client.get(self.api_export, {
+            'output': 'ndjson',
+            'status': 'converted',
+            'lead_type': self.other_type.id,
+            'created_from': (timezone.now() - timedelta(days=1)).date().isoformat(),
+            'created_to': timezone.now().date().isoformat(),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['dos'])
+
+    def test_success_export_handler_response_400s(self):
+
+        response = self.client.get(self.api_export, {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(self.api_export, {'created_from': 'ayer'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,119 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from lead.lookup import normalize_email, normalize_phone
+from lead.models import Lead
+from lead.signals import leads_created, leads_moved, notify_leads_changed
+
+# Columnas que se sobrescriben cuando el lead ya existe
+UPDATE_FIELDS = ['name', 'phone_number', 'phone_digits', 'store_id', 'products_interest_ids']
+INSERT_FIELDS = ['name', 'email', 'email_normalized', 'phone_number', 'phone_digits', 'lead_type', 'store_id',
+                 'products_interest_ids', 'created_at', 'tryet', 'status']
+
+
+def upsert_lead(**values):
+    """
+    Inserta un lead o, si ya existe para (email normalizado, lead_type),
+    actualiza sus datos e incrementa tryet del lado de la base de datos.
+
+    Regresa (lead, created). created viene de la base (xmax = 0 en
+    PostgreSQL), no de tryet: filas previas pueden tener cualquier tryet.
+    """
+    with transaction.atomic():
+        if connection.features.can_return_columns_from_insert:
+            lead, created, previous_store_id = _upsert_returning(values)
+            # El INSERT crudo no pasa por post_save (el fallback usa create(), que sí)
+            if created:
+                leads_created.send(sender=Lead, leads=[lead])
+        else:
+            lead, created, previous_store_id = _upsert_fallback(values)
+        # El UPDATE tampoco pasa por save(): un cambio de tienda se avisa aparte para las métricas
+        if not created and previous_store_id is not None and previous_store_id != lead.store_id:
+            leads_moved.send(sender=Lead, moves=[{
+                'id': lead.pk, 'created_at': lead.created_at, 'status': lead.status,
+                'lead_type_id': lead.lead_type_id, 'from_store_id': previous_store_id, 'to_store_id': lead.store_id,
+            }])
+        notify_leads_changed([lead.pk])
+    return lead, created
+
+
+def _with_lookup_fields(values):
+    return dict(values, email_normalized=normalize_email(values['email']),
+                phone_digits=normalize_phone(values.get('phone_number')))
+
+
+def _lookup(values):
+    return {'email_normalized': values['email_normalized'], 'lead_type_id': values['lead_type_id']}
+
+
+def _upsert_returning(values):
+    """
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING en una sola sentencia
+    (PostgreSQL / SQLite >= 3.35). Regresa (lead, created, store_id previo).
+    """
+    values = _with_lookup_fields(values)
+    qn = connection.ops.quote_name
+    opts = Lead._meta
+    table = qn(opts.db_table)
+
+    row = dict(values, created_at=timezone.now(), tryet=1, status='pending')
+    fields = [opts.get_field(name) for name in INSERT_FIELDS]
+    params = [field.get_db_prep_save(row[field.attname], connection) for field in fields]
+
+    assignments = [f'{qn(opts.get_field(name).column)} = EXCLUDED.{qn(opts.get_field(name).column)}'
+                   for name in UPDATE_FIELDS]
+    tryet = qn(opts.get_field('tryet').column)
+    assignments.append(f'{tryet} = {table}.{tryet} + 1')
+
+    email_column = qn(opts.get_field('email_normalized').column)
+    type_column = qn(opts.get_field('lead_type').column)
+    store_column = qn(opts.get_field('store_id').column)
+    returning = [qn(field.column) for field in opts.concrete_fields]
+    prefix = ''
+    previous_store_id = None
+    if connection.vendor == 'postgresql':
+        # xmax es 0 solo en la versión de la fila que insertó esta sentencia; el CTE ve la
+        # fila antes del UPDATE (y la bloquea, así que es la versión que se actualiza)
+        prefix = (f'WITH previous AS (SELECT {store_column} FROM {table} '
+                  f'WHERE {email_column} = %s AND {type_column} = %s FOR UPDATE) ')
+        params = [values['email_normalized'], values['lead_type_id'], *params]
+        returning += ['(xmax = 0) AS inserted', f'(SELECT {store_column} FROM previous) AS previous_store_id']
+    else:
+        # SQLite serializa las escrituras: lo que se lee aquí, dentro de la transacción, es
+        # lo que encontrará el ON CONFLICT
+        previous_store_id = Lead.objects.filter(**_lookup(values)).values_list('store_id', flat=True).first()
+
+    sql = (
+        f'{prefix}INSERT INTO {table} ({", ".join(qn(field.column) for field in fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))}) '
+        f'ON CONFLICT ({email_column}, {type_column}) '
+        f'DO UPDATE SET {", ".join(assignments)} '
+        f'RETURNING {", ".join(returning)}'
+    )
+    lead = next(iter(Lead.objects.raw(sql, params)))
+    if prefix:
+        return lead, lead.inserted, lead.previous_store_id
+    return lead, previous_store_id is None, previous_store_id
+
+
+def _upsert_fallback(values):
+    """
+    UPDATE con tryet = tryet + 1 y, si no hubo fila, INSERT protegido por la
+    llave única (dentro de la transacción de upsert_lead). Regresa (lead,
+    created, store_id previo).
+    """
+    values = _with_lookup_fields(values)
+    lookup = _lookup(values)
+    changes = {name: values[name] for name in UPDATE_FIELDS}
+
+    previous_store_id = Lead.objects.select_for_update().filter(**lookup).values_list('store_id', flat=True).first()
+    if not Lead.objects.filter(**lookup).update(tryet=F('tryet') + 1, **changes):
+        try:
+            with transaction.atomic():
+                return Lead.objects.create(**values), True, None
+        except IntegrityError:
+            # Otra petición insertó el mismo lead entre el UPDATE y el INSERT
+            previous_store_id = (Lead.objects.select_for_update().filter(**lookup)
+                                 .values_list('store_id', flat=True).first())
+            Lead.objects.filter(**lookup).update(tryet=F('tryet') + 1, **changes)
+    return Lead.objects.get(**lookup), False, previous_store_id
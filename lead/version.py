@@ -0,0 +1,22 @@
+import uuid
+from django.core.cache import cache
+
+VERSION_KEY = 'lead:leads:version'
+
+
+def leads_version():
+    """
+    Versión global de la tabla de leads en el cache de Django. Cambia con cada
+    escritura (ver lead.signals), así que sirve como parte de la llave de
+    cualquier resultado derivado de leads: una versión nueva nunca coincide
+    con entradas anteriores.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_leads_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
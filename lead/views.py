@@ -1,14 +1,38 @@
 from rest_framework import viewsets, status
-from lead.serializers import LeadSerializer
+from lead.serializers import LeadSerializer, LeadBatchItemSerializer
 from lead.models import Lead
-from lead_type.models import LeadType
+from lead.export import EXPORT_FORMATS, export_queryset, stream_csv, stream_ndjson
+from lead.lookup import normalize_email
+from lead.pagination import KeysetPagination
+from lead.row_serializers import STATUS_CHOICES, LeadRowSerializer
+from lead.signals import leads_created, leads_moved, notify_leads_changed
+from lead.upsert import upsert_lead
+from lead_type.registry import lead_types
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 import json
 
+# Máximo de leads aceptados por petición en existence/batch
+BATCH_MAX_SIZE = 500
+BATCH_UPDATE_FIELDS = ['name', 'phone_number', 'phone_digits', 'email', 'store_id', 'products_interest_ids',
+                       'tryet']
+
 class LeadViewSet(viewsets.ModelViewSet):
     queryset = Lead.objects.all()
     serializer_class = LeadSerializer
+    pagination_class = KeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        # Camino rápido: filas de .values() a dicts, ?fields= opcional y status_choices una sola vez
+        rows_serializer = LeadRowSerializer(request.query_params.get('fields'))
+        paginator = self.paginator
+        queryset = self.filter_queryset(self.get_queryset()).values(*rows_serializer.columns(*paginator.fields))
+        rows = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(rows_serializer.serialize(rows), status_choices=STATUS_CHOICES)
 
     @action(detail=False, methods=['post'], url_path='existence')
     def existence(self, request):
@@ -26,8 +50,22 @@ class LeadViewSet(viewsets.ModelViewSet):
             lead_type = data.get('lead_type')
             products_interest = data.get('products_interest', [])
 
+            if settings.LEAD_ATOMIC_UPSERT:
+                lead, created = upsert_lead(
+                    lead_type_id=serializer.validated_data['lead_type'].id,
+                    name=name,
+                    phone_number=phone_number,
+                    email=email,
+                    store_id=store_id,
+                    products_interest_ids=json.dumps(products_interest),
+                )
+                return Response(
+                    LeadSerializer(lead).data,
+                    status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+                )
+
             defaults = {
-                'lead_type': LeadType.objects.get(id=lead_type),
+                'lead_type': lead_types.get(lead_type),
                 'name': name,
                 'phone_number': phone_number,
                 'email': email,
@@ -35,7 +73,9 @@ class LeadViewSet(viewsets.ModelViewSet):
                 'products_interest_ids': json.dumps(products_interest)
             }
 
-            lead, created = Lead.objects.get_or_create(email=email, defaults=defaults)
+            # Un email puede existir con varios tipos: la llave es (email normalizado, tipo)
+            lead, created = Lead.objects.get_or_create(email_normalized=normalize_email(email),
+                                                       lead_type=defaults['lead_type'], defaults=defaults)
 
             if created:
                 serializer = LeadSerializer(lead)
@@ -45,8 +85,159 @@ class LeadViewSet(viewsets.ModelViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='existence/batch')
+    def existence_batch(self, request):
+        """
+        Versión por lotes de existence: recibe una lista de leads (o {'leads': [...]})
+        y aplica las mismas reglas de tipo nuevo / tryet con escrituras bulk dentro de
+        una transacción: INSERT que ignora llaves ya existentes (también las que otra
+        petición inserta al mismo tiempo) y una sola lectura bloqueada de las filas del
+        lote sobre la que se suma tryet.
+        """
+        store_id = request.headers.get('X-Store-Id')
+
+        if store_id is None:
+            return Response({'error': 'X-Store-Id header is missing'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('leads')
+
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Se esperaba una lista de leads'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(items) > BATCH_MAX_SIZE:
+            return Response(
+                {'error': f'Máximo {BATCH_MAX_SIZE} leads por petición'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = [None] * len(items)
+        valid_items = []
+        for index, item in enumerate(items):
+            serializer = LeadBatchItemSerializer(data=item)
+            if serializer.is_valid():
+                valid_items.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+
+        types = lead_types.many([data['lead_type'] for _, data in valid_items])
+
+        # Por llave (email normalizado, tipo): los valores de su última aparición y cuántas veces viene
+        pending = {}
+        outcomes = []
+        for index, data in valid_items:
+            lead_type = types.get(data['lead_type'])
+            if lead_type is None:
+                results[index] = {
+                    'index': index,
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': {'lead_type': [f"Invalid pk \"{data['lead_type']}\" - object does not exist."]}
+                }
+                continue
+
+            key = (normalize_email(data['email']), lead_type.id)
+            values = {
+                'name': data['name'],
+                'phone_number': data.get('phone_number'),
+                'email': data['email'],
+                'store_id': store_id,
+                'products_interest_ids': json.dumps(data.get('products_interest', [])),
+            }
+            outcomes.append((index, key, key not in pending))
+            count = pending[key][2] + 1 if key in pending else 1
+            pending[key] = (lead_type, values, count)
+
+        # Un lead nuevo entra con tryet = veces que viene en el lote; en orden de llave para que
+        # dos lotes con llaves en común las tomen en el mismo orden
+        candidates = {}
+        for key in sorted(pending):
+            lead_type, values, count = pending[key]
+            candidates[key] = Lead(lead_type=lead_type, tryet=count, **values)
+            candidates[key].normalize_lookup_fields()
+
+        created = {}
+        updated = {}
+        moves = []
+        with transaction.atomic():
+            # Si otra petición insertó la misma llave al mismo tiempo, el INSERT la ignora y la
+            # fila se actualiza abajo como cualquier lead existente
+            Lead.objects.bulk_create(candidates.values(), ignore_conflicts=True)
+            # Una sola consulta (por índice) para todas las filas del lote, bloqueadas hasta el
+            # commit: tryet se suma sobre lo que se lee aquí
+            rows = {}
+            emails = {email for email, _ in pending}
+            for lead in Lead.objects.select_for_update().filter(email_normalized__in=emails).order_by('id'):
+                rows.setdefault((lead.email_normalized, lead.lead_type_id), lead)
+
+            for key, (lead_type, values, count) in pending.items():
+                lead = rows[key]
+                # created_at lo fija bulk_create en cada objeto: si coincide, la fila es de este lote
+                if lead.created_at == candidates[key].created_at:
+                    created[key] = lead
+                    continue
+                previous_store_id = lead.store_id
+                for field, value in values.items():
+                    setattr(lead, field, value)
+                lead.normalize_lookup_fields()
+                lead.tryet += count
+                updated[key] = lead
+                # bulk_update no pasa por save(): los cambios de tienda se avisan aparte
+                if previous_store_id != int(lead.store_id):
+                    moves.append({'id': lead.pk, 'created_at': lead.created_at, 'status': lead.status,
+                                  'lead_type_id': lead.lead_type_id, 'from_store_id': previous_store_id,
+                                  'to_store_id': int(lead.store_id)})
+
+            leads_created.send(sender=Lead, leads=list(created.values()))
+            Lead.objects.bulk_update(updated.values(), BATCH_UPDATE_FIELDS)
+            if moves:
+                leads_moved.send(sender=Lead, moves=moves)
+            notify_leads_changed(lead.pk for lead in [*created.values(), *updated.values()])
+
+        outcomes = [(index, key, first and key in created) for index, key, first in outcomes]
+        for index, key, is_new in outcomes:
+            results[index] = {
+                'index': index,
+                'status': status.HTTP_201_CREATED if is_new else status.HTTP_200_OK,
+                'data': LeadSerializer(created.get(key) or updated[key]).data,
+            }
+
+        return Response({
+            'created': sum(1 for _, _, is_new in outcomes if is_new),
+            'updated': sum(1 for _, _, is_new in outcomes if not is_new),
+            'errors': sum(1 for result in results if result['status'] == status.HTTP_400_BAD_REQUEST),
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Exporta leads en streaming (?output=csv|ndjson) con cursor del lado del servidor.
+        Filtros: store_id, status, lead_type, created_from, created_to.
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"output debe ser uno de: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            queryset = export_queryset(request.query_params)
+        except ValueError as error:
+            return Response({'error': f'Filtro inválido: {error}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if output == 'csv':
+            response = StreamingHttpResponse(stream_csv(queryset), content_type='text/csv; charset=utf-8')
+        else:
+            response = StreamingHttpResponse(stream_ndjson(queryset), content_type='application/x-ndjson')
+
+        filename = f"leads-{timezone.now():%Y%m%d-%H%M%S}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
     def tryet_or_create(self, obj_lead, data, new_lead_type):
-        if obj_lead.lead_type.id != new_lead_type:
+        if obj_lead.lead_type_id != int(new_lead_type):
             new_lead = Lead.objects.create(**data)
             serializer = LeadSerializer(new_lead)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from lead_metrics.models import LeadMetrics
+from lead_metrics.models import LeadMetrics, LeadMetricsHourly, LeadMetricsSlice
 
 @admin.register(LeadMetrics)
 class LeadMetricsAdmin(admin.ModelAdmin):
@@ -12,4 +12,21 @@ class LeadMetricsAdmin(admin.ModelAdmin):
         if obj.total_leads > 0:
             return f"{(obj.converted_leads / obj.total_leads * 100):.2f}%"
         return "0%"
-    conversion_rate.short_description = 'Tasa de Conversión' 
\ No newline at end of file
+    conversion_rate.short_description = 'Tasa de Conversión' 
+
+
+@admin.register(LeadMetricsSlice)
+class LeadMetricsSliceAdmin(admin.ModelAdmin):
+    list_display = ['date', 'store_id', 'lead_type', 'total_leads', 'converted_leads']
+    list_filter = ['store_id', 'lead_type']
+    readonly_fields = ['date', 'store_id', 'lead_type', 'total_leads', 'pending_leads', 'contacted_leads',
+                       'discarded_leads', 'process_leads', 'converted_leads']
+
+
+
+@admin.register(LeadMetricsHourly)
+class LeadMetricsHourlyAdmin(admin.ModelAdmin):
+    list_display = ['hour', 'store_id', 'lead_type', 'total_leads', 'converted_leads']
+    list_filter = ['store_id', 'lead_type']
+    readonly_fields = ['hour', 'store_id', 'lead_type', 'total_leads', 'pending_leads', 'contacted_leads',
+                       'discarded_leads', 'process_leads', 'converted_leads']
@@ -0,0 +1,88 @@
+import datetime
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from lead.models import Lead
+
+# Tope de ?days= para las series diarias (dos años)
+MAX_DAYS = 730
+# ?granularity= de las series; hour solo en rangos de hasta MAX_HOUR_DAYS días
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+MAX_HOUR_DAYS = 31
+
+
+def parse_days(value, default):
+    """?days= como entero entre 0 y MAX_DAYS; ValidationError (400) si no"""
+    if value in (None, ''):
+        return default
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({'days': 'Debe ser un entero'})
+    if not 0 <= days <= MAX_DAYS:
+        raise ValidationError({'days': f'Debe estar entre 0 y {MAX_DAYS}'})
+    return days
+
+
+def day_window(days):
+    """(inicio, fin) inclusivos: los últimos `days` días más hoy, en la zona horaria configurada"""
+    end_date = timezone.localdate()
+    return end_date - datetime.timedelta(days=days), end_date
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def day_bounds(start_date, end_date):
+    """Rango semiabierto [inicio, fin + 1 día) en datetimes con zona, para filtrar created_at por índice"""
+    return day_start(start_date), day_start(end_date + datetime.timedelta(days=1))
+
+
+def date_range(start_date, end_date):
+    current = start_date
+    while current <= end_date:
+        yield current
+        current += datetime.timedelta(days=1)
+
+
+def hour_range(start_date, end_date):
+    """Inicio de cada hora local de [start_date, end_date]; los días con cambio de horario tienen 23 o 25"""
+    # Se avanza en UTC: sumar una hora a un datetime local no cruza bien el cambio de horario
+    current, end = (value.astimezone(datetime.timezone.utc) for value in day_bounds(start_date, end_date))
+    while current < end:
+        yield timezone.localtime(current)
+        current += datetime.timedelta(hours=1)
+
+
+def bucket_start(day, granularity):
+    """Primer día del bucket (semana que empieza en lunes o mes) al que pertenece `day`"""
+    if granularity == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def status_counts():
+    """Un Count filtrado por cada status: '<status>_leads'"""
+    return {f'{value}_leads': Count('id', filter=Q(status=value)) for value, _ in Lead.STATUS_CHOICES}
+
+
+def daily_counts(start_date, end_date, leads=None):
+    """
+    Total y conteo por status de los leads creados cada día, en una sola
+    consulta agrupada por fecha local y con ceros para los días sin leads.
+    """
+    start, end = day_bounds(start_date, end_date)
+    rows = (
+        (Lead.objects.all() if leads is None else leads).filter(created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(total_leads=Count('id'), **status_counts())
+        .order_by()
+    )
+    by_day = {row.pop('day'): row for row in rows}
+    empty = dict.fromkeys(['total_leads', *status_counts()], 0)
+    return [{'date': day, **by_day.get(day, empty)} for day in date_range(start_date, end_date)]
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class LeadMetricsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'lead_metrics' 
\ No newline at end of file
+    name = 'lead_metrics'
+
+    def ready(self):
+        import lead_metrics.signals
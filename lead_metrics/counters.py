@@ -0,0 +1,227 @@
+import datetime
+import logging
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from lead.models import Lead
+from lead_type.models import LeadType
+from lead_metrics.aggregates import day_bounds
+
+logger = logging.getLogger(__name__)
+
+COUNTER_KEY = 'lead_metrics:counter:{}'
+RECONCILED_KEY = 'lead_metrics:counter:reconciled_at'
+# Candado de la reconciliación en segundo plano (una a la vez entre todos los procesos);
+# expira solo si el proceso que la corría murió
+RECONCILING_KEY = 'lead_metrics:counter:reconciling'
+RECONCILE_TIMEOUT = 60 * 10
+# Tiendas de la última reconciliación: la siguiente pone en cero las que ya no tengan leads
+STORES_KEY = 'lead_metrics:counter:stores'
+# Días con contador propio (overview suma hasta 30 días atrás más hoy)
+DAY_WINDOW = 31
+DAY_TTL = 60 * 60 * 24 * 40
+TOTAL = 'total'
+
+
+def is_enabled():
+    """
+    Los contadores solo son correctos si todos los procesos (workers y
+    reconcile_lead_counters) comparten el cache; con locmem cada uno tendría los suyos.
+    """
+    return settings.SHARED_CACHE
+
+
+def day_name(day):
+    return f'day:{day.isoformat()}'
+
+
+def status_name(status):
+    return f'status:{status}'
+
+
+def type_name(lead_type_id):
+    return f'type:{lead_type_id}'
+
+
+def store_name(store_id, name=TOTAL):
+    """Contador `name` (total, status o día) de una tienda, para overview y by-status con ?store_id="""
+    return f'store:{store_id}:{name}'
+
+
+def store_names(created_at, status, store_id):
+    day = timezone.localtime(created_at).date()
+    return [store_name(store_id), store_name(store_id, status_name(status)), store_name(store_id, day_name(day))]
+
+
+def lead_names(created_at, status, lead_type_id, store_id):
+    """Contadores en los que cuenta un lead"""
+    return [TOTAL, day_name(timezone.localtime(created_at).date()), status_name(status), type_name(lead_type_id),
+            *store_names(created_at, status, store_id)]
+
+
+def _timeout(name):
+    return DAY_TTL if 'day:' in name else None
+
+
+def apply_deltas(deltas):
+    """
+    Suma {nombre: +n/-n} a los contadores con incr (atómico en Redis). Un
+    contador que no existe se crea con add; si se pierde entre ambos, la
+    siguiente reconciliación lo corrige.
+    """
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        key = COUNTER_KEY.format(name)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            if not cache.add(key, delta, _timeout(name)):
+                try:
+                    cache.incr(key, delta)
+                except ValueError:
+                    pass
+
+
+def apply_on_commit(deltas):
+    """Los contadores no son transaccionales: se ajustan solo si la escritura se confirma"""
+    deltas = Counter(deltas)
+    if is_enabled() and any(deltas.values()):
+        transaction.on_commit(lambda: apply_deltas(deltas))
+
+
+def record_created(leads):
+    deltas = Counter()
+    for lead in leads:
+        deltas.update(lead_names(lead.created_at, lead.status, lead.lead_type_id, lead.store_id))
+    apply_on_commit(deltas)
+
+
+def record_moved(before, after):
+    """
+    before/after: (created_at, status, lead_type_id, store_id) de un lead
+    guardado, ambos con el status con que se leyó (el cambio de status llega
+    aparte por leads_status_changed, ya con la tienda nueva)
+    """
+    deltas = Counter(lead_names(*after))
+    deltas.subtract(lead_names(*before))
+    apply_on_commit(deltas)
+
+
+def record_store_moves(moves):
+    """moves de leads_moved (upsert y existence/batch, que no pasan por save())"""
+    deltas = Counter()
+    for move in moves:
+        deltas.update(store_names(move['created_at'], move['status'], move['to_store_id']))
+        deltas.subtract(store_names(move['created_at'], move['status'], move['from_store_id']))
+    apply_on_commit(deltas)
+
+
+def record_status_changes(changes):
+    deltas = Counter()
+    for change in changes:
+        for status, delta in ((change['from_status'], -1), (change['to_status'], 1)):
+            deltas[status_name(status)] += delta
+            deltas[store_name(change['store_id'], status_name(status))] += delta
+    apply_on_commit(deltas)
+
+
+def record_deleted(created_at, status, lead_type_id, store_id):
+    apply_on_commit({name: -1 for name in lead_names(created_at, status, lead_type_id, store_id)})
+
+
+def read(names):
+    """
+    Valores de los contadores indicados (0 si no existe); None si nunca se han
+    reconciliado (cache nuevo o vaciado). En ese caso arranca la reconciliación
+    en segundo plano y el llamador usa el rollup mientras termina.
+    """
+    keys = {name: COUNTER_KEY.format(name) for name in names}
+    values = cache.get_many([RECONCILED_KEY, *keys.values()])
+    if RECONCILED_KEY not in values:
+        start_reconcile()
+        return None
+    return {name: values.get(key, 0) for name, key in keys.items()}
+
+
+def count_from_leads(stores=()):
+    """
+    Valores exactos de todos los contadores, contados desde Lead con
+    consultas agrupadas; las tiendas de `stores` sin leads quedan en cero.
+    """
+    grouped = list(Lead.objects.values('status', 'lead_type_id', 'store_id').annotate(count=Count('id')).order_by())
+    today = timezone.localdate()
+    days = [today - datetime.timedelta(days=offset) for offset in range(DAY_WINDOW)]
+    start, end = day_bounds(days[-1], today)
+    recent = (
+        Lead.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'store_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    counts = Counter({type_name(lead_type_id): 0 for lead_type_id in LeadType.objects.values_list('id', flat=True)})
+    names = [TOTAL, *(status_name(value) for value, _ in Lead.STATUS_CHOICES), *(day_name(day) for day in days)]
+    counts.update({name: 0 for name in names})
+    for store_id in {*stores, *(row['store_id'] for row in grouped)}:
+        counts.update({store_name(store_id, name): 0 for name in names})
+
+    for row in grouped:
+        for name in (TOTAL, status_name(row['status'])):
+            counts[name] += row['count']
+            counts[store_name(row['store_id'], name)] += row['count']
+        counts[type_name(row['lead_type_id'])] += row['count']
+    for row in recent:
+        counts[day_name(row['day'])] += row['count']
+        counts[store_name(row['store_id'], day_name(row['day']))] += row['count']
+    return counts
+
+
+def reconcile():
+    """
+    Reemplaza los contadores con los valores de Lead y regresa la deriva
+    corregida ({nombre: (antes, después)}). Las escrituras confirmadas
+    mientras se cuenta pueden quedar fuera; la siguiente pasada las corrige.
+    """
+    counts = count_from_leads(cache.get(STORES_KEY) or ())
+    keys = {name: COUNTER_KEY.format(name) for name in counts}
+    previous = cache.get_many(list(keys.values()))
+
+    cache.set_many({keys[name]: value for name, value in counts.items() if _timeout(name) is None}, None)
+    cache.set_many({keys[name]: value for name, value in counts.items() if _timeout(name) is not None}, DAY_TTL)
+    cache.set(STORES_KEY, [int(name.split(':')[1]) for name, value in counts.items()
+                           if name.startswith('store:') and name.endswith(f':{TOTAL}') and value], None)
+    cache.set(RECONCILED_KEY, time.time(), None)
+
+    return {
+        name: (previous.get(keys[name]), value) for name, value in counts.items()
+        if previous.get(keys[name]) != value
+    }
+
+
+def run_reconcile():
+    try:
+        reconcile()
+    except Exception:
+        # El siguiente read (o reconcile_lead_counters) lo vuelve a intentar
+        logger.exception('contadores: error al reconciliar')
+    finally:
+        cache.delete(RECONCILING_KEY)
+        close_old_connections()
+
+
+def start_reconcile():
+    """
+    Reconcilia en un hilo daemon sin bloquear el request que lo pidió; el
+    candado en el cache evita que varios procesos cuenten Lead a la vez.
+    """
+    if not cache.add(RECONCILING_KEY, time.time(), RECONCILE_TIMEOUT):
+        return
+    threading.Thread(target=run_reconcile, name='lead-counters-reconcile', daemon=True).start()
@@ -0,0 +1,514 @@
+import datetime
+from functools import cached_property
+from django.db.models import Count, F, Min, Window
+from django.db.models.functions import RowNumber, TruncHour
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from lead.models import Lead
+from lead_type.registry import lead_types
+from lead_metrics import counters
+from lead_metrics.aggregates import (
+    GRANULARITIES,
+    MAX_DAYS,
+    MAX_HOUR_DAYS,
+    bucket_start,
+    date_range,
+    day_bounds,
+    day_window,
+    hour_range,
+    parse_days,
+    status_counts,
+)
+from lead_metrics.rollup import SLICE_FIELDS, daily_series, fill_missing, local_date, slice_totals
+from lead_metrics.serializers import (
+    LeadMetricsSerializer,
+    LeadStatusMetricsSerializer,
+    LeadTypeMetricsSerializer,
+    LeadTrendSerializer,
+    LeadDailyMetricsSerializer,
+)
+
+WIDGETS = ('overview', 'by_status', 'by_type', 'trends', 'daily_metrics', 'recent_activity', 'conversion_funnel')
+# Ventana de cada serie cuando no se pide ?days= ni rango de fechas
+SERIES_DAYS = {'trends': 30, 'daily_metrics': 7}
+# Leads nuevos de overview: días hacia atrás desde hoy
+NEW_LEADS_SINCE = {'new_leads_today': 0, 'new_leads_week': 7, 'new_leads_month': 30}
+RECENT_LIMIT = 10
+MAX_RECENT_LIMIT = 100
+STATUSES = [value for value, _ in Lead.STATUS_CHOICES]
+# ?group_by= -> columna de la dimensión
+GROUP_BY = {'store_id': 'store_id', 'lead_type': 'lead_type_id'}
+# Fuente compartida que usa cada widget
+WIDGET_SOURCES = {
+    'overview': 'totals', 'by_status': 'totals', 'conversion_funnel': 'totals', 'by_type': 'types',
+    'trends': 'series', 'daily_metrics': 'series', 'recent_activity': 'recent',
+}
+
+
+def parse_widgets(value):
+    """?widgets=overview,by-status,... (todos si no se indica); ValidationError con nombres desconocidos"""
+    if not value:
+        return list(WIDGETS)
+    names = [name.strip().replace('-', '_') for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in WIDGETS]
+    if unknown:
+        raise ValidationError({'widgets': f'Desconocidos: {", ".join(unknown)}. Opciones: {", ".join(WIDGETS)}'})
+    return list(dict.fromkeys(names))
+
+
+def parse_group_by(value):
+    if value in (None, ''):
+        return None
+    if value not in GROUP_BY:
+        raise ValidationError({'group_by': f'Opciones: {", ".join(GROUP_BY)}'})
+    return value
+
+
+def parse_granularity(value):
+    if value in (None, ''):
+        return 'day'
+    if value not in GRANULARITIES:
+        raise ValidationError({'granularity': f'Opciones: {", ".join(GRANULARITIES)}'})
+    return value
+
+
+def parse_int(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'Debe ser un entero'})
+
+
+def parse_date(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: 'Debe tener formato YYYY-MM-DD'})
+
+
+class LeadFilters:
+    """
+    Filtros compartidos por los widgets: rango de fechas de creación, tienda y
+    tipo de lead, más la dimensión opcional para agrupar (group_by) y el
+    tamaño de los buckets de las series (granularity)
+    """
+
+    def __init__(self, date_from=None, date_to=None, days=None, store_id=None, lead_type=None,
+                 group_by=None, granularity='day', limit=RECENT_LIMIT):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.days = days
+        self.store_id = store_id
+        self.lead_type = lead_type
+        self.group_by = group_by
+        self.granularity = granularity
+        self.limit = limit
+
+    @classmethod
+    def from_params(cls, params):
+        days = parse_days(params.get('days'), default=None)
+        date_from = parse_date(params.get('date_from'), 'date_from')
+        date_to = parse_date(params.get('date_to'), 'date_to')
+        if date_from or date_to:
+            date_to = date_to or timezone.localdate()
+            date_from = date_from or date_to - datetime.timedelta(days=days if days is not None else 30)
+            if date_from > date_to:
+                raise ValidationError({'date_from': 'Debe ser anterior o igual a date_to'})
+            if (date_to - date_from).days > MAX_DAYS:
+                raise ValidationError({'date_from': f'El rango no puede pasar de {MAX_DAYS} días'})
+
+        granularity = parse_granularity(params.get('granularity'))
+        if granularity == 'hour':
+            span = (date_to - date_from).days if date_from else days
+            if span is not None and span > MAX_HOUR_DAYS:
+                raise ValidationError({'granularity': f'Con hour el rango no puede pasar de {MAX_HOUR_DAYS} días'})
+
+        limit = parse_int(params.get('limit'), 'limit')
+        return cls(
+            date_from=date_from,
+            date_to=date_to,
+            days=days,
+            store_id=parse_int(params.get('store_id'), 'store_id'),
+            lead_type=parse_int(params.get('lead_type'), 'lead_type'),
+            group_by=parse_group_by(params.get('group_by')),
+            granularity=granularity,
+            limit=RECENT_LIMIT if limit is None else max(1, min(limit, MAX_RECENT_LIMIT)),
+        )
+
+    @property
+    def is_filtered(self):
+        return self.date_from is not None or self.store_id is not None or self.lead_type is not None
+
+    @property
+    def hourly(self):
+        return self.granularity == 'hour'
+
+    @property
+    def dimension(self):
+        return GROUP_BY.get(self.group_by)
+
+    def leads(self):
+        leads = Lead.objects.all()
+        if self.store_id is not None:
+            leads = leads.filter(store_id=self.store_id)
+        if self.lead_type is not None:
+            leads = leads.filter(lead_type_id=self.lead_type)
+        if self.date_from is not None:
+            start, end = day_bounds(self.date_from, self.date_to)
+            leads = leads.filter(created_at__gte=start, created_at__lt=end)
+        return leads
+
+    def window(self, default_days):
+        """(inicio, fin) del rango de fechas pedido, o los últimos ?days= (default_days) días"""
+        if self.date_from is not None:
+            return self.date_from, self.date_to
+        return day_window(self.days if self.days is not None else default_days)
+
+    def series_window(self, widget):
+        return self.window(SERIES_DAYS[widget])
+
+
+class LeadDashboard:
+    """
+    Widgets de métricas de leads calculados con pasadas compartidas.
+
+    Sin filtros ni group_by, los conteos salen de los contadores en cache (una
+    lectura para overview, by_status, by_type y conversion_funnel; solo con
+    SHARED_CACHE y ya reconciliados, si no, del rollup como con filtros) y las
+    series del rollup diario. Con solo store_id, overview, by_status y
+    conversion_funnel salen de los contadores de la tienda y el resto como con
+    filtros. Con filtros o group_by, los días cerrados salen de
+    LeadMetricsSlice (una suma por tipo para totales y by_type, una por día
+    para new_leads_* y otra para las series, leyendo solo las filas de la
+    tienda o tipo pedidos) y el día de hoy de una sola consulta a Lead
+    compartida por todos los widgets; recent_activity es una consulta aparte.
+
+    Las series (trends, daily_metrics) con granularity=week|month suman los
+    días del rollup en buckets al vuelo; con granularity=hour salen de
+    LeadMetricsHourly y de la misma consulta de hoy, agrupada también por hora.
+
+    Con group_by, build() regresa una lista [{<dimensión>: valor, <widget>: datos}].
+    """
+
+    def __init__(self, filters, widgets):
+        self.filters = filters
+        self.widgets = widgets
+        self._filled = False
+
+    def build(self):
+        if self.filters.group_by is None:
+            return {name: getattr(self, name)(None) for name in self.widgets}
+        return [
+            {self.filters.group_by: group, **{name: getattr(self, name)(group) for name in self.widgets}}
+            for group in self.groups()
+        ]
+
+    def groups(self):
+        """Valores de la dimensión con datos en alguno de los widgets pedidos"""
+        groups = set()
+        for source in dict.fromkeys(WIDGET_SOURCES[name] for name in self.widgets):
+            groups.update(getattr(self, source))
+        return sorted(groups)
+
+    # Pasadas compartidas
+
+    @cached_property
+    def counter_values(self):
+        """
+        Sin filtros: total, status, días recientes y tipos en una sola lectura
+        de contadores; con solo store_id, los de la tienda (sin tipos). None si
+        todavía no están reconciliados.
+        """
+        store_id = self.filters.store_id
+
+        def name(base):
+            return base if store_id is None else counters.store_name(store_id, base)
+
+        today = timezone.localdate()
+        days = [today - datetime.timedelta(days=offset) for offset in range(counters.DAY_WINDOW)]
+        type_ids = list(lead_types.all()) if 'by_type' in self.widgets and store_id is None else []
+        values = counters.read([
+            name(counters.TOTAL),
+            *(name(counters.status_name(value)) for value in STATUSES),
+            *(name(counters.day_name(day)) for day in days),
+            *(counters.type_name(lead_type_id) for lead_type_id in type_ids),
+        ])
+        if values is None:
+            return None
+        daily = [values[name(counters.day_name(day))] for day in days]
+        totals = {'total_leads': values[name(counters.TOTAL)]}
+        totals.update((f'{value}_leads', values[name(counters.status_name(value))]) for value in STATUSES)
+        totals.update((key, sum(daily[:offset + 1])) for key, offset in NEW_LEADS_SINCE.items())
+        types = {lead_type_id: values[counters.type_name(lead_type_id)] for lead_type_id in type_ids}
+        return totals, types
+
+    @property
+    def unfiltered(self):
+        return not self.filters.is_filtered and self.filters.group_by is None
+
+    @property
+    def store_only(self):
+        filters = self.filters
+        return (filters.store_id is not None and filters.lead_type is None and filters.date_from is None
+                and filters.group_by is None)
+
+    @cached_property
+    def uses_counters(self):
+        """
+        totals (y types sin store_id) salen de los contadores: sin filtros o
+        con solo store_id; si no están listos (cache vacío) se usa el rollup
+        """
+        return ((self.unfiltered or self.store_only) and counters.is_enabled()
+                and self.counter_values is not None)
+
+    @cached_property
+    def lead_range(self):
+        """(primer día, último día) de los leads que cubren los filtros; None si no hay"""
+        if self.filters.date_from is not None:
+            return self.filters.date_from, self.filters.date_to
+        first = self.filters.leads().aggregate(first=Min('created_at'))['first']
+        return None if first is None else (local_date(first), timezone.localdate())
+
+    @cached_property
+    def today_rows(self):
+        """Leads de hoy por tienda y tipo: una consulta (índice por tienda y fecha) para todos los widgets"""
+        today = timezone.localdate()
+        start, end = day_bounds(today, today)
+        leads = self.filters.leads().filter(created_at__gte=start, created_at__lt=end)
+        if self.filters.hourly:
+            leads = leads.annotate(hour=TruncHour('created_at'))
+        columns = ['store_id', 'lead_type_id', *(['hour'] if self.filters.hourly else [])]
+        return list(leads.values(*columns).annotate(total_leads=Count('id'), **status_counts()).order_by())
+
+    def needed_ranges(self):
+        sources = {WIDGET_SOURCES[name] for name in self.widgets}
+        ranges = []
+        if sources & {'totals', 'types'} and self.lead_range is not None:
+            ranges.append(self.lead_range)
+        if 'series' in sources:
+            ranges.append(self.series_range)
+        return ranges
+
+    def fill_closed_days(self):
+        """Calcula una sola vez por request los días cerrados que falten en el rollup, para todas las fuentes"""
+        if self._filled:
+            return
+        self._filled = True
+        ranges = self.needed_ranges()
+        start_date = min(start for start, _ in ranges)
+        end_date = min(max(end for _, end in ranges), timezone.localdate() - datetime.timedelta(days=1))
+        if start_date <= end_date:
+            fill_missing(start_date, end_date, fields=())
+
+    def counts(self, start_date, end_date, *extra):
+        """
+        Conteos de [start_date, end_date] por grupo y `extra` ('date', 'hour'
+        o 'lead_type_id'): {(grupo, *valores de extra): conteos}. El grupo es
+        None sin group_by.
+        """
+        dimension = self.filters.dimension
+        by = tuple(dict.fromkeys([*extra, *([dimension] if dimension else [])]))
+        today = timezone.localdate()
+        closed_end = min(end_date, today - datetime.timedelta(days=1))
+
+        result = {}
+
+        def add(values, counts):
+            key = (values[dimension] if dimension else None, *(values[name] for name in extra))
+            totals = result.setdefault(key, dict.fromkeys(SLICE_FIELDS, 0))
+            for field in SLICE_FIELDS:
+                totals[field] += counts[field]
+
+        if start_date <= closed_end:
+            self.fill_closed_days()
+            rows = slice_totals(start_date, closed_end, by=by, store_id=self.filters.store_id,
+                                lead_type_id=self.filters.lead_type)
+            for key, counts in rows.items():
+                add(dict(zip(by, key)), counts)
+        if start_date <= today <= end_date:
+            for row in self.today_rows:
+                add(dict(row, date=today), row)
+        return result
+
+    @cached_property
+    def type_counts(self):
+        """{(grupo, lead_type_id): conteos} de todo el rango; sirve a totals y a types"""
+        if self.lead_range is None:
+            return {}
+        return self.counts(*self.lead_range, 'lead_type_id')
+
+    @cached_property
+    def totals(self):
+        """{grupo: total_leads, <status>_leads y new_leads_*}"""
+        if self.uses_counters:
+            return {None: self.counter_values[0]}
+        totals = {}
+        for (group, _), counts in self.type_counts.items():
+            group_totals = totals.setdefault(group, self.empty_totals())
+            for field in SLICE_FIELDS:
+                group_totals[field] += counts[field]
+        if not totals:
+            return totals
+
+        start_date, end_date = self.lead_range
+        today = timezone.localdate()
+        window_start = max(start_date, today - datetime.timedelta(days=max(NEW_LEADS_SINCE.values())))
+        window_end = min(end_date, today)
+        if window_start <= window_end:
+            for (group, day), counts in self.counts(window_start, window_end, 'date').items():
+                for name, offset in NEW_LEADS_SINCE.items():
+                    if (today - day).days <= offset:
+                        totals[group][name] += counts['total_leads']
+        return totals
+
+    @cached_property
+    def types(self):
+        """{grupo: {lead_type_id: total}}"""
+        if self.uses_counters and not self.store_only:
+            return {None: self.counter_values[1]}
+        types = {}
+        for (group, lead_type_id), counts in self.type_counts.items():
+            types.setdefault(group, {})[lead_type_id] = counts['total_leads']
+        return types
+
+    @cached_property
+    def series_range(self):
+        windows = [self.filters.series_window(name) for name in SERIES_DAYS if name in self.widgets]
+        return min(start for start, _ in windows), max(end for _, end in windows)
+
+    @cached_property
+    def series(self):
+        """{grupo: {fecha (u hora): fila}} para la unión de las ventanas de trends y daily_metrics"""
+        start_date, end_date = self.series_range
+        if self.unfiltered and not self.filters.hourly:
+            return {None: {row['date']: row for row in daily_series(start_date, end_date)}}
+
+        key = 'hour' if self.filters.hourly else 'date'
+        series = {}
+        for (group, value), counts in self.counts(start_date, end_date, key).items():
+            series.setdefault(group, {})[value] = dict(counts, new_leads=counts['total_leads'])
+        return series
+
+    def series_rows(self, widget, group):
+        """Filas de la ventana del widget con ceros donde no hay leads, en buckets de `granularity`"""
+        start_date, end_date = self.filters.series_window(widget)
+        rows = self.series.get(group, {})
+        empty = dict.fromkeys(['new_leads', *SLICE_FIELDS], 0)
+        if self.filters.hourly:
+            return [dict(rows.get(hour) or empty, date=hour.date(), hour=hour)
+                    for hour in hour_range(start_date, end_date)]
+
+        buckets = {}
+        for day in date_range(start_date, end_date):
+            start = bucket_start(day, self.filters.granularity)
+            bucket = buckets.setdefault(start, dict(empty, date=start))
+            for field, value in (rows.get(day) or empty).items():
+                if field != 'date':
+                    bucket[field] += value
+        return list(buckets.values())
+
+    @cached_property
+    def recent(self):
+        """{grupo: últimos leads}; con group_by, los últimos `limit` de cada grupo en una consulta"""
+        leads = self.filters.leads().select_related('lead_type')
+        dimension = self.filters.dimension
+        if dimension is None:
+            return {None: list(leads.order_by('-created_at')[:self.filters.limit])}
+
+        ranked = leads.annotate(rank=Window(RowNumber(), partition_by=[F(dimension)],
+                                            order_by=F('created_at').desc()))
+        recent = {}
+        for lead in ranked.filter(rank__lte=self.filters.limit).order_by('-created_at'):
+            recent.setdefault(getattr(lead, dimension), []).append(lead)
+        return recent
+
+    # Widgets
+
+    def overview(self, group):
+        counts = self.totals.get(group) or self.empty_totals()
+        total_leads = counts['total_leads']
+        conversion_rate = (counts['converted_leads'] / total_leads * 100) if total_leads > 0 else 0
+        data = {
+            'total_leads': total_leads,
+            'new_leads_today': counts['new_leads_today'],
+            'new_leads_week': counts['new_leads_week'],
+            'new_leads_month': counts['new_leads_month'],
+            'conversion_rate': round(conversion_rate, 2)
+        }
+        return LeadMetricsSerializer(data).data
+
+    def by_status(self, group):
+        counts = self.totals.get(group) or self.empty_totals()
+        total_leads = counts['total_leads']
+        status_counts = sorted(
+            ({'status': value, 'count': counts[f'{value}_leads']} for value in STATUSES
+             if counts[f'{value}_leads'] > 0),
+            key=lambda item: -item['count'],
+        )
+        metrics = [
+            dict(item, percentage=round((item['count'] / total_leads * 100) if total_leads > 0 else 0, 2))
+            for item in status_counts
+        ]
+        return LeadStatusMetricsSerializer(metrics, many=True).data
+
+    def by_type(self, group):
+        type_counts = self.types.get(group, {})
+        total_leads = sum(type_counts.values())
+
+        # El nombre sale del registro en memoria; tipos con el mismo nombre se suman
+        types = lead_types.many(list(type_counts))
+        counts_by_name = {}
+        for lead_type_id, count in type_counts.items():
+            if count <= 0:
+                continue
+            name = types[lead_type_id].name if lead_type_id in types else None
+            counts_by_name[name] = counts_by_name.get(name, 0) + count
+
+        metrics = []
+        for name, count in sorted(counts_by_name.items(), key=lambda item: -item[1]):
+            percentage = (count / total_leads * 100) if total_leads > 0 else 0
+            metrics.append({'lead_type': name, 'count': count, 'percentage': round(percentage, 2)})
+        return LeadTypeMetricsSerializer(metrics, many=True).data
+
+    def trends(self, group):
+        trends = [
+            {'date': row['date'], **({'hour': row['hour']} if 'hour' in row else {}),
+             'new_leads': row['total_leads'], 'converted_leads': row['converted_leads']}
+            for row in self.series_rows('trends', group)
+        ]
+        return LeadTrendSerializer(trends, many=True).data
+
+    def daily_metrics(self, group):
+        return LeadDailyMetricsSerializer(self.series_rows('daily_metrics', group), many=True).data
+
+    def recent_activity(self, group):
+        return [
+            {
+                'id': lead.id,
+                'name': lead.name,
+                'email': lead.email,
+                'status': lead.status,
+                'lead_type': lead.lead_type.name,
+                'created_at': lead.created_at,
+                'tryet': lead.tryet
+            }
+            for lead in self.recent.get(group, [])
+        ]
+
+    def conversion_funnel(self, group):
+        counts = self.totals.get(group) or self.empty_totals()
+        total_leads = counts['total_leads']
+        funnel_data = {'total_leads': total_leads}
+        funnel_data.update((f'{value}_leads', counts[f'{value}_leads']) for value in STATUSES)
+        for value in STATUSES:
+            share = (counts[f'{value}_leads'] / total_leads * 100) if total_leads > 0 else 0
+            funnel_data[f'{value}_percentage'] = round(share, 2)
+        return funnel_data
+
+    @staticmethod
+    def empty_totals():
+        return dict.fromkeys([*SLICE_FIELDS, *NEW_LEADS_SINCE], 0)
@@ -0,0 +1,53 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from lead.models import Lead
+from lead_metrics import rollup
+from lead_metrics.models import LeadEmailSketch, LeadVelocityDaily
+
+# Días recalculados por consulta
+CHUNK_DAYS = 90
+
+
+class Command(BaseCommand):
+    help = ('Recalcula desde Lead las filas de LeadMetrics, LeadMetricsSlice y LeadMetricsHourly '
+            '(backfill y reparación); los histogramas de velocidad y los sketches de emails del rango '
+            'se borran y se recalculan al leerse')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Fecha inicial YYYY-MM-DD (default: primer lead)')
+        parser.add_argument('--to', dest='date_to', help='Fecha final YYYY-MM-DD (default: hoy)')
+
+    def handle(self, *args, **options):
+        start_date = self.parse_date(options['date_from'], '--from')
+        end_date = self.parse_date(options['date_to'], '--to') or timezone.localdate()
+        if start_date is None:
+            first = Lead.objects.aggregate(first=Min('created_at'))['first']
+            if first is None:
+                self.stdout.write('No hay leads; nada que recalcular')
+                return
+            start_date = rollup.local_date(first)
+        if start_date > end_date:
+            raise CommandError('--from debe ser anterior o igual a --to')
+
+        days = 0
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(chunk_start + datetime.timedelta(days=CHUNK_DAYS - 1), end_date)
+            with transaction.atomic():
+                days += rollup.rebuild(chunk_start, chunk_end)
+                LeadVelocityDaily.objects.filter(date__range=(chunk_start, chunk_end)).delete()
+                LeadEmailSketch.objects.filter(date__range=(chunk_start, chunk_end)).delete()
+            chunk_start = chunk_end + datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {days} días recalculados ({start_date} a {end_date})"))
+
+    def parse_date(self, value, option):
+        if not value:
+            return None
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'{option} debe tener formato YYYY-MM-DD')
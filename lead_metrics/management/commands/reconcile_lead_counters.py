@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from lead_metrics import counters
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde Lead los contadores en cache de lead-metrics (correr periódicamente)'
+
+    def handle(self, *args, **options):
+        if not counters.is_enabled():
+            # Con un cache por proceso solo se reconciliaría el cache vacío de este comando
+            raise CommandError('Los contadores requieren un cache compartido (REDIS_URL / SHARED_CACHE)')
+        drift = counters.reconcile()
+        for name, (before, after) in sorted(drift.items()):
+            if before is not None:
+                self.stdout.write(f'{name}: {before} -> {after}')
+        missing = sum(1 for before, _ in drift.values() if before is None)
+        corrected = len(drift) - missing
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Contadores reconciliados: {corrected} corregidos, {missing} creados"))
@@ -1,4 +1,5 @@
 from django.db import models
+from lead_type.models import LeadType
 
 class LeadMetrics(models.Model):
     """
@@ -18,4 +19,96 @@ class LeadMetrics(models.Model):
         ordering = ['-date']
     
     def __str__(self):
-        return f"Métricas del {self.date}" 
\ No newline at end of file
+        return f"Métricas del {self.date}" 
+
+class LeadMetricsSlice(models.Model):
+    """
+    Conteos diarios por tienda y tipo de lead (solo combinaciones con leads).
+    Un día está calculado cuando tiene fila en LeadMetrics; ambas tablas se
+    llenan y ajustan juntas (ver lead_metrics.rollup).
+    """
+    date = models.DateField()
+    store_id = models.IntegerField()
+    lead_type = models.ForeignKey(LeadType, related_name='+', on_delete=models.CASCADE, db_index=False)
+    total_leads = models.IntegerField(default=0)
+    pending_leads = models.IntegerField(default=0)
+    contacted_leads = models.IntegerField(default=0)
+    discarded_leads = models.IntegerField(default=0)
+    process_leads = models.IntegerField(default=0)
+    converted_leads = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'store_id', 'lead_type'], name='lead_metrics_slice_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['store_id', 'date'], name='lead_metrics_slice_store_idx'),
+            models.Index(fields=['lead_type', 'date'], name='lead_metrics_slice_type_idx'),
+        ]
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Métricas del {self.date} (tienda {self.store_id}, tipo {self.lead_type_id})"
+
+
+class LeadMetricsHourly(models.Model):
+    """
+    Conteos por hora local (inicio de la hora), tienda y tipo de lead; solo
+    combinaciones con leads. Se llena y ajusta junto con LeadMetrics y
+    LeadMetricsSlice, por día completo (ver lead_metrics.rollup).
+    """
+    hour = models.DateTimeField()
+    store_id = models.IntegerField()
+    lead_type = models.ForeignKey(LeadType, related_name='+', on_delete=models.CASCADE, db_index=False)
+    total_leads = models.IntegerField(default=0)
+    pending_leads = models.IntegerField(default=0)
+    contacted_leads = models.IntegerField(default=0)
+    discarded_leads = models.IntegerField(default=0)
+    process_leads = models.IntegerField(default=0)
+    converted_leads = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'store_id', 'lead_type'], name='lead_metrics_hourly_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['store_id', 'hour'], name='lead_metrics_hourly_store_idx'),
+            models.Index(fields=['lead_type', 'hour'], name='lead_metrics_hourly_type_idx'),
+        ]
+        ordering = ['-hour']
+
+    def __str__(self):
+        return f"Métricas de {self.hour} (tienda {self.store_id}, tipo {self.lead_type_id})"
+
+
+class LeadVelocityDaily(models.Model):
+    """
+    Histogramas (escala logarítmica) de segundos desde la creación del lead hasta
+    cada cambio de status, por día de cambio. Hay una fila por día aunque no haya
+    cambios, para distinguir "sin cambios" de "todavía no calculado".
+    """
+    date = models.DateField(unique=True)
+    # {"<store_id>:<lead_type_id>:<to_status>": {"<bucket>": count}}
+    histograms = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Velocidad del {self.date}"
+
+
+class LeadEmailSketch(models.Model):
+    """
+    Sketch HyperLogLog (app.hyperloglog) de los emails normalizados de los
+    leads creados cada día. Hay una fila por día cerrado aunque no haya leads;
+    se combinan para estimar emails únicos en cualquier rango.
+    """
+    date = models.DateField(unique=True)
+    registers = models.BinaryField()
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Emails únicos del {self.date}"
@@ -0,0 +1,100 @@
+import functools
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from lead.version import leads_version
+
+RESPONSE_KEY = 'lead_metrics:response:{endpoint}:{digest}'
+LOCK_KEY = '{key}:lock'
+# Si el worker que recalcula muere, el candado se libera solo
+LOCK_TIMEOUT = 30
+# Sin valor previo, cuánto espera un worker a que otro termine de recalcular
+WAIT_SECONDS = 2.0
+WAIT_STEP = 0.05
+
+
+def is_enabled():
+    # La invalidación por escritura de leads debe llegar a todos los workers
+    return settings.LEAD_METRICS_CACHE_TTL > 0 and settings.SHARED_CACHE
+
+
+def make_key(endpoint, params):
+    """Llave por endpoint y parámetros (sin importar el orden en la query string)"""
+    items = sorted((name, params.getlist(name)) for name in params)
+    digest = hashlib.sha1(json.dumps(items, separators=(',', ':')).encode()).hexdigest()
+    return RESPONSE_KEY.format(endpoint=endpoint, digest=digest)
+
+
+def lock_key(key):
+    return LOCK_KEY.format(key=key)
+
+
+def store(key, data, version):
+    entry = {'version': version, 'expires': time.time() + settings.LEAD_METRICS_CACHE_TTL, 'data': data}
+    cache.set(key, entry, settings.LEAD_METRICS_CACHE_TTL + settings.LEAD_METRICS_CACHE_STALE_TTL)
+
+
+def is_fresh(entry, version):
+    return entry is not None and entry['version'] == version and entry['expires'] > time.time()
+
+
+def get_or_compute(key, compute):
+    """
+    Regresa (data, estado) con estado HIT, MISS o STALE.
+
+    La entrada guarda la versión de leads con la que se calculó: una escritura
+    de leads o el TTL la vuelven vencida. Solo el worker que obtiene el candado
+    (cache.add) recalcula; los demás sirven la entrada vencida mientras tanto
+    o, si no hay ninguna, esperan un momento a que aparezca. compute() puede
+    regresar None para no guardar nada (respuestas de error).
+    """
+    version = leads_version()
+    entry = cache.get(key)
+    if is_fresh(entry, version):
+        return entry['data'], 'HIT'
+
+    lock = lock_key(key)
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        try:
+            data = compute()
+            if data is not None:
+                store(key, data, version)
+        finally:
+            cache.delete(lock)
+        return data, 'MISS'
+
+    if entry is not None:
+        return entry['data'], 'STALE'
+
+    deadline = time.monotonic() + WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['data'], 'HIT'
+    # El otro worker tardó demasiado: se calcula sin guardar
+    return compute(), 'MISS'
+
+
+def cached_response(view):
+    """Cachea las respuestas 200 de una acción GET del viewset (header X-Cache)"""
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        if not is_enabled():
+            return view(self, request, *args, **kwargs)
+
+        responses = []
+
+        def compute():
+            response = view(self, request, *args, **kwargs)
+            responses.append(response)
+            return response.data if response.status_code == 200 else None
+
+        data, state = get_or_compute(make_key(view.__name__, request.query_params), compute)
+        response = responses[-1] if responses else Response(data)
+        response['X-Cache'] = state
+        return response
+    return wrapper
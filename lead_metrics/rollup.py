@@ -0,0 +1,252 @@
+import datetime
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from lead.models import Lead
+from lead_metrics.aggregates import daily_counts, date_range, day_bounds, status_counts
+from lead_metrics.models import LeadMetrics, LeadMetricsHourly, LeadMetricsSlice
+
+STATUS_FIELDS = [f'{value}_leads' for value, _ in Lead.STATUS_CHOICES]
+COUNT_FIELDS = ['total_leads', 'new_leads', *STATUS_FIELDS]
+# Columnas de LeadMetricsSlice y LeadMetricsHourly (ahí new_leads siempre sería igual a total_leads)
+SLICE_FIELDS = ['total_leads', *STATUS_FIELDS]
+
+
+def local_date(value):
+    return timezone.localtime(value).date()
+
+
+def local_hour(value):
+    """Inicio de la hora local de `value`"""
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def apply_deltas(deltas):
+    """
+    Aplica {(hora local, status, store_id, lead_type_id): +n/-n} con un UPDATE
+    por día en LeadMetrics y uno por tienda y tipo afectados en LeadMetricsSlice
+    y LeadMetricsHourly. Solo se ajustan días que ya existen en LeadMetrics: un
+    día sin fila todavía no se ha calculado y se calculará completo (desde
+    Lead) cuando se lea.
+    """
+    by_day = defaultdict(lambda: defaultdict(int))
+    by_slice = defaultdict(lambda: defaultdict(int))
+    by_hour = defaultdict(lambda: defaultdict(int))
+    for (hour, status, store_id, lead_type_id), delta in deltas.items():
+        if delta:
+            day = hour.date()
+            by_day[day]['new_leads'] += delta
+            for fields in (by_day[day], by_slice[(day, store_id, lead_type_id)],
+                           by_hour[(hour, store_id, lead_type_id)]):
+                fields['total_leads'] += delta
+                fields[f'{status}_leads'] += delta
+
+    for day, fields in by_day.items():
+        changes = {field: F(field) + delta for field, delta in fields.items() if delta}
+        days = LeadMetrics.objects.filter(date=day)
+        # Un cambio de tienda, tipo u hora dentro del mismo día no mueve los totales del día
+        if days.update(**changes) if changes else days.exists():
+            for (slice_day, store_id, lead_type_id), slice_fields in by_slice.items():
+                if slice_day == day:
+                    _apply_row(LeadMetricsSlice, {'date': day, 'store_id': store_id, 'lead_type_id': lead_type_id},
+                               slice_fields)
+            for (hour, store_id, lead_type_id), hour_fields in by_hour.items():
+                if hour.date() == day:
+                    _apply_row(LeadMetricsHourly, {'hour': hour, 'store_id': store_id, 'lead_type_id': lead_type_id},
+                               hour_fields)
+
+
+def _apply_row(model, lookup, fields):
+    changes = {field: F(field) + delta for field, delta in fields.items() if delta}
+    if not changes:
+        return
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    # Primera vez que la tienda y el tipo tienen leads ese día (u hora)
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **fields)
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**changes)
+
+
+def record_created(leads):
+    deltas = defaultdict(int)
+    for lead in leads:
+        deltas[(local_hour(lead.created_at), lead.status, lead.store_id, lead.lead_type_id)] += 1
+    apply_deltas(deltas)
+
+
+def record_change(before, after):
+    """before/after: (created_at, status, store_id, lead_type_id) o None (alta / baja)"""
+    deltas = defaultdict(int)
+    if before is not None:
+        deltas[(local_hour(before[0]), *before[1:])] -= 1
+    if after is not None:
+        deltas[(local_hour(after[0]), *after[1:])] += 1
+    apply_deltas(deltas)
+
+
+def record_status_changes(changes):
+    """changes de leads_status_changed: un UPDATE por día (y tienda/tipo) afectado, no por lead"""
+    deltas = defaultdict(int)
+    for change in changes:
+        key = (local_hour(change['created_at']), change['store_id'], change['lead_type_id'])
+        deltas[(key[0], change['from_status'], *key[1:])] -= 1
+        deltas[(key[0], change['to_status'], *key[1:])] += 1
+    apply_deltas(deltas)
+
+
+def record_store_moves(moves):
+    """moves de leads_moved: la tienda cambia, el día y el status no (solo se tocan slices y horas)"""
+    deltas = defaultdict(int)
+    for move in moves:
+        key = (local_hour(move['created_at']), move['status'])
+        deltas[(*key, move['from_store_id'], move['lead_type_id'])] -= 1
+        deltas[(*key, move['to_store_id'], move['lead_type_id'])] += 1
+    apply_deltas(deltas)
+
+
+def hour_counts(start_date, end_date):
+    """Conteos por (hora local, tienda, tipo) de los leads creados en el rango, en una sola consulta"""
+    start, end = day_bounds(start_date, end_date)
+    return (
+        Lead.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(hour=TruncHour('created_at'))
+        .values('hour', 'store_id', 'lead_type_id')
+        .annotate(total_leads=Count('id'), **status_counts())
+        .order_by()
+    )
+
+
+def _compute(start_date, end_date, skip=()):
+    """
+    Filas del rango para LeadMetrics (todos los días, con ceros),
+    LeadMetricsSlice y LeadMetricsHourly; las dos primeras se suman a partir
+    de las horas.
+    """
+    days = {day: dict.fromkeys(SLICE_FIELDS, 0) for day in date_range(start_date, end_date) if day not in skip}
+    slices = defaultdict(lambda: dict.fromkeys(SLICE_FIELDS, 0))
+    hours = []
+    for row in hour_counts(start_date, end_date):
+        hour = timezone.localtime(row.pop('hour'))
+        day = hour.date()
+        if day not in days:
+            continue
+        hours.append(LeadMetricsHourly(hour=hour, **row))
+        for counts in (days[day], slices[(day, row['store_id'], row['lead_type_id'])]):
+            for field in SLICE_FIELDS:
+                counts[field] += row[field]
+    metrics = [LeadMetrics(date=day, new_leads=counts['total_leads'], **counts) for day, counts in days.items()]
+    slices = [LeadMetricsSlice(date=day, store_id=store_id, lead_type_id=lead_type_id, **counts)
+              for (day, store_id, lead_type_id), counts in slices.items()]
+    return metrics, slices, hours
+
+
+def rebuild(start_date, end_date):
+    """Recalcula desde Lead las filas de [start_date, end_date] (reemplaza las existentes)"""
+    metrics, slices, hours = _compute(start_date, end_date)
+    start, end = day_bounds(start_date, end_date)
+    LeadMetrics.objects.filter(date__range=(start_date, end_date)).delete()
+    LeadMetricsSlice.objects.filter(date__range=(start_date, end_date)).delete()
+    LeadMetricsHourly.objects.filter(hour__gte=start, hour__lt=end).delete()
+    LeadMetrics.objects.bulk_create(metrics, batch_size=1000)
+    LeadMetricsSlice.objects.bulk_create(slices, batch_size=1000)
+    LeadMetricsHourly.objects.bulk_create(hours, batch_size=1000)
+    return len(metrics)
+
+
+def _insert(metrics, slices, hours):
+    with transaction.atomic():
+        LeadMetrics.objects.bulk_create(metrics, batch_size=1000, ignore_conflicts=True)
+        LeadMetricsSlice.objects.bulk_create(slices, batch_size=1000, ignore_conflicts=True)
+        LeadMetricsHourly.objects.bulk_create(hours, batch_size=1000, ignore_conflicts=True)
+
+
+def _recompute(days):
+    """
+    Vuelve a calcular desde Lead `days` (que ya tienen fila en LeadMetrics) con
+    esas filas bloqueadas: un delta de esos días espera al UPDATE de su fila y se
+    aplica sobre el recálculo. Las filas de LeadMetrics se actualizan en su lugar
+    (un UPDATE en espera no encontraría una fila borrada y recreada); slices y
+    horas se reemplazan, los deltas las tocan después de la fila del día.
+    """
+    with transaction.atomic():
+        rows = {row.date: row for row in LeadMetrics.objects.select_for_update().filter(date__in=days)}
+        skip = set(date_range(days[0], days[-1])) - set(rows)
+        metrics, slices, hours = _compute(days[0], days[-1], skip=skip)
+        for metric in metrics:
+            for field in COUNT_FIELDS:
+                setattr(rows[metric.date], field, getattr(metric, field))
+        LeadMetrics.objects.bulk_update(rows.values(), COUNT_FIELDS, batch_size=1000)
+        LeadMetricsSlice.objects.filter(date__in=rows).delete()
+        LeadMetricsHourly.objects.filter(hour__date__in=rows).delete()
+        LeadMetricsSlice.objects.bulk_create(slices, batch_size=1000)
+        LeadMetricsHourly.objects.bulk_create(hours, batch_size=1000)
+    return metrics
+
+
+def fill_missing(start_date, end_date, fields=COUNT_FIELDS):
+    """
+    Calcula y guarda (LeadMetrics, LeadMetricsSlice y LeadMetricsHourly) los días cerrados de
+    [start_date, end_date] que todavía no tienen fila. Regresa {fecha: fila}
+    de LeadMetrics con `fields`.
+
+    apply_deltas ignora los días sin fila, así que una escritura que llegue
+    entre el cálculo y el insert se perdería: tras insertar, los días se
+    recalculan con sus filas bloqueadas (ver _recompute).
+    """
+    stored = {row['date']: row for row in
+              LeadMetrics.objects.filter(date__range=(start_date, end_date)).values('date', *fields)}
+    missing = [day for day in date_range(start_date, end_date) if day not in stored]
+    if missing:
+        _insert(*_compute(missing[0], missing[-1], skip=stored))
+        metrics = _recompute(missing)
+        stored.update((row.date, {'date': row.date, **{field: getattr(row, field) for field in fields}})
+                      for row in metrics)
+    return stored
+
+
+def daily_series(start_date, end_date):
+    """
+    Conteos por día para [start_date, end_date]: los días cerrados salen de
+    LeadMetrics (los que falten se calculan una vez y se guardan) y solo el
+    día de hoy se calcula en vivo.
+    """
+    today = timezone.localdate()
+    closed_end = min(end_date, today - datetime.timedelta(days=1))
+
+    series = {}
+    if start_date <= closed_end:
+        series = fill_missing(start_date, closed_end)
+
+    if end_date >= today:
+        for row in daily_counts(max(start_date, today), end_date):
+            series[row['date']] = dict(row, new_leads=row['total_leads'])
+
+    return [series[day] for day in date_range(start_date, end_date)]
+
+
+def slice_totals(start_date, end_date, by=(), store_id=None, lead_type_id=None):
+    """
+    Suma de LeadMetricsSlice en [start_date, end_date] (días cerrados ya
+    calculados, ver fill_missing), filtrada por tienda / tipo y agrupada por
+    `by` ('date', 'store_id' y/o 'lead_type_id'). Con 'hour' en `by` se suma
+    LeadMetricsHourly. Con filtro solo se leen las filas de esa tienda o tipo.
+    Regresa {tupla con los valores de `by`: conteos}.
+    """
+    filters = {name: value for name, value in (('store_id', store_id), ('lead_type_id', lead_type_id))
+               if value is not None}
+    if 'hour' in by:
+        start, end = day_bounds(start_date, end_date)
+        queryset = LeadMetricsHourly.objects.filter(hour__gte=start, hour__lt=end, **filters)
+    else:
+        queryset = LeadMetricsSlice.objects.filter(date__range=(start_date, end_date), **filters)
+    aggregates = {f'sum_{field}': Sum(field) for field in SLICE_FIELDS}
+    rows = queryset.values(*by).annotate(**aggregates).order_by() if by else [queryset.aggregate(**aggregates)]
+    return {
+        tuple(row[name] for name in by): {field: row[f'sum_{field}'] or 0 for field in SLICE_FIELDS}
+        for row in rows
+    }
@@ -28,16 +28,45 @@ class LeadTypeMetricsSerializer(serializers.Serializer):
 class LeadTrendSerializer(serializers.Serializer):
     """Serializer para tendencias temporales"""
     date = serializers.DateField()
+    # Solo con granularity=hour: inicio de la hora local
+    hour = serializers.DateTimeField(required=False)
     new_leads = serializers.IntegerField()
     converted_leads = serializers.IntegerField()
     
 class LeadDailyMetricsSerializer(serializers.Serializer):
     """Serializer para métricas diarias"""
     date = serializers.DateField()
+    hour = serializers.DateTimeField(required=False)
     total_leads = serializers.IntegerField()
     new_leads = serializers.IntegerField()
     pending_leads = serializers.IntegerField()
     contacted_leads = serializers.IntegerField()
     discarded_leads = serializers.IntegerField()
     process_leads = serializers.IntegerField()
-    converted_leads = serializers.IntegerField() 
\ No newline at end of file
+    converted_leads = serializers.IntegerField() 
+
+class LeadVelocitySerializer(serializers.Serializer):
+    """Serializer para velocidad del funnel por tipo de lead"""
+    # Solo con group_by=store_id
+    store_id = serializers.IntegerField(required=False)
+    lead_type = serializers.IntegerField()
+    lead_type_name = serializers.CharField(allow_null=True)
+    to_status = serializers.CharField()
+    count = serializers.IntegerField()
+    median_seconds = serializers.IntegerField()
+    p90_seconds = serializers.IntegerField()
+
+class LeadUniqueEmailsBucketSerializer(serializers.Serializer):
+    """Serializer para emails únicos de un día, semana o mes"""
+    date = serializers.DateField()
+    unique_emails = serializers.IntegerField()
+    error_bound = serializers.IntegerField()
+
+class LeadUniqueEmailsSerializer(serializers.Serializer):
+    """Emails únicos estimados (HyperLogLog); error_bound es el margen con ~95% de confianza"""
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    unique_emails = serializers.IntegerField()
+    error_bound = serializers.IntegerField()
+    relative_error = serializers.FloatField()
+    series = LeadUniqueEmailsBucketSerializer(many=True)
@@ -0,0 +1,71 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from lead.models import Lead
+from lead.signals import leads_created, leads_moved, leads_status_changed
+from lead_metrics import counters, rollup
+
+
+def loaded_or_current(instance, name):
+    value = instance.loaded_value(name)
+    return getattr(instance, name) if value is None else value
+
+
+def loaded(instance):
+    """(created_at, status, store_id, lead_type_id) con que se leyó el lead; None si se desconoce"""
+    created_at = instance.loaded_value('created_at')
+    status = instance.loaded_value('status')
+    if created_at is None or status is None:
+        return None
+    return (created_at, status, loaded_or_current(instance, 'store_id'),
+            loaded_or_current(instance, 'lead_type_id'))
+
+
+@receiver(post_save, sender=Lead)
+def lead_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    after = (instance.created_at, instance.status, instance.store_id, instance.lead_type_id)
+    if created:
+        rollup.record_change(None, after)
+        counters.record_created([instance])
+        return
+    # Los cambios de status llegan por leads_status_changed; aquí solo cambios de fecha,
+    # tienda y tipo. Una instancia sin valores originales (p. ej. cargada con .only())
+    # no se puede comparar; esos casos los corrigen rebuild_lead_metrics y
+    # reconcile_lead_counters.
+    before = loaded(instance)
+    moved = (after[0], before[1], *after[2:]) if before is not None else None
+    if before is not None and moved != before:
+        rollup.record_change(before, moved)
+    status = loaded_or_current(instance, 'status')
+    counters.record_moved(
+        tuple(loaded_or_current(instance, name) for name in ('created_at', 'status', 'lead_type_id', 'store_id')),
+        (instance.created_at, status, instance.lead_type_id, instance.store_id),
+    )
+
+
+@receiver(leads_status_changed)
+def lead_status_changed(sender, changes, **kwargs):
+    rollup.record_status_changes(changes)
+    counters.record_status_changes(changes)
+
+
+@receiver(post_delete, sender=Lead)
+def lead_deleted(sender, instance, **kwargs):
+    before = loaded(instance)
+    if before is not None:
+        rollup.record_change(before, None)
+    counters.record_deleted(*(loaded_or_current(instance, name)
+                              for name in ('created_at', 'status', 'lead_type_id', 'store_id')))
+
+
+@receiver(leads_created)
+def bulk_leads_created(sender, leads, **kwargs):
+    rollup.record_created(leads)
+    counters.record_created(leads)
+
+
+@receiver(leads_moved)
+def bulk_leads_moved(sender, moves, **kwargs):
+    rollup.record_store_moves(moves)
+    counters.record_store_moves(moves)
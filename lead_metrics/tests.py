@@ -0,0 +1,866 @@
+import datetime
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from lead.models import Lead
+from django.db import transaction
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+from unittest import mock
+from lead_metrics.aggregates import MAX_DAYS, daily_counts, day_start
+from lead_metrics.counters import start_reconcile
+from lead.models import LeadStatusTransition
+from lead_metrics.models import LeadEmailSketch, LeadMetrics, LeadMetricsHourly, LeadMetricsSlice, LeadVelocityDaily
+from lead_metrics.velocity import bucket, bucket_value, percentile
+from lead_metrics.rollup import COUNT_FIELDS, SLICE_FIELDS, hour_counts
+from lead_type.models import LeadType
+from django.core.cache import cache
+from lead_metrics import counters, response_cache, rollup
+from app.hyperloglog import HyperLogLog, error_bound
+
+
+@override_settings(LEAD_METRICS_CACHE_TTL=0, SHARED_CACHE=True)
+class LeadMetricsTestCase(TestCase):
+
+    def setUp(self):
+        # Contadores y respuestas viven en el cache, que no se revierte entre tests
+        cache.clear()
+        # La reconciliación en segundo plano usaría otra conexión; los tests reconcilian explícitamente
+        patcher = mock.patch.object(counters, 'start_reconcile')
+        self.start_reconcile = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.counter = 0
+
+    def create_lead(self, created_at, status='pending'):
+        self.counter += 1
+        lead = Lead.objects.create(name=f'lead {self.counter}', email=f'lead{self.counter}@enid.com',
+                                   lead_type=self.lead_type, status=status)
+        Lead.objects.filter(id=lead.id).update(created_at=created_at)
+        return Lead.objects.get(id=lead.id)
+
+    def days_ago(self, days, hour=12):
+        day = timezone.localdate() - datetime.timedelta(days=days)
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time(hour)))
+
+
+class TestsLeadMetricsTrends(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = reverse('lead-metrics-trends')
+        self.create_lead(self.days_ago(0))
+        self.create_lead(self.days_ago(3), status='converted')
+        self.create_lead(self.days_ago(3))
+        self.create_lead(self.days_ago(10))
+        self.create_lead(self.days_ago(40))
+
+    def test_success_series_is_gap_filled(self):
+
+        response = self.client.get(self.api, {'days': 30})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 31)
+        self.assertEqual(response.data[0]['date'], str(timezone.localdate() - datetime.timedelta(days=30)))
+        by_date = {row['date']: row for row in response.data}
+        three_days_ago = by_date[str(timezone.localdate() - datetime.timedelta(days=3))]
+        self.assertEqual((three_days_ago['new_leads'], three_days_ago['converted_leads']), (2, 1))
+        self.assertEqual(sum(row['new_leads'] for row in response.data), 4)
+        self.assertEqual(by_date[str(timezone.localdate() - datetime.timedelta(days=5))]['new_leads'], 0)
+
+    def test_success_constant_queries(self):
+
+        # La primera lectura guarda los días cerrados en LeadMetrics
+        self.client.get(self.api, {'days': MAX_DAYS})
+
+        for days in (7, 365, MAX_DAYS):
+            with self.subTest(days=days):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(self.api, {'days': days})
+                self.assertEqual(len(response.data), days + 1)
+                # Rango de LeadMetrics + conteo en vivo de hoy
+                self.assertEqual(len(context.captured_queries), 2)
+
+    def test_error_days_out_of_range(self):
+
+        for days in ('abc', -1, MAX_DAYS + 1):
+            with self.subTest(days=days):
+                response = self.client.get(self.api, {'days': days})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(TIME_ZONE='America/Mexico_City')
+    def test_success_buckets_by_configured_timezone(self):
+
+        Lead.objects.all().delete()
+        # 23:30 en Ciudad de México de ayer ya es hoy en UTC
+        self.create_lead(self.days_ago(1, hour=23) + datetime.timedelta(minutes=30))
+
+        response = self.client.get(self.api, {'days': 1})
+
+        self.assertEqual([row['new_leads'] for row in response.data], [1, 0])
+
+
+class TestsLeadMetricsAggregates(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_lead(self.days_ago(0), status='converted')
+        self.create_lead(self.days_ago(0))
+        self.create_lead(self.days_ago(2), status='contacted')
+        self.create_lead(self.days_ago(10), status='discarded')
+        self.create_lead(self.days_ago(60), status='process')
+
+    def get(self, name, queries=1, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(f'lead-metrics-{name}'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(context.captured_queries), queries)
+        return response.data
+
+    def test_success_overview_from_counters(self):
+
+        # Ya reconciliados, overview no consulta Lead
+        counters.reconcile()
+        self.assertEqual(self.get('overview', queries=0), {
+            'total_leads': 5, 'new_leads_today': 2, 'new_leads_week': 3, 'new_leads_month': 4,
+            'conversion_rate': 20.0,
+        })
+
+    def test_success_daily_metrics_constant_queries(self):
+
+        self.client.get(reverse('lead-metrics-daily-metrics'), {'days': 2})
+        data = self.get('daily-metrics', queries=2, days=2)
+
+        self.assertEqual([row['date'] for row in data], [
+            str(timezone.localdate() - datetime.timedelta(days=days)) for days in (2, 1, 0)])
+        self.assertEqual(data[0]['contacted_leads'], 1)
+        self.assertEqual(data[1]['total_leads'], 0)
+        today = data[2]
+        self.assertEqual((today['total_leads'], today['new_leads'], today['pending_leads'],
+                          today['converted_leads']), (2, 2, 1, 1))
+
+    def test_success_conversion_funnel_from_counters(self):
+
+        counters.reconcile()
+        data = self.get('conversion-funnel', queries=0)
+
+        self.assertEqual((data['total_leads'], data['pending_leads'], data['contacted_leads'],
+                          data['process_leads'], data['converted_leads'], data['discarded_leads']),
+                         (5, 1, 1, 1, 1, 1))
+        self.assertEqual(data['converted_percentage'], 20.0)
+
+
+class TestsLeadMetricsRollup(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.old = self.create_lead(self.days_ago(5))
+        self.create_lead(self.days_ago(5), status='converted')
+        self.create_lead(self.days_ago(1))
+        self.start = timezone.localdate() - datetime.timedelta(days=10)
+        call_command('rebuild_lead_metrics', '--from', str(self.start), stdout=StringIO())
+
+    def assert_rollup_matches_leads(self):
+        expected = {row.pop('date'): dict(row, new_leads=row['total_leads'])
+                    for row in daily_counts(self.start, timezone.localdate())}
+        stored = {row.pop('date'): row for row in LeadMetrics.objects.values('date', *COUNT_FIELDS)}
+        self.assertEqual(stored, expected)
+
+    def assert_slices_match_leads(self):
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        expected_hours = {(row.pop('hour'), row.pop('store_id'), row.pop('lead_type_id')): row
+                          for row in hour_counts(self.start, yesterday)}
+        expected = {}
+        for (hour, store_id, lead_type_id), row in expected_hours.items():
+            counts = expected.setdefault((timezone.localtime(hour).date(), store_id, lead_type_id),
+                                         dict.fromkeys(SLICE_FIELDS, 0))
+            for field in SLICE_FIELDS:
+                counts[field] += row[field]
+
+        stored = {(row.pop('date'), row.pop('store_id'), row.pop('lead_type_id')): row
+                  for row in LeadMetricsSlice.objects.filter(date__lte=yesterday, total_leads__gt=0)
+                  .values('date', 'store_id', 'lead_type_id', *SLICE_FIELDS)}
+        stored_hours = {(row.pop('hour'), row.pop('store_id'), row.pop('lead_type_id')): row
+                        for row in LeadMetricsHourly.objects.filter(hour__lt=day_start(timezone.localdate()),
+                                                                    total_leads__gt=0)
+                        .values('hour', 'store_id', 'lead_type_id', *SLICE_FIELDS)}
+        self.assertEqual(stored, expected)
+        self.assertEqual(stored_hours, expected_hours)
+
+    def test_success_rebuild(self):
+
+        self.assertEqual(LeadMetrics.objects.count(), 11)
+        row = LeadMetrics.objects.get(date=timezone.localdate() - datetime.timedelta(days=5))
+        self.assertEqual((row.total_leads, row.pending_leads, row.converted_leads), (2, 1, 1))
+        self.assert_rollup_matches_leads()
+
+    def test_success_incremental_updates(self):
+
+        self.old.status = 'contacted'
+        self.old.save()
+        self.assert_rollup_matches_leads()
+
+        self.old.delete()
+        self.assert_rollup_matches_leads()
+
+        Lead.objects.create(name='hoy', email='hoy@enid.com', lead_type=self.lead_type)
+        headers = {'HTTP_X_STORE_ID': 1}
+        self.client.post(reverse('lead-existence'), {
+            'email': 'upsert@enid.com', 'name': 'upsert', 'lead_type': self.lead_type.id,
+        }, format='json', **headers)
+        self.client.post(reverse('lead-existence-batch'), [
+            {'email': 'batch@enid.com', 'name': 'batch', 'lead_type': self.lead_type.id},
+        ], format='json', **headers)
+        # Un lead existente (tryet + 1) no cuenta como alta
+        self.client.post(reverse('lead-existence'), {
+            'email': 'upsert@enid.com', 'name': 'upsert', 'lead_type': self.lead_type.id,
+        }, format='json', **headers)
+        self.assertEqual(LeadMetrics.objects.get(date=timezone.localdate()).total_leads, 3)
+        self.assert_rollup_matches_leads()
+
+        Lead.objects.all().set_status('discarded')
+        self.assert_rollup_matches_leads()
+
+    def test_success_slices_follow_leads(self):
+
+        self.assert_slices_match_leads()
+        other_type = LeadType.objects.create(name="Cotización")
+
+        lead = Lead.objects.get(id=self.old.id)
+        lead.store_id = 2
+        lead.lead_type = other_type
+        lead.status = 'contacted'
+        lead.save()
+        self.assert_slices_match_leads()
+
+        Lead.objects.filter(store_id=1).set_status('converted')
+        self.assert_slices_match_leads()
+
+        lead.delete()
+        self.assert_slices_match_leads()
+        self.assert_rollup_matches_leads()
+
+    def test_success_slices_follow_existence_store_moves(self):
+
+        self.assert_slices_match_leads()
+        second = Lead.objects.exclude(id=self.old.id).get(created_at=self.old.created_at)
+
+        # Un email existente con otra tienda: el upsert (y el bulk_update del lote) no pasan por save()
+        self.client.post(reverse('lead-existence'), {
+            'email': self.old.email, 'name': 'otra tienda', 'lead_type': self.lead_type.id,
+        }, format='json', HTTP_X_STORE_ID=2)
+        self.client.post(reverse('lead-existence-batch'), [
+            {'email': second.email, 'name': 'otra tienda', 'lead_type': self.lead_type.id},
+        ], format='json', HTTP_X_STORE_ID=3)
+
+        self.assertEqual(set(Lead.objects.filter(id__in=[self.old.id, second.id]).values_list('store_id', flat=True)),
+                         {2, 3})
+        five_days_ago = timezone.localdate() - datetime.timedelta(days=5)
+        stores = dict(LeadMetricsSlice.objects.filter(date=five_days_ago).values_list('store_id', 'total_leads'))
+        self.assertEqual(stores, {1: 0, 2: 1, 3: 1})
+        self.assert_slices_match_leads()
+        self.assert_rollup_matches_leads()
+
+    def test_success_closed_days_come_from_rollup(self):
+
+        five_days_ago = timezone.localdate() - datetime.timedelta(days=5)
+        LeadMetrics.objects.filter(date=five_days_ago).update(total_leads=99)
+        self.create_lead(timezone.now())
+
+        data = {row['date']: row for row in self.client.get(reverse('lead-metrics-trends'), {'days': 5}).data}
+
+        self.assertEqual(data[str(five_days_ago)]['new_leads'], 99)
+        self.assertEqual(data[str(timezone.localdate())]['new_leads'], 1)
+
+    def test_success_missing_days_are_filled(self):
+
+        LeadMetrics.objects.all().delete()
+
+        self.client.get(reverse('lead-metrics-daily-metrics'), {'days': 10})
+
+        self.assertEqual(LeadMetrics.objects.count(), 10)
+        self.assertFalse(LeadMetrics.objects.filter(date=timezone.localdate()).exists())
+
+    def test_success_write_during_fill_is_not_lost(self):
+
+        LeadMetrics.objects.all().delete()
+        LeadMetricsSlice.objects.all().delete()
+        LeadMetricsHourly.objects.all().delete()
+        compute = rollup._compute
+        calls = []
+
+        def compute_then_write(*args, **kwargs):
+            # El status cambia después de leer Lead y antes del insert: su delta no encuentra fila
+            result = compute(*args, **kwargs)
+            if not calls:
+                Lead.objects.filter(id=self.old.id).set_status('converted')
+            calls.append(args)
+            return result
+
+        with mock.patch('lead_metrics.rollup._compute', compute_then_write):
+            rollup.fill_missing(self.start, timezone.localdate() - datetime.timedelta(days=1))
+
+        row = LeadMetrics.objects.get(date=timezone.localdate() - datetime.timedelta(days=5))
+        self.assertEqual((row.total_leads, row.pending_leads, row.converted_leads), (2, 0, 2))
+        self.assert_slices_match_leads()
+
+
+class TestsLeadMetricsGranularity(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = reverse('lead-metrics-trends')
+        self.create_lead(self.days_ago(2, hour=9))
+        self.create_lead(self.days_ago(2, hour=9), status='converted')
+        self.create_lead(self.days_ago(2, hour=15))
+        self.create_lead(self.days_ago(40))
+        self.create_lead(timezone.localtime().replace(minute=0, second=0, microsecond=0))
+
+    def get(self, **params):
+        response = self.client.get(self.api, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_success_week_and_month_buckets(self):
+
+        for granularity, start in (('week', lambda day: day - datetime.timedelta(days=day.weekday())),
+                                   ('month', lambda day: day.replace(day=1))):
+            data = self.get(days=60, granularity=granularity)
+
+            dates = [datetime.date.fromisoformat(row['date']) for row in data]
+            self.assertEqual(dates, sorted(set(start(day) for day in dates)))
+            self.assertEqual(dates[-1], start(timezone.localdate()))
+            self.assertEqual(sum(row['new_leads'] for row in data), 5)
+            self.assertEqual(sum(row['converted_leads'] for row in data), 1)
+
+    def test_success_hourly_series(self):
+
+        for params in ({}, {'store_id': 1}, {'group_by': 'store_id'}):
+            data = self.get(days=2, granularity='hour', **params)
+            rows = data[0]['trends'] if 'group_by' in params else data
+
+            self.assertEqual(len(rows), 3 * 24)
+            counts = {timezone.localtime(datetime.datetime.fromisoformat(row['hour'])).hour: row['new_leads']
+                      for row in rows[:24] if row['new_leads']}
+            self.assertEqual(counts, {9: 2, 15: 1})
+            self.assertEqual(sum(row['new_leads'] for row in rows[48:]), 1)
+            self.assertEqual(rows[0]['date'], str(timezone.localdate() - datetime.timedelta(days=2)))
+
+        # Los días cerrados se leen de LeadMetricsHourly
+        LeadMetricsHourly.objects.update(total_leads=F('total_leads') * 10)
+        rows = self.get(days=2, granularity='hour')
+        self.assertEqual(sum(row['new_leads'] for row in rows[:24]), 30)
+
+    def test_success_daily_metrics_granularity(self):
+
+        response = self.client.get(reverse('lead-metrics-daily-metrics'), {'days': 2, 'granularity': 'hour'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum(row['pending_leads'] for row in response.data), 3)
+
+    def test_error_invalid_granularity(self):
+
+        for params in ({'granularity': 'year'}, {'granularity': 'hour', 'days': 90}):
+            response = self.client.get(self.api, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class TestsLeadMetricsUniqueEmails(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = reverse('lead-metrics-unique-emails')
+        # El mismo email (normalizado) en dos tipos de lead y en dos días cuenta una vez
+        other_type = LeadType.objects.create(name="Cotización")
+        third_type = LeadType.objects.create(name="Soporte")
+        for days, email, lead_type in ((3, 'ana@enid.com', self.lead_type), (3, 'ANA@enid.com', other_type),
+                                       (2, 'ana@enid.com', third_type), (2, 'beto@enid.com', self.lead_type),
+                                       (0, 'carla@enid.com', self.lead_type)):
+            lead = Lead.objects.create(name=email, email=email, lead_type=lead_type)
+            Lead.objects.filter(id=lead.id).update(created_at=self.days_ago(days))
+
+    def test_success_estimate_and_series(self):
+
+        response = self.client.get(self.api, {'days': 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['unique_emails'], 3)
+        self.assertGreaterEqual(response.data['error_bound'], 0)
+        self.assertEqual([row['unique_emails'] for row in response.data['series']], [1, 2, 0, 1])
+
+    def test_success_counts_leads_before_backfill(self):
+
+        # Filas previas a email_normalized (sin backfill todavía) cuentan igual
+        Lead.objects.update(email_normalized=None)
+
+        response = self.client.get(self.api, {'days': 3})
+
+        self.assertEqual(response.data['unique_emails'], 3)
+        self.assertEqual([row['unique_emails'] for row in response.data['series']], [1, 2, 0, 1])
+
+    def test_success_closed_days_come_from_sketches(self):
+
+        self.client.get(self.api, {'days': 3})
+        self.assertEqual(LeadEmailSketch.objects.count(), 3)
+        self.assertFalse(LeadEmailSketch.objects.filter(date=timezone.localdate()).exists())
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.api, {'days': 3, 'granularity': 'week'})
+        # Sketches guardados + emails de hoy
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertEqual(len(response.data['series']), len({
+            day - datetime.timedelta(days=day.weekday())
+            for day in (timezone.localdate() - datetime.timedelta(days=offset) for offset in range(4))}))
+
+    def test_success_error_is_bounded(self):
+
+        sketch = HyperLogLog()
+        sketch.update(f'lead{number}@enid.com' for number in range(20000))
+        estimate = sketch.estimate()
+        self.assertLessEqual(abs(estimate - 20000), error_bound(20000))
+
+        merged = HyperLogLog.merge([HyperLogLog.from_bytes(sketch.to_bytes()), sketch])
+        self.assertEqual(merged.estimate(), estimate)
+
+    def test_error_invalid_params(self):
+
+        for params in ({'store_id': 1}, {'granularity': 'hour'}, {'days': 'x'}):
+            response = self.client.get(self.api, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class TestsLeadMetricsVelocity(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = reverse('lead-metrics-velocity')
+        self.lead = self.create_lead(self.days_ago(20))
+        self.other_type = LeadType.objects.create(name="Cotización")
+        # Contactados a 1..10 horas de creados, hace 3 días; uno convertido hoy
+        for hours in range(1, 11):
+            self.transition('contacted', hours * 3600, self.days_ago(3))
+        self.transition('converted', 86400, timezone.now())
+        self.transition('contacted', 60, self.days_ago(2), lead_type=self.other_type)
+
+    def transition(self, to_status, seconds, changed_at, lead_type=None):
+        LeadStatusTransition.objects.create(
+            lead=self.lead, lead_type=lead_type or self.lead_type, from_status='pending', to_status=to_status,
+            changed_at=changed_at, seconds_since_created=seconds)
+
+    def test_success_percentiles_are_approximate(self):
+
+        histogram = {bucket(seconds): 1 for seconds in (100, 1000, 10000)}
+        self.assertAlmostEqual(percentile(histogram, 0.5), 1000, delta=50)
+        self.assertAlmostEqual(bucket_value(bucket(3600)), 3600, delta=3600 * 0.05)
+
+    def test_success_velocity_by_type_and_status(self):
+
+        response = self.client.get(self.api, {'days': 7})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        by_key = {(row['lead_type'], row['to_status']): row for row in response.data}
+        contacted = by_key[(self.lead_type.id, 'contacted')]
+        self.assertEqual(contacted['count'], 10)
+        self.assertEqual(contacted['lead_type_name'], 'En intento de compra')
+        self.assertAlmostEqual(contacted['median_seconds'], 5 * 3600, delta=5 * 3600 * 0.05)
+        self.assertAlmostEqual(contacted['p90_seconds'], 9 * 3600, delta=9 * 3600 * 0.05)
+        self.assertEqual(by_key[(self.lead_type.id, 'converted')]['count'], 1)
+        self.assertEqual(by_key[(self.other_type.id, 'contacted')]['count'], 1)
+
+        filtered = self.client.get(self.api, {'days': 7, 'lead_type': self.other_type.id})
+        self.assertEqual([row['lead_type'] for row in filtered.data], [self.other_type.id])
+
+    def test_success_velocity_by_store(self):
+
+        LeadStatusTransition.objects.filter(to_status='converted').update(store_id=2)
+
+        filtered = self.client.get(self.api, {'days': 7, 'store_id': 2})
+        self.assertEqual([(row['to_status'], row['count']) for row in filtered.data], [('converted', 1)])
+
+        grouped = self.client.get(self.api, {'days': 7, 'group_by': 'store_id'})
+        by_key = {(row['store_id'], row['lead_type'], row['to_status']): row['count'] for row in grouped.data}
+        self.assertEqual(by_key, {(1, self.lead_type.id, 'contacted'): 10, (2, self.lead_type.id, 'converted'): 1,
+                                  (1, self.other_type.id, 'contacted'): 1})
+
+    def test_success_closed_days_rollup(self):
+
+        self.client.get(self.api, {'days': 7})
+        self.assertEqual(LeadVelocityDaily.objects.count(), 7)
+        self.assertFalse(LeadVelocityDaily.objects.filter(date=timezone.localdate()).exists())
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.api, {'days': 7})
+        # Rango del rollup + bitácora de hoy
+        self.assertEqual(len(context.captured_queries), 2)
+
+    def test_success_transitions_from_status_changes(self):
+
+        LeadStatusTransition.objects.all().delete()
+        lead = Lead.objects.get(id=self.lead.id)
+        lead.status = 'contacted'
+        lead.save()
+
+        response = self.client.get(self.api, {'days': 0})
+
+        self.assertEqual([(row['to_status'], row['count']) for row in response.data], [('contacted', 1)])
+        self.assertAlmostEqual(response.data[0]['median_seconds'], 20 * 86400, delta=20 * 86400 * 0.05)
+
+
+@override_settings(LEAD_METRICS_CACHE_TTL=10, LEAD_METRICS_CACHE_STALE_TTL=60)
+class TestsLeadMetricsResponseCache(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = reverse('lead-metrics-overview')
+        self.create_lead(self.days_ago(0))
+
+    def key(self, endpoint='overview', **params):
+        request = APIClient().get('/', params).wsgi_request
+        return response_cache.make_key(endpoint, request.GET)
+
+    def test_success_hit_after_miss(self):
+
+        first = self.client.get(self.api)
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(self.api)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(second.data, first.data)
+
+    def test_success_keys_by_params(self):
+
+        self.client.get(reverse('lead-metrics-trends'), {'days': 7})
+        self.assertEqual(self.client.get(reverse('lead-metrics-trends'), {'days': 14})['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(reverse('lead-metrics-trends'), {'days': 7})['X-Cache'], 'HIT')
+        self.assertEqual(self.key('trends', days=7, a=1), self.key('trends', a=1, days=7))
+
+    @override_settings(SHARED_CACHE=False)
+    def test_success_disabled_without_shared_cache(self):
+
+        self.client.get(self.api)
+        self.assertNotIn('X-Cache', self.client.get(self.api))
+
+    def test_success_lead_write_invalidates(self):
+
+        self.client.get(self.api)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_lead(self.days_ago(0))
+
+        response = self.client.get(self.api)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['total_leads'], 2)
+
+    def test_success_stale_while_another_worker_recomputes(self):
+
+        self.client.get(self.api)
+        self.create_lead(self.days_ago(0))
+        # Otro worker tiene el candado de recálculo
+        cache.add(response_cache.lock_key(self.key()), 1, 30)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.api)
+
+        self.assertEqual(response['X-Cache'], 'STALE')
+        self.assertEqual(response.data['total_leads'], 1)
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_success_errors_are_not_cached(self):
+
+        api = reverse('lead-metrics-velocity')
+        self.assertEqual(self.client.get(api, {'lead_type': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsNone(cache.get(self.key('velocity', lead_type='x')))
+        self.assertIsNone(cache.get(response_cache.lock_key(self.key('velocity', lead_type='x'))))
+
+
+class TestsLeadMetricsCounters(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_type = LeadType.objects.create(name="Cotización")
+        self.lead = Lead.objects.create(name='lead', email='lead@enid.com', lead_type=self.lead_type)
+        counters.reconcile()
+
+    def counts(self, *names):
+        with CaptureQueriesContext(connection) as context:
+            values = counters.read(names)
+        self.assertEqual(len(context.captured_queries), 0)
+        return [values[name] for name in names]
+
+    def assert_counters_match_leads(self):
+        expected = counters.count_from_leads()
+        self.assertEqual(counters.read(list(expected)), dict(expected))
+
+    def test_success_create_and_delete(self):
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lead = Lead.objects.create(name='nuevo', email='nuevo@enid.com', lead_type=self.other_type, store_id=7)
+        names = [counters.TOTAL, counters.day_name(timezone.localdate()), counters.status_name('pending'),
+                 counters.type_name(self.other_type.id), counters.store_name(7),
+                 counters.store_name(7, counters.status_name('pending'))]
+        self.assertEqual(self.counts(*names), [2, 2, 2, 1, 1, 1])
+        self.assert_counters_match_leads()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Lead.objects.get(id=lead.id).delete()
+        self.assertEqual(self.counts(*names), [1, 1, 1, 0, 0, 0])
+
+    def test_success_status_changes(self):
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('lead-detail', args=[self.lead.id]), {'status': 'contacted'},
+                                         format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.counts(counters.status_name('pending'), counters.status_name('contacted')), [0, 1])
+        self.assert_counters_match_leads()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Lead.objects.all().set_status('converted')
+        response = self.client.get(reverse('lead-metrics-by-status'))
+        self.assertEqual([(row['status'], row['count']) for row in response.data], [('converted', 1)])
+
+    def test_success_type_moves(self):
+
+        lead = Lead.objects.get(id=self.lead.id)
+        lead.lead_type = self.other_type
+        lead.store_id = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            lead.save()
+
+        self.assertEqual(self.counts(counters.type_name(self.lead_type.id), counters.type_name(self.other_type.id),
+                                     counters.TOTAL, counters.store_name(1), counters.store_name(3)),
+                         [0, 1, 1, 0, 1])
+        self.assert_counters_match_leads()
+
+    def test_success_store_and_status_change_in_one_save(self):
+
+        lead = Lead.objects.get(id=self.lead.id)
+        lead.store_id = 3
+        lead.status = 'contacted'
+        with self.captureOnCommitCallbacks(execute=True):
+            lead.save()
+
+        self.assertEqual(self.counts(counters.store_name(1, counters.status_name('pending')),
+                                     counters.store_name(3, counters.status_name('contacted'))), [0, 1])
+        self.assert_counters_match_leads()
+
+    def test_success_existence_store_moves(self):
+
+        # upsert y existence/batch no pasan por save(): la tienda cambia por leads_moved
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('lead-existence'), {
+                'email': self.lead.email, 'name': 'otra tienda', 'lead_type': self.lead_type.id,
+            }, format='json', HTTP_X_STORE_ID=2)
+        self.assertEqual(self.counts(counters.store_name(1), counters.store_name(2)), [0, 1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('lead-existence-batch'), [
+                {'email': self.lead.email, 'name': 'otra tienda', 'lead_type': self.lead_type.id},
+            ], format='json', HTTP_X_STORE_ID=3)
+        self.assertEqual(self.counts(counters.store_name(2), counters.store_name(3)), [0, 1])
+        self.assert_counters_match_leads()
+
+    def test_success_reconcile_zeroes_stores_without_leads(self):
+
+        Lead.objects.filter(id=self.lead.id).update(store_id=4)
+        counters.reconcile()
+        Lead.objects.filter(id=self.lead.id).update(store_id=5)
+
+        counters.reconcile()
+
+        self.assertEqual(self.counts(counters.store_name(4), counters.store_name(5)), [0, 1])
+
+    def test_success_rolled_back_write_is_not_counted(self):
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Lead.objects.create(name='x', email='x@enid.com', lead_type=self.lead_type)
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.counts(counters.TOTAL), [1])
+
+    def test_success_reconcile_command_fixes_drift(self):
+
+        cache.set(counters.COUNTER_KEY.format(counters.TOTAL), 40, None)
+        out = StringIO()
+
+        call_command('reconcile_lead_counters', stdout=out)
+
+        self.assertIn('total: 40 -> 1', out.getvalue())
+        self.assertEqual(self.counts(counters.TOTAL), [1])
+
+    def test_success_read_does_not_reconcile_inline(self):
+
+        cache.delete(counters.RECONCILED_KEY)
+        with CaptureQueriesContext(connection) as context:
+            self.assertIsNone(counters.read([counters.TOTAL]))
+        self.assertEqual(len(context.captured_queries), 0)
+        self.start_reconcile.assert_called_once_with()
+
+    def test_success_background_reconcile_runs_once(self):
+
+        cache.delete(counters.RECONCILED_KEY)
+        cache.set(counters.COUNTER_KEY.format(counters.TOTAL), 40, None)
+        with mock.patch.object(counters.threading, 'Thread') as thread:
+            start_reconcile()
+            start_reconcile()
+        thread.assert_called_once_with(target=counters.run_reconcile, name='lead-counters-reconcile', daemon=True)
+
+        # El hilo reconcilia y libera el candado
+        counters.run_reconcile()
+        self.assertIsNone(cache.get(counters.RECONCILING_KEY))
+        self.assertIsNotNone(cache.get(counters.RECONCILED_KEY))
+        self.assertEqual(self.counts(counters.TOTAL), [1])
+
+    @override_settings(SHARED_CACHE=False)
+    def test_success_disabled_without_shared_cache(self):
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Lead.objects.create(name='x', email='x@enid.com', lead_type=self.lead_type)
+        self.assertEqual(self.counts(counters.TOTAL), [1])
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_lead_counters', stdout=StringIO())
+
+
+class TestsLeadMetricsDashboard(LeadMetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = reverse('lead-metrics-dashboard')
+        self.other_type = LeadType.objects.create(name="Cotización")
+        self.create_lead(self.days_ago(0), status='converted')
+        self.create_lead(self.days_ago(2))
+        lead = self.create_lead(self.days_ago(40))
+        Lead.objects.filter(id=lead.id).update(store_id=2, lead_type=self.other_type)
+
+    def get(self, queries=None, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.api, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        if queries is not None:
+            self.assertEqual(len(context.captured_queries), queries)
+        return response.data
+
+    def test_success_matches_individual_endpoints(self):
+
+        data = self.get()
+
+        self.assertEqual(list(data), ['overview', 'by_status', 'by_type', 'trends', 'daily_metrics',
+                                      'recent_activity', 'conversion_funnel'])
+        for name, url in [('overview', 'overview'), ('by_status', 'by-status'), ('by_type', 'by-type'),
+                          ('trends', 'trends'), ('daily_metrics', 'daily-metrics'),
+                          ('recent_activity', 'recent-activity'), ('conversion_funnel', 'conversion-funnel')]:
+            self.assertEqual(data[name], self.client.get(reverse(f'lead-metrics-{url}')).data, name)
+
+    def test_success_widgets_subset(self):
+
+        data = self.get(widgets='overview,by-status')
+
+        self.assertEqual(list(data), ['overview', 'by_status'])
+        self.assertEqual(data['overview']['total_leads'], 3)
+
+    def test_success_unfiltered_uses_counters_and_rollup(self):
+
+        counters.reconcile()
+        self.get()
+        # Rollup (días cerrados + hoy) y recent_activity; los conteos salen del cache
+        self.get(queries=3)
+
+    def test_success_rollup_until_counters_are_reconciled(self):
+
+        # Cache vacío: el request no cuenta Lead para reconciliar, responde con el rollup
+        data = self.get(widgets='overview,by_status')
+
+        self.start_reconcile.assert_called_once_with()
+        self.assertIsNone(cache.get(counters.RECONCILED_KEY))
+        self.assertEqual(data['overview']['total_leads'], 3)
+        self.assertEqual(data['overview']['new_leads_today'], 1)
+        self.assertEqual([(row['status'], row['count']) for row in data['by_status']],
+                         [('pending', 2), ('converted', 1)])
+
+    @override_settings(SHARED_CACHE=False)
+    def test_success_unfiltered_without_shared_cache_uses_rollup(self):
+
+        cache.delete(counters.RECONCILED_KEY)
+        data = self.get()
+
+        self.assertIsNone(cache.get(counters.RECONCILED_KEY))
+        self.assertEqual(data['overview']['total_leads'], 3)
+        self.assertEqual(data['by_status'], self.client.get(reverse('lead-metrics-by-status')).data)
+
+    def test_success_store_filter_uses_store_counters(self):
+
+        rollup_data = self.get(widgets='overview,by_status,conversion_funnel', store_id=1)
+        counters.reconcile()
+
+        data = self.get(queries=0, widgets='overview,by_status,conversion_funnel', store_id=1)
+
+        self.assertEqual(data, rollup_data)
+        self.assertEqual(data['overview']['total_leads'], 2)
+        self.assertEqual(data['overview']['new_leads_today'], 1)
+        self.assertEqual(self.client.get(reverse('lead-metrics-by-status'), {'store_id': 2}).data,
+                         [{'status': 'pending', 'count': 1, 'percentage': 100.0}])
+
+    def test_success_filtered_shared_pass(self):
+
+        self.get(store_id=1)
+        # Rango de leads, días cerrados faltantes, slices por tipo, por día (new_leads_*), series,
+        # hoy y recent_activity: constante sin importar cuántos leads o días haya
+        data = self.get(queries=7, store_id=1, days=3)
+
+        self.assertEqual(data['overview']['total_leads'], 2)
+        self.assertEqual(data['overview']['conversion_rate'], 50.0)
+        self.assertEqual([row['lead_type'] for row in data['by_type']], ['En intento de compra'])
+        self.assertEqual([row['new_leads'] for row in data['trends']], [0, 1, 0, 1])
+        self.assertEqual(len(data['recent_activity']), 2)
+
+    def test_success_group_by_store(self):
+
+        data = self.get(widgets='overview,by_type,trends,recent_activity', group_by='store_id', days=3)
+
+        by_store = {row['store_id']: row for row in data}
+        self.assertEqual(list(by_store), [1, 2])
+        self.assertEqual(by_store[1]['overview']['total_leads'], 2)
+        self.assertEqual(by_store[2]['overview']['total_leads'], 1)
+        self.assertEqual([row['lead_type'] for row in by_store[2]['by_type']], ['Cotización'])
+        self.assertEqual([row['new_leads'] for row in by_store[1]['trends']], [0, 1, 0, 1])
+        self.assertEqual([row['new_leads'] for row in by_store[2]['trends']], [0, 0, 0, 0])
+        self.assertEqual(len(by_store[1]['recent_activity']), 2)
+        self.assertEqual(len(by_store[2]['recent_activity']), 1)
+
+    def test_success_group_by_on_single_endpoint(self):
+
+        response = self.client.get(reverse('lead-metrics-overview'), {'group_by': 'lead_type'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        by_type = {row['lead_type']: row['overview']['total_leads'] for row in response.data}
+        self.assertEqual(by_type, {self.lead_type.id: 2, self.other_type.id: 1})
+
+    def test_success_date_range_and_lead_type(self):
+
+        since = str(timezone.localdate() - datetime.timedelta(days=45))
+        until = str(timezone.localdate() - datetime.timedelta(days=30))
+        data = self.get(widgets='overview,daily_metrics', date_from=since, date_to=until, lead_type=self.other_type.id)
+
+        self.assertEqual(data['overview']['total_leads'], 1)
+        self.assertEqual(len(data['daily_metrics']), 16)
+        self.assertEqual(sum(row['total_leads'] for row in data['daily_metrics']), 1)
+
+    def test_error_invalid_params(self):
+
+        for params in ({'widgets': 'overview,nada'}, {'store_id': 'x'}, {'group_by': 'email'},
+                       {'date_from': '2025-13-01'},
+                       {'date_from': '2025-02-01', 'date_to': '2025-01-01'}):
+            response = self.client.get(self.api, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
@@ -0,0 +1,108 @@
+import datetime
+import math
+from collections import defaultdict
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from lead.models import Lead, LeadStatusTransition
+from lead_metrics.aggregates import date_range, day_bounds
+from lead_metrics.models import LeadVelocityDaily
+
+# Cada bucket cubre un 10% más que el anterior: el percentil reportado tiene a lo más ~5% de error
+GROWTH = 1.1
+TARGET_STATUSES = [value for value, _ in Lead.STATUS_CHOICES if value != 'pending']
+PERCENTILES = {'median_seconds': 0.5, 'p90_seconds': 0.9}
+
+
+def bucket(seconds):
+    return int(math.log(seconds + 1, GROWTH))
+
+
+def bucket_value(index):
+    """Punto medio geométrico del bucket, en segundos"""
+    return round(GROWTH ** (index + 0.5) - 1)
+
+
+def percentile(histogram, fraction):
+    total = sum(histogram.values())
+    rank = max(1, math.ceil(total * fraction))
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= rank:
+            return bucket_value(index)
+    return None
+
+
+def histograms_by_day(start_date, end_date):
+    """{fecha: {'tienda:tipo:status': {bucket: n}}} leyendo la bitácora del rango"""
+    start, end = day_bounds(start_date, end_date)
+    rows = (
+        LeadStatusTransition.objects
+        .filter(to_status__in=TARGET_STATUSES, changed_at__gte=start, changed_at__lt=end)
+        .annotate(day=TruncDate('changed_at'))
+        .values_list('day', 'store_id', 'lead_type_id', 'to_status', 'seconds_since_created')
+        .order_by()
+    )
+    days = {day: defaultdict(lambda: defaultdict(int)) for day in date_range(start_date, end_date)}
+    for day, store_id, lead_type_id, to_status, seconds in rows.iterator(chunk_size=5000):
+        days[day][f'{store_id}:{lead_type_id}:{to_status}'][str(bucket(seconds))] += 1
+    return {day: {key: dict(counts) for key, counts in histograms.items()} for day, histograms in days.items()}
+
+
+def daily_histograms(start_date, end_date):
+    """
+    Histogramas por día para [start_date, end_date]: los días cerrados salen de
+    LeadVelocityDaily (los que falten se calculan una vez y se guardan) y hoy se
+    calcula en vivo.
+    """
+    today = timezone.localdate()
+    closed_end = min(end_date, today - datetime.timedelta(days=1))
+
+    days = {}
+    if start_date <= closed_end:
+        days = dict(LeadVelocityDaily.objects.filter(date__range=(start_date, closed_end))
+                    .values_list('date', 'histograms'))
+        missing = [day for day in date_range(start_date, closed_end) if day not in days]
+        if missing:
+            computed = {day: histograms for day, histograms in histograms_by_day(missing[0], missing[-1]).items()
+                        if day not in days}
+            LeadVelocityDaily.objects.bulk_create(
+                [LeadVelocityDaily(date=day, histograms=histograms) for day, histograms in computed.items()],
+                batch_size=500, ignore_conflicts=True)
+            days.update(computed)
+
+    if end_date >= today:
+        days.update(histograms_by_day(max(start_date, today), end_date))
+    return [days[day] for day in date_range(start_date, end_date)]
+
+
+def velocity(start_date, end_date, lead_type_id=None, store_id=None, group_by_store=False):
+    """
+    Conteo, mediana y p90 (segundos desde la creación) por tipo de lead y status
+    destino (y por tienda con group_by_store). Los histogramas de distintos días
+    y tiendas se suman antes de calcular los percentiles.
+    """
+    merged = defaultdict(lambda: defaultdict(int))
+    for histograms in daily_histograms(start_date, end_date):
+        for key, counts in histograms.items():
+            key_store, key_type, to_status = key.split(':', 2)
+            key_store, key_type = int(key_store), int(key_type)
+            if lead_type_id is not None and key_type != lead_type_id:
+                continue
+            if store_id is not None and key_store != store_id:
+                continue
+            group = (key_store if group_by_store else None, key_type, to_status)
+            for index, count in counts.items():
+                merged[group][int(index)] += count
+
+    results = []
+    for (key_store, key_type, to_status), histogram in merged.items():
+        result = {'lead_type': key_type, 'to_status': to_status, 'count': sum(histogram.values())}
+        if group_by_store:
+            result['store_id'] = key_store
+        for name, fraction in PERCENTILES.items():
+            result[name] = percentile(histogram, fraction)
+        results.append(result)
+    results.sort(key=lambda result: (result.get('store_id', 0), result['lead_type'],
+                                     TARGET_STATUSES.index(result['to_status'])))
+    return results
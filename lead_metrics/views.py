@@ -1,215 +1,131 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Count, Q
-from django.utils import timezone
-from datetime import datetime, timedelta
-from lead.models import Lead
-from lead_type.models import LeadType
-from lead_metrics.serializers import (
-    LeadMetricsSerializer,
-    LeadStatusMetricsSerializer,
-    LeadTypeMetricsSerializer,
-    LeadTrendSerializer,
-    LeadDailyMetricsSerializer
-)
+from lead_type.registry import lead_types
+from lead_metrics.dashboard import LeadDashboard, LeadFilters, parse_widgets
+from lead_metrics.velocity import velocity
+from lead_metrics.uniques import unique_emails
+from lead_metrics.response_cache import cached_response
+from lead_metrics.serializers import LeadUniqueEmailsSerializer, LeadVelocitySerializer
 
 class LeadMetricsViewSet(viewsets.ViewSet):
     """
     ViewSet para métricas de leads para dashboards
+
+    Las respuestas se cachean por endpoint y parámetros (ver response_cache):
+    LEAD_METRICS_CACHE_TTL segundos, o hasta la siguiente escritura de leads.
+    Todos los endpoints aceptan los filtros de LeadFilters (date_from, date_to,
+    days, store_id, lead_type) y group_by=store_id|lead_type; las series
+    (trends, daily-metrics) además granularity=hour|day|week|month.
     """
+
+    def widget(self, request, name):
+        filters = LeadFilters.from_params(request.query_params)
+        data = LeadDashboard(filters, [name]).build()
+        # Con group_by: [{<dimensión>: valor, <widget>: datos}, ...]
+        return Response(data if filters.group_by else data[name])
+
+    @action(detail=False, methods=['get'], url_path='dashboard')
+    @cached_response
+    def dashboard(self, request):
+        """
+        Varios widgets en una sola respuesta ({widget: datos}) con filtros compartidos:
+        ?widgets=overview,by-status,trends&date_from=&date_to=&store_id=&lead_type=
+        """
+        widgets = parse_widgets(request.query_params.get('widgets'))
+        dashboard = LeadDashboard(LeadFilters.from_params(request.query_params), widgets)
+        return Response(dashboard.build())
     
     @action(detail=False, methods=['get'], url_path='overview')
+    @cached_response
     def overview(self, request):
         """
         Obtiene métricas generales de leads para dashboard principal
         """
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        # Métricas básicas
-        total_leads = Lead.objects.count()
-        new_leads_today = Lead.objects.filter(created_at__date=today).count()
-        new_leads_week = Lead.objects.filter(created_at__date__gte=week_ago).count()
-        new_leads_month = Lead.objects.filter(created_at__date__gte=month_ago).count()
-        
-        # Tasa de conversión (convertidos / total)
-        converted_leads = Lead.objects.filter(status='converted').count()
-        conversion_rate = (converted_leads / total_leads * 100) if total_leads > 0 else 0
-        
-        data = {
-            'total_leads': total_leads,
-            'new_leads_today': new_leads_today,
-            'new_leads_week': new_leads_week,
-            'new_leads_month': new_leads_month,
-            'conversion_rate': round(conversion_rate, 2)
-        }
-        
-        serializer = LeadMetricsSerializer(data)
-        return Response(serializer.data)
+        return self.widget(request, 'overview')
     
     @action(detail=False, methods=['get'], url_path='by-status')
+    @cached_response
     def by_status(self, request):
         """
         Obtiene métricas de leads agrupados por estado
         """
-        total_leads = Lead.objects.count()
-        
-        status_counts = Lead.objects.values('status').annotate(
-            count=Count('id')
-        ).order_by('-count')
-        
-        metrics = []
-        for item in status_counts:
-            percentage = (item['count'] / total_leads * 100) if total_leads > 0 else 0
-            metrics.append({
-                'status': item['status'],
-                'count': item['count'],
-                'percentage': round(percentage, 2)
-            })
-        
-        serializer = LeadStatusMetricsSerializer(metrics, many=True)
-        return Response(serializer.data)
+        return self.widget(request, 'by_status')
     
     @action(detail=False, methods=['get'], url_path='by-type')
+    @cached_response
     def by_type(self, request):
         """
         Obtiene métricas de leads agrupados por tipo
         """
-        total_leads = Lead.objects.count()
-        
-        type_counts = Lead.objects.values('lead_type__name').annotate(
-            count=Count('id')
-        ).order_by('-count')
-        
-        metrics = []
-        for item in type_counts:
-            percentage = (item['count'] / total_leads * 100) if total_leads > 0 else 0
-            metrics.append({
-                'lead_type': item['lead_type__name'],
-                'count': item['count'],
-                'percentage': round(percentage, 2)
-            })
-        
-        serializer = LeadTypeMetricsSerializer(metrics, many=True)
-        return Response(serializer.data)
+        return self.widget(request, 'by_type')
     
     @action(detail=False, methods=['get'], url_path='trends')
+    @cached_response
     def trends(self, request):
         """
-        Obtiene tendencias de leads por día (últimos 30 días)
-        """
-        days = int(request.query_params.get('days', 30))
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=days)
-        
-        trends = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            new_leads = Lead.objects.filter(created_at__date=current_date).count()
-            converted_leads = Lead.objects.filter(
-                status='converted',
-                created_at__date=current_date
-            ).count()
-            
-            trends.append({
-                'date': current_date,
-                'new_leads': new_leads,
-                'converted_leads': converted_leads
-            })
-            
-            current_date += timedelta(days=1)
-        
-        serializer = LeadTrendSerializer(trends, many=True)
-        return Response(serializer.data)
+        Obtiene tendencias de leads por día (últimos 30 días) o por hora, semana o mes (?granularity=)
+        """
+        return self.widget(request, 'trends')
     
     @action(detail=False, methods=['get'], url_path='daily-metrics')
+    @cached_response
     def daily_metrics(self, request):
         """
-        Obtiene métricas diarias detalladas (últimos 7 días)
-        """
-        days = int(request.query_params.get('days', 7))
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=days)
-        
-        daily_metrics = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            leads_for_date = Lead.objects.filter(created_at__date=current_date)
-            
-            metrics = {
-                'date': current_date,
-                'total_leads': leads_for_date.count(),
-                'new_leads': leads_for_date.count(),  # Todos los creados en esa fecha son nuevos
-                'pending_leads': leads_for_date.filter(status='pending').count(),
-                'contacted_leads': leads_for_date.filter(status='contacted').count(),
-                'discarded_leads': leads_for_date.filter(status='discarded').count(),
-                'process_leads': leads_for_date.filter(status='process').count(),
-                'converted_leads': leads_for_date.filter(status='converted').count(),
-            }
-            
-            daily_metrics.append(metrics)
-            current_date += timedelta(days=1)
-        
-        serializer = LeadDailyMetricsSerializer(daily_metrics, many=True)
-        return Response(serializer.data)
+        Obtiene métricas diarias detalladas (últimos 7 días); acepta ?granularity= como trends
+        """
+        return self.widget(request, 'daily_metrics')
     
+    @action(detail=False, methods=['get'], url_path='velocity')
+    @cached_response
+    def velocity(self, request):
+        """
+        Mediana y p90 del tiempo (segundos desde la creación del lead) hasta cada
+        cambio de status, por tipo de lead (últimos 30 días de cambios). Acepta
+        store_id, lead_type, date_from/date_to y group_by=store_id.
+        """
+        filters = LeadFilters.from_params(request.query_params)
+        start_date, end_date = filters.window(30)
+
+        # Días cerrados desde LeadVelocityDaily y hoy en vivo desde la bitácora de status
+        metrics = velocity(start_date, end_date, lead_type_id=filters.lead_type, store_id=filters.store_id,
+                           group_by_store=filters.group_by == 'store_id')
+        for item in metrics:
+            item['lead_type_name'] = lead_types.name(item['lead_type'])
+
+        serializer = LeadVelocitySerializer(metrics, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='unique-emails')
+    @cached_response
+    def unique_emails(self, request):
+        """
+        Emails únicos aproximados (HyperLogLog, ~1.6% de error) de los leads creados
+        en el rango (date_from/date_to o days, default 30) y por granularity=day|week|month
+        """
+        filters = LeadFilters.from_params(request.query_params)
+        if filters.store_id is not None or filters.lead_type is not None or filters.group_by:
+            raise ValidationError({'detail': 'unique-emails no acepta store_id, lead_type ni group_by'})
+        if filters.hourly:
+            raise ValidationError({'granularity': 'Opciones: day, week, month'})
+
+        start_date, end_date = filters.window(30)
+        data = unique_emails(start_date, end_date, filters.granularity)
+        return Response(LeadUniqueEmailsSerializer(data).data)
+
     @action(detail=False, methods=['get'], url_path='recent-activity')
+    @cached_response
     def recent_activity(self, request):
         """
         Obtiene actividad reciente de leads (últimos leads creados)
         """
-        limit = int(request.query_params.get('limit', 10))
-        
-        recent_leads = Lead.objects.select_related('lead_type').order_by('-created_at')[:limit]
-        
-        activity = []
-        for lead in recent_leads:
-            activity.append({
-                'id': lead.id,
-                'name': lead.name,
-                'email': lead.email,
-                'status': lead.status,
-                'lead_type': lead.lead_type.name,
-                'created_at': lead.created_at,
-                'tryet': lead.tryet
-            })
-        
-        return Response(activity)
+        return self.widget(request, 'recent_activity')
     
     @action(detail=False, methods=['get'], url_path='conversion-funnel')
+    @cached_response
     def conversion_funnel(self, request):
         """
         Obtiene métricas del funnel de conversión
         """
-        total_leads = Lead.objects.count()
-        
-        funnel_data = {
-            'total_leads': total_leads,
-            'pending_leads': Lead.objects.filter(status='pending').count(),
-            'contacted_leads': Lead.objects.filter(status='contacted').count(),
-            'process_leads': Lead.objects.filter(status='process').count(),
-            'converted_leads': Lead.objects.filter(status='converted').count(),
-            'discarded_leads': Lead.objects.filter(status='discarded').count(),
-        }
-        
-        # Calcular porcentajes del funnel
-        if total_leads > 0:
-            funnel_data['pending_percentage'] = round((funnel_data['pending_leads'] / total_leads) * 100, 2)
-            funnel_data['contacted_percentage'] = round((funnel_data['contacted_leads'] / total_leads) * 100, 2)
-            funnel_data['process_percentage'] = round((funnel_data['process_leads'] / total_leads) * 100, 2)
-            funnel_data['converted_percentage'] = round((funnel_data['converted_leads'] / total_leads) * 100, 2)
-            funnel_data['discarded_percentage'] = round((funnel_data['discarded_leads'] / total_leads) * 100, 2)
-        else:
-            funnel_data.update({
-                'pending_percentage': 0,
-                'contacted_percentage': 0,
-                'process_percentage': 0,
-                'converted_percentage': 0,
-                'discarded_percentage': 0
-            })
-        
-        return Response(funnel_data) 
\ No newline at end of file
+        return self.widget(request, 'conversion_funnel')
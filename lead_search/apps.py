@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LeadSearchConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lead_search'
+
+    def ready(self):
+        import lead_search.signals
@@ -0,0 +1,193 @@
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, DecimalField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from lead.models import Lead
+
+# Con el tokenizer/operador de trigramas, consultas más cortas no pueden usar el índice
+MIN_TRIGRAM_LENGTH = 3
+
+DEFAULT_BACKENDS = {
+    'postgresql': 'lead_search.backends.PostgresTrigramSearchBackend',
+    'sqlite': 'lead_search.backends.SQLiteFTSSearchBackend',
+}
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class BaseSearchBackend:
+    """
+    Backend de búsqueda de leads: filtra un queryset de Lead por el texto q
+    sobre name, email y phone_number.
+
+    Si ranked es True, search() anota 'rank' (Decimal) y la vista ordena por él.
+    """
+    ranked = False
+    # Si setup() corre en post_migrate; si no, con el comando setup_lead_search
+    setup_on_migrate = True
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def table(self):
+        return self.connection.ops.quote_name(Lead._meta.db_table)
+
+    def setup(self):
+        """Crea índices / tablas auxiliares (idempotente); ver setup_on_migrate"""
+
+    def search(self, queryset, q):
+        raise NotImplementedError
+
+
+class IContainsSearchBackend(BaseSearchBackend):
+    """Búsqueda original: icontains sobre las tres columnas (scan secuencial)"""
+
+    def search(self, queryset, q):
+        return queryset.filter(
+            Q(name__icontains=q) |
+            Q(email__icontains=q) |
+            Q(phone_number__icontains=q)
+        )
+
+
+class PostgresTrigramSearchBackend(IContainsSearchBackend):
+    """
+    PostgreSQL: índices GIN de trigramas (pg_trgm) para las búsquedas por
+    subcadena y un índice GIN sobre la expresión tsvector de las tres
+    columnas para palabras completas. Los resultados se ordenan por similitud.
+
+    Los índices se crean con CREATE INDEX CONCURRENTLY, que no bloquea
+    escrituras pero no puede correr dentro de una transacción: setup() no
+    corre en post_migrate sino con setup_lead_search (entrypoint.sh, después
+    de migrate). Mientras no existen, las búsquedas funcionan sin índice.
+    """
+    ranked = True
+    setup_on_migrate = False
+    columns = ('name', 'email', 'phone_number')
+    # Tablas de versiones anteriores: columna tsvector generada (reescribía la tabla) y su índice
+    legacy_column = 'search_vector'
+    legacy_index = 'lead_search_vector_gin'
+    # Espera máxima por el candado para quitar la columna anterior
+    lock_timeout = '5s'
+
+    def document(self, table=None):
+        """Expresión tsvector de las tres columnas; la misma en el índice y en search()"""
+        prefix = f'{table}.' if table else ''
+        text = " || ' ' || ".join(f"coalesce({prefix}{column}, '')" for column in self.columns)
+        return f"to_tsvector('simple', {text})"
+
+    def indexes(self):
+        indexes = {'lead_search_document_gin': f'gin (({self.document()}))'}
+        indexes.update({f'lead_{column}_trgm': f'gin ({column} gin_trgm_ops)' for column in self.columns})
+        return indexes
+
+    def setup(self):
+        table = self.table()
+        with self.connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for name, definition in self.indexes().items():
+                # Un CREATE INDEX CONCURRENTLY interrumpido deja el índice inválido: se rehace
+                cursor.execute('SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)', [name])
+                row = cursor.fetchone()
+                if row and row[0]:
+                    cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+                cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {definition}')
+            # DROP COLUMN solo cambia el catálogo (no reescribe), pero pide un candado exclusivo breve
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {self.legacy_index}')
+            cursor.execute(f"SET lock_timeout = '{self.lock_timeout}'")
+            try:
+                cursor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS {self.legacy_column}')
+            finally:
+                cursor.execute('RESET lock_timeout')
+
+    def search(self, queryset, q):
+        if len(q) < MIN_TRIGRAM_LENGTH:
+            return super().search(queryset, q)
+
+        table = self.table()
+        pattern = f'%{escape_like(q)}%'
+        matches = ' OR '.join(f'{table}.{column} ILIKE %s' for column in self.columns)
+        condition = RawSQL(
+            f"({matches} OR {self.document(table)} @@ plainto_tsquery('simple', %s))",
+            [pattern] * len(self.columns) + [q],
+            output_field=BooleanField()
+        )
+        similarities = ', '.join(f"similarity(coalesce({table}.{column}, ''), %s)" for column in self.columns)
+        rank = RawSQL(
+            f'ROUND(GREATEST({similarities})::numeric, 4)',
+            [q] * len(self.columns),
+            output_field=DecimalField(max_digits=5, decimal_places=4)
+        )
+        return queryset.filter(condition).annotate(rank=rank)
+
+
+class SQLiteFTSSearchBackend(IContainsSearchBackend):
+    """
+    SQLite (modo LOCAL): tabla FTS5 con tokenizer trigram sincronizada con
+    lead_lead por triggers; el MATCH resuelve subcadenas con el índice.
+    """
+    fts_table = 'lead_lead_fts'
+
+    def setup(self):
+        table = self.table()
+        fts = self.fts_table
+        columns = 'name, email, phone_number'
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts])
+            exists = cursor.fetchone() is not None
+
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"{columns}, content={table}, content_rowid='id', tokenize='trigram')"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN '
+                f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, new.name, new.email, new.phone_number); END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {columns}) "
+                f"VALUES ('delete', old.id, old.name, old.email, old.phone_number); END"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {columns}) "
+                f"VALUES ('delete', old.id, old.name, old.email, old.phone_number); "
+                f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, new.name, new.email, new.phone_number); END'
+            )
+            if not exists:
+                # Indexa los leads que ya existían antes de crear la tabla FTS
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def search(self, queryset, q):
+        if len(q) < MIN_TRIGRAM_LENGTH:
+            return super().search(queryset, q)
+
+        phrase = '"' + q.replace('"', '""') + '"'
+        condition = RawSQL(
+            f'{self.table()}.id IN (SELECT rowid FROM {self.fts_table} WHERE {self.fts_table} MATCH %s)',
+            [phrase],
+            output_field=BooleanField()
+        )
+        return queryset.filter(condition)
+
+
+_backends = {}
+
+
+def get_search_backend(using='default'):
+    """Backend configurado en LEAD_SEARCH_BACKEND o, si está vacío, el del motor de base de datos"""
+    path = settings.LEAD_SEARCH_BACKEND or DEFAULT_BACKENDS.get(
+        connections[using].vendor, 'lead_search.backends.IContainsSearchBackend'
+    )
+    key = (path, using)
+    if key not in _backends:
+        _backends[key] = import_string(path)(using=using)
+    return _backends[key]
@@ -0,0 +1,123 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from lead.models import Lead
+from lead.signals import leads_created, notify_leads_changed
+from lead_search.backends import IContainsSearchBackend, get_search_backend
+from lead_type.models import LeadType
+
+BENCH_STORE_ID = 999998
+BATCH_SIZE = 10000
+PAGE_SIZE = 30
+
+FIRST_NAMES = ['Jonathan', 'María', 'José', 'Guadalupe', 'Fernanda', 'Luis', 'Andrea', 'Carlos',
+               'Valeria', 'Miguel', 'Sofía', 'Alejandro', 'Daniela', 'Ricardo', 'Paola', 'Jorge']
+LAST_NAMES = ['Medrano', 'Hernández', 'García', 'Martínez', 'López', 'González', 'Rodríguez',
+              'Pérez', 'Sánchez', 'Ramírez', 'Cruz', 'Flores', 'Gómez', 'Morales', 'Vázquez', 'Reyes']
+DOMAINS = ['gmail.com', 'hotmail.com', 'yahoo.com.mx', 'outlook.com', 'enid.com']
+
+
+class Command(BaseCommand):
+    help = 'Compara la latencia de lead-search entre icontains y el backend configurado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000, help='Leads del corpus (default: 2000000)')
+        parser.add_argument('--queries', type=int, default=50, help='Consultas por backend')
+        parser.add_argument('--keep', action='store_true', help='No borrar el corpus al terminar')
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        corpus = Lead.objects.filter(store_id=BENCH_STORE_ID)
+        existing = corpus.count()
+        if existing < options['rows']:
+            self.generate(options['rows'] - existing, offset=existing)
+
+        backend = get_search_backend()
+        backend.setup()
+        queries = self.sample_queries(options['queries'])
+
+        self.stdout.write(f"\n🔎 {options['rows']} leads, {len(queries)} consultas ({connection.vendor})")
+        baseline = self.measure(IContainsSearchBackend(), queries)
+        current = self.measure(backend, queries)
+        self.report('icontains', baseline)
+        self.report(type(backend).__name__, current)
+        self.stdout.write(
+            f"   Mejora: media x{statistics.mean(baseline) / statistics.mean(current):.1f}, "
+            f"p95 x{self.p95(baseline) / self.p95(current):.1f}"
+        )
+
+        if not options['keep']:
+            deleted = self.cleanup(corpus)
+            self.stdout.write(self.style.SUCCESS(f"✅ Se eliminaron {deleted} leads de benchmark"))
+
+    def measure(self, backend, queries):
+        timings = []
+        for q in queries:
+            queryset = backend.search(Lead.objects.all(), q)
+            ordering = ('-rank', '-created_at', '-id') if backend.ranked else ('-created_at', '-id')
+            started = time.perf_counter()
+            list(queryset.order_by(*ordering)[:PAGE_SIZE])
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def p95(self, timings):
+        timings = sorted(timings)
+        return timings[max(0, int(len(timings) * 0.95) - 1)]
+
+    def report(self, label, timings):
+        self.stdout.write(
+            f"   {label:<32} p50 {statistics.median(timings):8.2f} ms | p95 {self.p95(timings):8.2f} ms | "
+            f"media {statistics.mean(timings):8.2f} ms"
+        )
+
+    def sample_queries(self, count):
+        queries = []
+        for _ in range(count):
+            kind = random.choice(['name', 'last_name', 'email', 'phone'])
+            if kind == 'name':
+                queries.append(random.choice(FIRST_NAMES))
+            elif kind == 'last_name':
+                queries.append(random.choice(LAST_NAMES)[1:6])
+            elif kind == 'email':
+                queries.append(f'{random.choice(FIRST_NAMES).lower()[:4]}{random.randint(0, 9999)}')
+            else:
+                queries.append(str(random.randint(1000000, 9999999)))
+        return queries
+
+    def generate(self, count, offset):
+        lead_type, _ = LeadType.objects.get_or_create(name='Benchmark búsqueda')
+        now = timezone.now()
+        self.stdout.write(f"Generando {count} leads de benchmark...")
+
+        for start in range(0, count, BATCH_SIZE):
+            leads = []
+            for index in range(start, min(start + BATCH_SIZE, count)):
+                first, last = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+                leads.append(Lead(
+                    name=f'{first} {last}',
+                    email=f'{first.lower()}{offset + index}@{random.choice(DOMAINS)}',
+                    phone_number=f'55{random.randint(10000000, 99999999)}',
+                    lead_type=lead_type,
+                    store_id=BENCH_STORE_ID,
+                    created_at=now,
+                ))
+                leads[-1].normalize_lookup_fields()
+            # Igual que existence/batch: columnas de búsqueda y métricas al día
+            with transaction.atomic():
+                Lead.objects.bulk_create(leads)
+                leads_created.send(sender=Lead, leads=leads)
+                notify_leads_changed(lead.pk for lead in leads)
+
+    def cleanup(self, corpus):
+        """Borra con delete() por lotes para que métricas, contadores e índices descuenten los leads"""
+        deleted = 0
+        while True:
+            ids = list(corpus.order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+            if not ids:
+                return deleted
+            with transaction.atomic():
+                _, by_model = Lead.objects.filter(id__in=ids).delete()
+            deleted += by_model.get(Lead._meta.label, 0)
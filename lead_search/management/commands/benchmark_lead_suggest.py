@@ -0,0 +1,80 @@
+import random
+import statistics
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from lead_search.management.commands.benchmark_lead_search import DOMAINS, FIRST_NAMES, LAST_NAMES
+from lead_search.suggest import LeadSuggestIndex
+
+# Metas del índice: memoria por millón de leads y latencia p99 de una consulta
+TARGET_MB_PER_MILLION = 300
+TARGET_P99_MS = 1.0
+
+
+class Command(BaseCommand):
+    help = 'Mide memoria, construcción y latencia del índice de lead-search/suggest con un corpus sintético'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Leads del corpus (default: 1000000)')
+        parser.add_argument('--queries', type=int, default=200, help='Consultas por tipo')
+        parser.add_argument('--limit', type=int, default=10, help='Resultados por consulta')
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        rows = self.generate(options['rows'])
+
+        # Sin la lista de filas en memoria: tracemalloc mide solo lo que retiene el índice
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = LeadSuggestIndex().build(iter(rows))
+        elapsed = time.perf_counter() - started
+        memory_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        tracemalloc.stop()
+
+        per_million = memory_mb * 1000000 / len(rows)
+        stats = index.stats()
+        self.stdout.write(f"\n🔤 {len(rows)} leads: índice construido en {elapsed:.1f}s (con tracemalloc)")
+        self.stdout.write(f"   memoria {memory_mb:.1f} MB ({per_million:.0f} MB por millón; meta {TARGET_MB_PER_MILLION})")
+        self.stdout.write(f"   postings {stats['postings']} ({stats['postings_mb']} MB), "
+                          f"documentos {stats['documents_mb']} MB, n-gramas {stats['grams']}")
+
+        worst = 0
+        for label, queries in self.sample_queries(rows, options['queries']).items():
+            timings = []
+            for q in queries:
+                started = time.perf_counter()
+                index.search(q, options['limit'])
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+            worst = max(worst, p99)
+            self.stdout.write(
+                f"   {label:<18} p50 {statistics.median(timings):6.3f} ms | p99 {p99:6.3f} ms | "
+                f"máx {timings[-1]:6.3f} ms"
+            )
+
+        if per_million <= TARGET_MB_PER_MILLION and worst <= TARGET_P99_MS:
+            self.stdout.write(self.style.SUCCESS('✅ Dentro de las metas de memoria y latencia'))
+        else:
+            self.stdout.write(self.style.WARNING('⚠️ Fuera de las metas de memoria o latencia'))
+
+    def generate(self, count):
+        """Filas (id, name, email, phone) parecidas a las de benchmark_lead_search"""
+        rows = []
+        for lead_id in range(1, count + 1):
+            first, last = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+            rows.append((lead_id, f'{first} {last}', f'{first.lower()}{lead_id}@{random.choice(DOMAINS)}',
+                         f'55{random.randint(10000000, 99999999)}'))
+        return rows
+
+    def sample_queries(self, rows, count):
+        """Consultas por tipo: muchas coincidencias, una sola, prefijos y sin resultados"""
+        samples = random.sample(rows, count)
+        return {
+            'apellido': [random.choice(LAST_NAMES).lower()[1:6] for _ in range(count)],
+            'email exacto': [email.split('@')[0] for _, _, email, _ in samples],
+            'teléfono': [phone[-7:] for _, _, _, phone in samples],
+            'prefijo': [random.choice(FIRST_NAMES).lower()[:random.randint(1, 2)] for _ in range(count)],
+            # Teléfonos que no existen: todos sus trigramas son comunes, ninguno coincide
+            'sin resultados': [f'55{random.randint(10000000, 99999999)}' for _ in range(count)],
+        }
@@ -0,0 +1,89 @@
+import random
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from lead.models import Lead
+from lead_search.suggest import (
+    CHECKSUM_MODULUS, FIELD_SEPARATOR, FIELDS, GRAM_SIZE, LeadSuggestIndex, document_hash, document_text,
+    worker_states,
+)
+
+
+class Command(BaseCommand):
+    help = 'Verifica el índice de lead-search/suggest de cada worker contra la tabla de leads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wait', type=float, default=None,
+                            help='Segundos para que los workers sincronicen después de leer la tabla '
+                                 '(default: 2 x LEAD_SUGGEST_SYNC_SECONDS)')
+        parser.add_argument('--queries', type=int, default=50,
+                            help='Consultas de muestra a comparar con icontains (0 = ninguna)')
+        parser.add_argument('--limit', type=int, default=10, help='Resultados por consulta')
+
+    def handle(self, *args, **options):
+        wait = options['wait'] if options['wait'] is not None else 2 * settings.LEAD_SUGGEST_SYNC_SECONDS
+        mismatches = 0
+
+        # 1. Huella (documentos y checksum) del índice vivo de cada worker contra la de la tabla
+        started = time.time()
+        documents, checksum = self.table_fingerprint()
+        states = self.wait_for_workers(started, wait)
+        if not states:
+            raise CommandError('Ningún worker publicó su índice (¿workers arriba y SHARED_CACHE?)')
+        for name, state in sorted(states.items()):
+            if (state['documents'], state['checksum']) != (documents, checksum):
+                mismatches += 1
+                age = started - (state['synced_at'] or 0)
+                self.stdout.write(f"   ⚠️ Worker {name}: {state['documents']} documentos vs {documents} leads "
+                                  f"(checksum distinto; sincronizó {age:.0f}s antes de leer la tabla)")
+
+        # 2. Consultas de muestra: la búsqueda regresa los mismos top-k que icontains
+        if options['queries']:
+            index = LeadSuggestIndex().build()
+            random.seed(7)
+            for q in self.sample_queries(index, options['queries']):
+                expected = self.icontains_ids(q, options['limit'])
+                actual = [row['id'] for row in index.search(q, options['limit'])]
+                if actual != expected:
+                    mismatches += 1
+                    self.stdout.write(f"   ⚠️ '{q}': índice {actual} vs icontains {expected}")
+
+        if mismatches:
+            raise CommandError(f'{mismatches} diferencias entre el índice y la base de datos '
+                               '(con escrituras en curso, volver a correrlo)')
+        self.stdout.write(self.style.SUCCESS(f"✅ Índice consistente en {len(states)} workers ({documents} leads)"))
+
+    def table_fingerprint(self):
+        """Misma huella que LeadSuggestIndex.fingerprint, calculada desde la tabla"""
+        documents = checksum = 0
+        for lead_id, name, email, phone_number in Lead.objects.order_by().values_list(*FIELDS).iterator(chunk_size=5000):
+            documents += 1
+            checksum += document_hash(lead_id, document_text(name, email, phone_number))
+        return documents, checksum % CHECKSUM_MODULUS
+
+    def wait_for_workers(self, started, wait):
+        """Huellas publicadas; espera hasta `wait` segundos a que todas sean posteriores a `started`"""
+        deadline = time.time() + wait
+        while True:
+            states = worker_states()
+            if time.time() >= deadline or all((state['synced_at'] or 0) >= started for state in states.values()):
+                return states
+            time.sleep(0.5)
+
+    def sample_queries(self, index, count):
+        texts = [text for _, text in index._documents.items()]
+        queries = []
+        for text in random.sample(texts, min(count, len(texts))):
+            fields = [value for value in text.split(FIELD_SEPARATOR) if len(value) >= GRAM_SIZE]
+            if fields:
+                field = random.choice(fields)
+                start = random.randrange(len(field) - GRAM_SIZE + 1)
+                q = field[start:start + random.randint(GRAM_SIZE, 6)].strip()
+                if len(q) >= GRAM_SIZE:
+                    queries.append(q)
+        return queries
+
+    def icontains_ids(self, q, limit):
+        condition = Q(name__icontains=q) | Q(email__icontains=q) | Q(phone_number__icontains=q)
+        return list(Lead.objects.filter(condition).order_by('-id').values_list('id', flat=True)[:limit])
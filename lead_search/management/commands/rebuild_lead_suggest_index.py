@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from lead_search.suggest import LeadSuggestIndex, request_rebuild
+
+
+class Command(BaseCommand):
+    help = 'Construye el índice de lead-search/suggest, muestra su tamaño y pide a los workers reconstruir'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo medir el índice, sin avisar a los workers')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = LeadSuggestIndex().build()
+        elapsed = time.perf_counter() - started
+
+        stats = index.stats()
+        self.stdout.write(f"🔤 Índice construido en {elapsed:.1f}s")
+        for key in ('documents', 'grams', 'postings', 'postings_mb', 'documents_mb', 'approx_total_mb'):
+            self.stdout.write(f"   {key}: {stats[key]}")
+
+        if not options['dry_run']:
+            request_rebuild()
+            self.stdout.write(self.style.SUCCESS('✅ Los workers reconstruirán su índice en la siguiente sincronización'))
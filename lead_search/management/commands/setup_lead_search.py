@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from lead_search.backends import get_search_backend
+
+
+class Command(BaseCommand):
+    help = ('Crea los índices del backend de lead-search (en PostgreSQL con CREATE INDEX CONCURRENTLY, '
+            'sin bloquear escrituras); idempotente, corre en cada despliegue después de migrate')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Alias de la base de datos')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['database'])
+        backend.setup()
+        self.stdout.write(self.style.SUCCESS(f"✅ Backend de búsqueda listo: {type(backend).__name__}"))
@@ -0,0 +1,62 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from lead.version import leads_version
+
+RESULT_KEY = 'lead_search:results:{version}:{digest}'
+HITS_KEY = 'lead_search:cache:hits'
+MISSES_KEY = 'lead_search:cache:misses'
+
+
+def is_enabled():
+    # La versión de leads que invalida las páginas debe verse desde todos los workers
+    return settings.LEAD_SEARCH_CACHE_TTL > 0 and settings.SHARED_CACHE
+
+
+def make_key(q, status, limit, cursor, fields):
+    """
+    Llave de una página de resultados (y de los campos pedidos). Incluye la versión de leads, así que
+    cualquier escritura deja inalcanzables las entradas anteriores (expiran
+    solas por TTL) y nunca se sirve una página obsoleta.
+    """
+    params = json.dumps([q, status, limit, cursor or '', fields], separators=(',', ':'))
+    digest = hashlib.sha1(params.encode()).hexdigest()
+    return RESULT_KEY.format(version=leads_version(), digest=digest)
+
+
+def fetch(key):
+    value = cache.get(key)
+    _count(HITS_KEY if value is not None else MISSES_KEY)
+    return value
+
+
+def store(key, value):
+    cache.set(key, value, settings.LEAD_SEARCH_CACHE_TTL)
+
+
+def _count(key):
+    if cache.add(key, 1, None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def stats():
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'enabled': is_enabled(),
+        'ttl': settings.LEAD_SEARCH_CACHE_TTL,
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'leads_version': leads_version(),
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
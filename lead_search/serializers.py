@@ -1,6 +1,7 @@
 # serializers.py
 from rest_framework import serializers
 from lead.models import Lead
+from lead.row_serializers import STATUS_CHOICES, LeadRowSerializer
 import json
 
 
@@ -22,7 +23,21 @@ class LeadSearchSerializer(serializers.ModelSerializer):
     
     
     def get_status_choices(self, obj):
-        return [
-            {'value': status[0], 'label': status[1]} 
-            for status in Lead.STATUS_CHOICES
-        ]
\ No newline at end of file
+        return STATUS_CHOICES
+
+
+class LeadSearchRowSerializer(LeadRowSerializer):
+    """Mismos campos que LeadSearchSerializer (sin status_choices por fila) desde .values()"""
+    fields = {
+        'id': ('id',),
+        'name': ('name',),
+        'email': ('email',),
+        'phone_number': ('phone_number',),
+        'status': ('status',),
+        'status_display': ('status',),
+        'created_at': ('created_at',),
+        'products': ('products_interest_ids',),
+    }
+
+    def get_products(self, row):
+        return self.get_products_interest(row)
\ No newline at end of file
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from lead.signals import leads_changed
+from lead_search.backends import get_search_backend
+from lead_search.suggest import publish_changes, refresh_local_index
+
+
+@receiver(post_migrate)
+def setup_search_backend(sender, using='default', **kwargs):
+    # post_migrate llega una vez por app; lead_lead ya existe para entonces. Los backends que
+    # no pueden correr dentro de migrate (PostgreSQL) se preparan con setup_lead_search
+    if sender.name == 'lead_search':
+        backend = get_search_backend(using)
+        if backend.setup_on_migrate:
+            backend.setup()
+
+
+@receiver(leads_changed)
+def update_suggest_index(sender, ids, **kwargs):
+    publish_changes(ids)
+    refresh_local_index(ids)
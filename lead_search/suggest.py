@@ -0,0 +1,536 @@
+import array
+import bisect
+import hashlib
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from lead.models import Lead
+
+logger = logging.getLogger(__name__)
+
+GRAM_SIZE = 3
+# Las corridas de dígitos (teléfonos, números en emails) se indexan además en n-gramas de 5:
+# los trigramas de dígitos son apenas 1000 y cada uno aparece en muchos leads
+DIGIT_GRAM_SIZE = 5
+DIGITS = re.compile(rf'[0-9]{{{DIGIT_GRAM_SIZE},}}')
+# Marca de inicio de palabra para los prefijos de 1 y 2 caracteres
+PREFIX_MARK = '\x01'
+# Separador de campos dentro del texto guardado por lead
+FIELD_SEPARATOR = '\x00'
+# Compactar postings y textos cuando lo obsoleto supera esta fracción
+STALE_RATIO = 0.2
+# Postings e ids de 4 bytes; con un id mayor a MAX_NARROW_ID el índice pasa a 8 bytes
+TYPECODE = 'I'
+WIDE_TYPECODE = 'Q'
+MAX_NARROW_ID = 2 ** 32 - 1
+# Candidatos de la primera ronda de intersección; se duplican en cada ronda
+FIRST_CHUNK = 64
+# Con un posting de más de BISECT_RATIO x candidatos se busca cada candidato con bisect
+# en lugar de intersectar sets
+BISECT_RATIO = 8
+# Huella de los documentos: suma de un hash de 64 bits por (id, texto)
+CHECKSUM_MODULUS = 2 ** 64
+
+GENERATION_KEY = 'lead_search:suggest:generation'
+CHANGES_SEQ_KEY = 'lead_search:suggest:changes'
+CHANGE_KEY = 'lead_search:suggest:change:{}'
+CHANGE_TTL = 60 * 60
+# Más cambios pendientes que esto y conviene reconstruir completo
+MAX_PENDING_CHANGES = 5000
+# Estado publicado por cada worker para check_lead_suggest_index
+WORKERS_KEY = 'lead_search:suggest:workers'
+WORKER_KEY = 'lead_search:suggest:worker:{}'
+MAX_WORKERS = 256
+
+FIELDS = ('id', 'name', 'email', 'phone_number')
+
+
+def document_text(name, email, phone_number):
+    return FIELD_SEPARATOR.join((name or '', email or '', phone_number or ''))
+
+
+def digit_grams(value):
+    """N-gramas de DIGIT_GRAM_SIZE de las corridas de dígitos de value"""
+    return {run[start:start + DIGIT_GRAM_SIZE]
+            for run in DIGITS.findall(value) for start in range(len(run) - DIGIT_GRAM_SIZE + 1)}
+
+
+def document_grams(text):
+    """Trigramas de cada campo, n-gramas de dígitos y los prefijos de 1 y 2 letras de cada palabra"""
+    grams = set()
+    for field in text.lower().split(FIELD_SEPARATOR):
+        for start in range(len(field) - GRAM_SIZE + 1):
+            grams.add(field[start:start + GRAM_SIZE])
+        grams.update(digit_grams(field))
+        for word in field.replace('@', ' ').replace('.', ' ').split():
+            grams.add(PREFIX_MARK + word[:1])
+            grams.add(PREFIX_MARK + word[:2])
+    return grams
+
+
+def document_hash(lead_id, text):
+    digest = hashlib.blake2b(f'{lead_id}{FIELD_SEPARATOR}{text}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def query_grams(q):
+    if len(q) < GRAM_SIZE:
+        return {PREFIX_MARK + q}
+    return {q[start:start + GRAM_SIZE] for start in range(len(q) - GRAM_SIZE + 1)} | digit_grams(q)
+
+
+def contains(ids, lead_id, low=0, high=None):
+    position = bisect.bisect_left(ids, lead_id, low, len(ids) if high is None else high)
+    return position < len(ids) and ids[position] == lead_id
+
+
+def intersect(candidates, others):
+    """
+    Ids de candidates (ordenados) que aparecen en todos los postings de
+    others (del más corto al más largo). Solo se mira el tramo de cada
+    posting entre el primer y el último candidato; si el tramo es corto se
+    intersecta como set (en C), si no se busca cada candidato con bisect.
+    """
+    for ids in others:
+        if not candidates:
+            break
+        low = bisect.bisect_left(ids, candidates[0])
+        high = bisect.bisect_right(ids, candidates[-1], low)
+        if high - low > BISECT_RATIO * len(candidates):
+            candidates = [lead_id for lead_id in candidates if contains(ids, lead_id, low, high)]
+        else:
+            candidates = sorted(set(candidates).intersection(ids[low:high]))
+    return candidates
+
+
+class Documents:
+    """
+    Textos de los leads empacados en un solo bytearray (UTF-8): ids
+    ordenados y el inicio y largo de cada texto en arrays. Un cambio agrega
+    el texto nuevo al final y deja el anterior como bytes obsoletos hasta
+    la siguiente compactación.
+    """
+
+    def __init__(self, typecode=TYPECODE):
+        self.ids = array.array(typecode)
+        self.offsets = array.array('Q')
+        self.lengths = array.array('H')
+        self.texts = bytearray()
+        self.stale_bytes = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, lead_id):
+        position = bisect.bisect_left(self.ids, lead_id)
+        if position < len(self.ids) and self.ids[position] == lead_id:
+            return position
+        return None
+
+    def text_at(self, position):
+        offset = self.offsets[position]
+        return self.texts[offset:offset + self.lengths[position]].decode()
+
+    def get(self, lead_id):
+        position = self.position(lead_id)
+        return None if position is None else self.text_at(position)
+
+    def put(self, lead_id, text):
+        """Guarda el texto del lead; regresa el texto anterior (None si es nuevo)"""
+        encoded = text.encode()
+        if not self.ids or self.ids[-1] < lead_id:
+            position, previous = len(self.ids), None
+        else:
+            position = bisect.bisect_left(self.ids, lead_id)
+            previous = self.text_at(position) if self.ids[position] == lead_id else None
+        if previous is None:
+            self.ids.insert(position, lead_id)
+            self.offsets.insert(position, len(self.texts))
+            self.lengths.insert(position, len(encoded))
+        else:
+            self.stale_bytes += self.lengths[position]
+            self.offsets[position] = len(self.texts)
+            self.lengths[position] = len(encoded)
+        self.texts += encoded
+        return previous
+
+    def pop(self, lead_id):
+        """Quita el lead; regresa su texto (None si no estaba)"""
+        position = self.position(lead_id)
+        if position is None:
+            return None
+        text = self.text_at(position)
+        self.stale_bytes += self.lengths[position]
+        del self.ids[position]
+        del self.offsets[position]
+        del self.lengths[position]
+        return text
+
+    def items(self):
+        """(id, texto) en orden de id"""
+        for position, lead_id in enumerate(self.ids):
+            yield lead_id, self.text_at(position)
+
+    def widen(self):
+        self.ids = array.array(WIDE_TYPECODE, self.ids)
+
+    def nbytes(self):
+        return sum(values.buffer_info()[1] * values.itemsize for values in (self.ids, self.offsets, self.lengths)) \
+            + len(self.texts)
+
+
+def pack(items):
+    """
+    Postings y documentos a partir de (id, texto) ordenados por id:
+    (postings, documents, entradas, checksum)
+    """
+    postings = {}
+    documents = Documents()
+    entries = 0
+    checksum = 0
+    for lead_id, text in items:
+        if lead_id > MAX_NARROW_ID and documents.ids.typecode != WIDE_TYPECODE:
+            widen(postings, documents)
+        documents.put(lead_id, text)
+        checksum += document_hash(lead_id, text)
+        for gram in document_grams(text):
+            ids = postings.get(gram)
+            if ids is None:
+                ids = postings[gram] = array.array(documents.ids.typecode)
+            ids.append(lead_id)
+            entries += 1
+    return postings, documents, entries, checksum % CHECKSUM_MODULUS
+
+
+def widen(postings, documents):
+    """Pasa postings e ids a 8 bytes (un id ya no cabe en 4)"""
+    for gram, ids in postings.items():
+        postings[gram] = array.array(WIDE_TYPECODE, ids)
+    documents.widen()
+
+
+class LeadSuggestIndex:
+    """
+    Índice invertido de n-gramas en memoria para el typeahead de leads.
+
+    Cada n-grama apunta a un array('I') ordenado de ids (4 bytes por
+    entrada; 8 si algún id no cabe) y los textos name/email/phone de todos
+    los leads viven empacados en Documents, que sirve para verificar los
+    candidatos y para responder sin leer la tabla. Las consultas no tocan
+    la base de datos; los cambios llegan por leads_changed y por un feed
+    compartido en el cache de Django para enterarse de escrituras hechas en
+    otros workers (ver sync). La huella (documentos y checksum) permite
+    comparar el índice de cada worker con la tabla.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._documents = Documents()
+        self._entries = 0
+        self._stale = 0
+        self._checksum = 0
+        self._max_id = 0
+        self._generation = None
+        self._changes_seq = 0
+        self.built_at = None
+        self.synced_at = None
+
+    @property
+    def is_built(self):
+        return self.built_at is not None
+
+    # Construcción y mantenimiento
+
+    def build(self, rows=None):
+        """Construye el índice completo desde Lead (o desde filas (id, name, email, phone) ordenadas por id)"""
+        changes_seq = self._shared_changes_seq()
+        generation = cache.get(GENERATION_KEY)
+        if rows is None:
+            rows = Lead.objects.order_by('id').values_list(*FIELDS).iterator(chunk_size=5000)
+
+        postings, documents, entries, checksum = pack(
+            (lead_id, document_text(name, email, phone_number)) for lead_id, name, email, phone_number in rows)
+
+        with self._lock:
+            self._postings = postings
+            self._documents = documents
+            self._entries = entries
+            self._stale = 0
+            self._checksum = checksum
+            self._max_id = documents.ids[-1] if documents else 0
+            self._generation = generation
+            self._changes_seq = changes_seq
+            self.built_at = self.synced_at = time.time()
+        return self
+
+    def add(self, lead_id, name, email, phone_number):
+        text = document_text(name, email, phone_number)
+        with self._lock:
+            if lead_id > MAX_NARROW_ID and self._documents.ids.typecode != WIDE_TYPECODE:
+                widen(self._postings, self._documents)
+            previous = self._documents.put(lead_id, text)
+            if previous == text:
+                return
+            if previous is not None:
+                self._stale += len(document_grams(previous))
+                self._checksum -= document_hash(lead_id, previous)
+            self._checksum = (self._checksum + document_hash(lead_id, text)) % CHECKSUM_MODULUS
+            for gram in document_grams(text):
+                ids = self._postings.get(gram)
+                if ids is None:
+                    ids = self._postings[gram] = array.array(self._documents.ids.typecode)
+                if not ids or ids[-1] < lead_id:
+                    ids.append(lead_id)
+                else:
+                    position = bisect.bisect_left(ids, lead_id)
+                    if position < len(ids) and ids[position] == lead_id:
+                        continue
+                    ids.insert(position, lead_id)
+                self._entries += 1
+            self._max_id = max(self._max_id, lead_id)
+            if previous is not None:
+                self._maybe_compact()
+
+    def remove(self, lead_id):
+        with self._lock:
+            text = self._documents.pop(lead_id)
+            if text is not None:
+                self._stale += len(document_grams(text))
+                self._checksum = (self._checksum - document_hash(lead_id, text)) % CHECKSUM_MODULUS
+                self._maybe_compact()
+
+    def refresh(self, ids):
+        """Vuelve a leer de la base los leads indicados (altas, cambios y bajas)"""
+        ids = set(ids)
+        for lead_id, name, email, phone_number in Lead.objects.filter(id__in=ids).values_list(*FIELDS):
+            ids.discard(lead_id)
+            self.add(lead_id, name, email, phone_number)
+        for lead_id in ids:
+            self.remove(lead_id)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Reconstruye postings y textos desde los documentos en memoria (sin tocar la base)"""
+        with self._lock:
+            documents = self._documents
+            stale_postings = self._entries and self._stale / self._entries >= STALE_RATIO
+            stale_texts = documents.texts and documents.stale_bytes / len(documents.texts) >= STALE_RATIO
+            if not (stale_postings or stale_texts):
+                return
+            self._postings, self._documents, self._entries, self._checksum = pack(documents.items())
+            self._stale = 0
+
+    # Sincronización entre workers
+
+    def _shared_changes_seq(self):
+        return cache.get(CHANGES_SEQ_KEY) or 0
+
+    def sync(self):
+        """
+        Aplica los cambios publicados por otros workers y las altas que no
+        pasaron por signals (bulk_create); si cambió la generación o se
+        perdió el feed, reconstruye. Corre en el hilo del índice (ver
+        start_build), nunca en una consulta: mientras reconstruye se sigue
+        respondiendo con los datos anteriores hasta el cambio en build().
+        """
+        if cache.get(GENERATION_KEY) != self._generation:
+            self.build()
+            return
+
+        current = self._shared_changes_seq()
+        # El contador se reinició (cache vaciado) o hay demasiados pendientes
+        if current < self._changes_seq or current - self._changes_seq > MAX_PENDING_CHANGES:
+            self.build()
+            return
+
+        pending = [CHANGE_KEY.format(seq) for seq in range(self._changes_seq + 1, current + 1)]
+        ids = set(cache.get_many(pending).values()) if pending else set()
+        self._changes_seq = current
+
+        new_ids = Lead.objects.filter(id__gt=self._max_id).values_list('id', flat=True)
+        ids.update(new_ids)
+        if ids:
+            self.refresh(ids)
+        self.synced_at = time.time()
+
+    def fingerprint(self):
+        """Documentos y checksum del índice; check_lead_suggest_index los compara con la tabla"""
+        with self._lock:
+            return {'documents': len(self._documents), 'checksum': self._checksum}
+
+    # Consultas
+
+    def search(self, q, limit=10):
+        """
+        Top-k leads (más recientes primero) cuyo name/email/phone contiene q;
+        con menos de 3 caracteres, los que tienen una palabra que empieza con q.
+        Los candidatos se intersectan por tramos desde los ids más altos: una
+        consulta con muchas coincidencias termina en el primer tramo.
+        """
+        q = (q or '').strip().lower()
+        if not q:
+            return []
+
+        with self._lock:
+            postings = [self._postings.get(gram) for gram in query_grams(q)]
+            if any(ids is None for ids in postings):
+                return []
+
+            postings.sort(key=len)
+            shortest, others = postings[0], postings[1:]
+            results = []
+            end, chunk = len(shortest), FIRST_CHUNK
+            while end > 0 and len(results) < limit:
+                start = max(0, end - chunk)
+                for lead_id in reversed(intersect(shortest[start:end], others)):
+                    text = self._documents.get(lead_id)
+                    if text is None or not self._matches(text, q):
+                        continue
+                    name, email, phone_number = text.split(FIELD_SEPARATOR)
+                    results.append({'id': lead_id, 'name': name, 'email': email,
+                                    'phone_number': phone_number or None})
+                    if len(results) >= limit:
+                        break
+                end, chunk = start, chunk * 2
+            return results
+
+    def _matches(self, text, q):
+        text = text.lower()
+        if len(q) >= GRAM_SIZE:
+            return any(q in field for field in text.split(FIELD_SEPARATOR))
+        return PREFIX_MARK + q in document_grams(text)
+
+    def stats(self):
+        postings_bytes = sum(ids.buffer_info()[1] * ids.itemsize for ids in self._postings.values())
+        documents_bytes = self._documents.nbytes()
+        return {
+            'documents': len(self._documents),
+            'grams': len(self._postings),
+            'postings': self._entries,
+            'stale_postings': self._stale,
+            'postings_mb': round(postings_bytes / 1024 / 1024, 2),
+            'documents_mb': round(documents_bytes / 1024 / 1024, 2),
+            'approx_total_mb': round((postings_bytes + documents_bytes) / 1024 / 1024, 2),
+            'built_at': self.built_at,
+        }
+
+
+_index = LeadSuggestIndex()
+_build_lock = threading.Lock()
+_builder_lock = threading.Lock()
+_builder = None
+
+
+def is_enabled():
+    """
+    El índice se mantiene al día con un feed de cambios en el cache: sin
+    SHARED_CACHE no vería las escrituras de otros workers y /suggest usa el
+    backend de búsqueda.
+    """
+    return settings.SHARED_CACHE
+
+
+def get_suggest_index():
+    """
+    Índice del worker; None mientras se construye por primera vez (ver
+    start_build), para que la consulta use el backend de búsqueda en lugar
+    de esperar a leer toda la tabla. No toca la base de datos.
+    """
+    if not _index.is_built:
+        start_build()
+        return None
+    return _index
+
+
+def build_suggest_index():
+    """Construye (o reconstruye) el índice del worker en este hilo"""
+    with _build_lock:
+        return _index.build()
+
+
+def run_build():
+    """Construye el índice y luego lo sincroniza cada LEAD_SUGGEST_SYNC_SECONDS"""
+    while True:
+        try:
+            if _index.is_built:
+                _index.sync()
+            else:
+                build_suggest_index()
+            publish_state()
+        except Exception:
+            # Se reintenta en la siguiente vuelta
+            logger.exception('suggest: error al construir o sincronizar el índice')
+        finally:
+            close_old_connections()
+        time.sleep(settings.LEAD_SUGGEST_SYNC_SECONDS)
+
+
+def start_build():
+    """
+    Hilo daemon que construye el índice del worker y lo mantiene
+    sincronizado (uno por proceso); se llama al arrancar el worker.
+    """
+    global _builder
+    if not is_enabled():
+        return
+    with _builder_lock:
+        if _builder is not None and _builder.is_alive():
+            return
+        _builder = threading.Thread(target=run_build, name='lead-suggest-index', daemon=True)
+        _builder.start()
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def publish_state():
+    """Publica la huella del índice de este worker (ver worker_states)"""
+    name = worker_name()
+    state = dict(_index.fingerprint(), built_at=_index.built_at, synced_at=_index.synced_at)
+    cache.set(WORKER_KEY.format(name), state, max(60, 3 * settings.LEAD_SUGGEST_SYNC_SECONDS))
+    workers = cache.get(WORKERS_KEY) or []
+    if name not in workers:
+        cache.set(WORKERS_KEY, [*workers, name][-MAX_WORKERS:], None)
+
+
+def worker_states():
+    """{worker: huella} de los workers con el índice construido que publicaron hace poco"""
+    workers = cache.get(WORKERS_KEY) or []
+    states = cache.get_many([WORKER_KEY.format(name) for name in workers])
+    return {name: states[WORKER_KEY.format(name)] for name in workers if WORKER_KEY.format(name) in states}
+
+
+def refresh_local_index(ids):
+    """Aplica cambios hechos en este worker sin esperar a la sincronización"""
+    if _index.is_built:
+        _index.refresh(ids)
+
+
+def publish_changes(ids):
+    """Publica ids modificados en el feed compartido para los demás workers"""
+    ids = list(ids)
+    if not ids or not is_enabled():
+        return
+    cache.add(CHANGES_SEQ_KEY, 0, None)
+    try:
+        last = cache.incr(CHANGES_SEQ_KEY, len(ids))
+    except ValueError:
+        # La llave expiró entre add e incr: los workers reconstruyen al ver el salto
+        cache.set(CHANGES_SEQ_KEY, len(ids), None)
+        last = len(ids)
+    first = last - len(ids) + 1
+    cache.set_many({CHANGE_KEY.format(seq): lead_id for seq, lead_id in zip(range(first, last + 1), ids)},
+                   CHANGE_TTL)
+
+
+def request_rebuild():
+    """Cambia la generación: cada worker reconstruye su índice en la siguiente sincronización"""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
@@ -1,6 +1,21 @@
-from django.test import TestCase
+from io import StringIO
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.urls import reverse
 from rest_framework import status
+from lead.models import Lead
+from lead_type.models import LeadType
+from lead_search.backends import PostgresTrigramSearchBackend, SQLiteFTSSearchBackend, get_search_backend
+from lead_search.serializers import LeadSearchSerializer
+from lead_search import suggest
+from lead_search.suggest import (
+    LeadSuggestIndex, build_suggest_index, publish_changes, publish_state, refresh_local_index, request_rebuild,
+)
+from django.db import connection
+import unittest
+from unittest import mock
 
 class TestsLeadSearchViewSet(TestCase):
         
@@ -29,7 +44,7 @@ class TestsLeadSearchViewSet(TestCase):
             )    
             
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
 
 
@@ -46,7 +61,7 @@ class TestsLeadSearchViewSet(TestCase):
             )        
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
     
     
     
@@ -64,7 +79,7 @@ class TestsLeadSearchViewSet(TestCase):
             )        
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
 
     def test_success_search_by_10_results(self):    
@@ -79,7 +94,7 @@ class TestsLeadSearchViewSet(TestCase):
             )        
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)        
-        self.assertEqual(len(response.data), 10)
+        self.assertEqual(len(response.data['results']), 10)
 
 
     def test_by_status(self):
@@ -94,4 +109,382 @@ class TestsLeadSearchViewSet(TestCase):
             **self.headers
             )                
         self.assertEqual(response.status_code, status.HTTP_200_OK)        
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+    def test_success_search_paginates_with_cursor(self):
+
+        lead_type = LeadType.objects.create(name="En intento de compra")
+        for index in range(5):
+            Lead.objects.create(
+                name=f'cursor {index}', email=f'cursor{index}@enid.com', lead_type=lead_type)
+
+        seen = []
+        params = {'q': 'cursor', 'status': 'pending', 'limit': 2}
+        response = self.client.get(self.api, params, **self.headers)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(lead['name'] for lead in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'], **self.headers)
+
+        self.assertEqual(seen, [f'cursor {index}' for index in reversed(range(5))])
+
+    def test_success_search_limit_is_capped(self):
+
+        response = self.client.get(self.api, {'limit': 100000}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_success_search_invalid_cursor(self):
+
+        response = self.client.get(self.api, {'cursor': 'no-es-cursor'}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+
+class TestsLeadSearchRows(TestCase):
+
+    def setUp(self):
+        self.api = reverse('lead_search:lead-search')
+        lead_type = LeadType.objects.create(name="En intento de compra")
+        self.lead = Lead.objects.create(
+            name='Jonathan Medrano', email='jmedrano@9006.com', phone_number='5552967027',
+            lead_type=lead_type, products_interest_ids='[3]')
+
+    def test_success_same_output_as_model_serializer(self):
+
+        response = self.client.get(self.api, {'q': 'medrano'})
+
+        expected = dict(LeadSearchSerializer(self.lead).data)
+        self.assertEqual(response.data['status_choices'], expected.pop('status_choices'))
+        self.assertEqual(response.data['results'], [expected])
+
+    def test_success_sparse_fields(self):
+
+        response = self.client.get(self.api, {'q': 'medrano', 'fields': 'id,products'})
+        self.assertEqual(response.data['results'], [{'id': self.lead.id, 'products': [3]}])
+
+        response = self.client.get(self.api, {'fields': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestsLeadSearchBackends(TestCase):
+
+    def setUp(self):
+        self.api = reverse('lead_search:lead-search')
+        lead_type = LeadType.objects.create(name="En intento de compra")
+        self.lead = Lead.objects.create(
+            name='Jonathan Medrano', email='jmedrano@9006.com', phone_number='5552967027',
+            lead_type=lead_type)
+        Lead.objects.create(name='Otro Lead', email='otro@enid.com', lead_type=lead_type)
+
+    def search(self, q):
+        response = self.client.get(self.api, {'q': q, 'status': 'all'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [lead['id'] for lead in response.data['results']]
+
+    def test_success_substring_and_case_insensitive(self):
+
+        self.assertEqual(self.search('EDRAN'), [self.lead.id])
+        self.assertEqual(self.search('2967'), [self.lead.id])
+        self.assertEqual(self.search('9006.co'), [self.lead.id])
+
+    def test_success_short_query_falls_back(self):
+
+        self.assertEqual(self.search('Jo'), [self.lead.id])
+
+    def test_success_index_follows_updates_and_deletes(self):
+
+        self.lead.name = 'Nombre Cambiado'
+        self.lead.save()
+        self.assertEqual(self.search('Cambiado'), [self.lead.id])
+        self.assertEqual(self.search('Jonathan'), [])
+
+        self.lead.delete()
+        self.assertEqual(self.search('Cambiado'), [])
+
+    def test_success_full_phone_and_email_use_normalized_columns(self):
+
+        for q in ('+52 55 5296 7027', '(555) 296-7027', 'JMedrano@9006.COM'):
+            with self.subTest(q=q):
+                self.assertEqual(self.search(q), [self.lead.id])
+        self.assertEqual(self.search('+52 55 0000 0000'), [])
+
+    @override_settings(LEAD_SEARCH_BACKEND='lead_search.backends.IContainsSearchBackend')
+    def test_success_same_results_as_icontains(self):
+
+        for q in ('EDRAN', '2967', 'enid', 'zzz'):
+            with self.subTest(q=q):
+                expected = self.search(q)
+                with override_settings(LEAD_SEARCH_BACKEND=''):
+                    self.assertEqual(self.search(q), expected)
+
+    def test_success_postgres_setup_does_not_lock_the_table(self):
+
+        backend = PostgresTrigramSearchBackend()
+        with mock.patch.object(PostgresTrigramSearchBackend, 'connection') as connection_mock:
+            connection_mock.ops.quote_name.side_effect = lambda name: f'"{name}"'
+            cursor = connection_mock.cursor.return_value.__enter__.return_value
+            cursor.fetchone.return_value = (True,)
+            backend.setup()
+
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        creates = [sql for sql in statements if sql.startswith('CREATE INDEX')]
+        self.assertEqual(len(creates), 4)
+        self.assertTrue(all(sql.startswith('CREATE INDEX CONCURRENTLY') for sql in creates))
+        # Un índice inválido (CONCURRENTLY interrumpido) se quita antes de crearlo otra vez
+        self.assertEqual(sum(sql.startswith('DROP INDEX CONCURRENTLY IF EXISTS lead_') for sql in statements), 5)
+        self.assertFalse(any('ADD COLUMN' in sql for sql in statements))
+        self.assertFalse(PostgresTrigramSearchBackend.setup_on_migrate)
+        # La búsqueda usa la misma expresión que el índice
+        self.assertIn(backend.document(), backend.indexes()['lead_search_document_gin'])
+
+    def test_success_setup_command_is_idempotent(self):
+
+        out = StringIO()
+        call_command('setup_lead_search', stdout=out)
+        call_command('setup_lead_search', stdout=out)
+        self.assertIn(type(get_search_backend()).__name__, out.getvalue())
+        self.assertEqual(self.search('EDRAN'), [self.lead.id])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'FTS5 solo aplica a SQLite')
+    def test_success_sqlite_uses_fts(self):
+
+        self.assertIsInstance(get_search_backend(), SQLiteFTSSearchBackend)
+        queryset = get_search_backend().search(Lead.objects.all(), 'medrano')
+        self.assertIn('MATCH', str(queryset.query))
+
+
+@override_settings(SHARED_CACHE=True)
+class TestsLeadSuggest(TestCase):
+
+    def setUp(self):
+        self.api = reverse('lead_search:lead-suggest')
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        self.lead = Lead.objects.create(
+            name='Jonathan Medrano', email='jmedrano@9006.com', phone_number='5552967027',
+            lead_type=self.lead_type)
+        self.other = Lead.objects.create(name='Otro Lead', email='otro@enid.com', lead_type=self.lead_type)
+        build_suggest_index()
+
+    def suggest(self, q, **params):
+        response = self.client.get(self.api, {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [lead['id'] for lead in response.data['results']]
+
+    def test_success_substring_and_prefix(self):
+
+        response = self.client.get(self.api, {'q': 'EDRAN'})
+        self.assertEqual(response.data['results'], [{
+            'id': self.lead.id, 'name': 'Jonathan Medrano',
+            'email': 'jmedrano@9006.com', 'phone_number': '5552967027'}])
+        self.assertEqual(self.suggest('2967'), [self.lead.id])
+        self.assertEqual(self.suggest('52967027'), [self.lead.id])
+        self.assertEqual(self.suggest('52967028'), [])
+        self.assertEqual(self.suggest('j'), [self.lead.id])
+        self.assertEqual(self.suggest('ot'), [self.other.id])
+        self.assertEqual(self.suggest('zzz'), [])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_success_most_recent_first_and_limit(self):
+
+        leads = [Lead.objects.create(name=f'Medrano {i}', email=f'm{i}@enid.com', lead_type=self.lead_type)
+                 for i in range(30)]
+        build_suggest_index()
+
+        self.assertEqual(self.suggest('medrano', limit=3), [lead.id for lead in leads[::-1][:3]])
+        self.assertEqual(len(self.suggest('medrano', limit=1000)), 25)
+        response = self.client.get(self.api, {'q': 'medrano', 'limit': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_success_does_not_query_database(self):
+
+        self.suggest('medrano')
+        with self.assertNumQueries(0):
+            self.suggest('medrano')
+
+    @override_settings(LEAD_SUGGEST_SYNC_SECONDS=0)
+    def test_success_rebuild_does_not_block_queries(self):
+
+        # La reconstrucción corre en el hilo del índice: la consulta sigue con los datos anteriores
+        request_rebuild()
+        created = Lead.objects.bulk_create([Lead(name='Nuevo Medrano', email='nuevo@enid.com',
+                                                 lead_type=self.lead_type)])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('medrano'), [self.lead.id])
+
+        suggest._index.sync()
+        self.assertEqual(self.suggest('medrano'), [created[0].id, self.lead.id])
+
+    def test_success_follows_saves_and_deletes(self):
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead.name = 'Nombre Cambiado'
+            self.lead.save()
+        self.assertEqual(self.suggest('cambiado'), [self.lead.id])
+        self.assertEqual(self.suggest('jonathan'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead.delete()
+        self.assertEqual(self.suggest('cambiado'), [])
+
+    def test_success_sync_applies_changes_from_other_workers(self):
+
+        index = LeadSuggestIndex().build()
+        # Cambios que no pasan por save(): otro worker los publica en el feed
+        Lead.objects.filter(id=self.other.id).update(name='Renombrado')
+        publish_changes([self.other.id])
+        created = Lead.objects.bulk_create([Lead(name='Nuevo Lead', email='nuevo@enid.com',
+                                                 lead_type=self.lead_type)])
+
+        self.assertEqual([lead['id'] for lead in index.search('renombrado')], [])
+        index.sync()
+        self.assertEqual([lead['id'] for lead in index.search('renombrado')], [self.other.id])
+        self.assertEqual([lead['id'] for lead in index.search('nuevo')], [created[0].id])
+
+    def test_success_compaction_keeps_results(self):
+
+        index = LeadSuggestIndex().build()
+        for i in range(10):
+            index.add(self.lead.id, f'Medrano {i}', 'jmedrano@9006.com', None)
+        self.assertEqual(index.stats()['stale_postings'], 0)
+        self.assertEqual([lead['id'] for lead in index.search('medrano 9')], [self.lead.id])
+        self.assertEqual([lead['id'] for lead in index.search('medrano 3')], [])
+
+    def test_success_old_match_behind_many_candidates(self):
+
+        # El único resultado queda detrás de varios tramos de candidatos más recientes
+        rows = [(1, 'Medrano Único', 'unico@enid.com', None)]
+        rows += [(lead_id, f'Medrano {lead_id}', f'm{lead_id}@enid.com', None) for lead_id in range(2, 2000)]
+        index = LeadSuggestIndex().build(rows)
+
+        self.assertEqual([lead['id'] for lead in index.search('medrano úni')], [1])
+        self.assertEqual([lead['id'] for lead in index.search('medrano', limit=3)], [1999, 1998, 1997])
+
+    def test_success_packed_documents(self):
+
+        index = LeadSuggestIndex().build()
+        index.add(self.other.id, 'Otro Cambiado', 'otro@enid.com', None)
+        index.remove(self.lead.id)
+
+        self.assertEqual(index.search('cambiado'), [{'id': self.other.id, 'name': 'Otro Cambiado',
+                                                     'email': 'otro@enid.com', 'phone_number': None}])
+        self.assertEqual(index.search('medrano'), [])
+        # Los postings son de 4 bytes
+        self.assertEqual(index._postings['otr'].itemsize, 4)
+
+    def test_success_check_compares_live_worker_index(self):
+
+        cache.clear()
+        publish_state()
+        call_command('check_lead_suggest_index', wait=0, queries=5, stdout=StringIO())
+
+        # Un cambio que el índice del worker no vio
+        Lead.objects.filter(id=self.other.id).update(name='Sin Aviso')
+        with self.assertRaises(CommandError):
+            call_command('check_lead_suggest_index', wait=0, queries=0, stdout=StringIO())
+
+        refresh_local_index([self.other.id])
+        publish_state()
+        call_command('check_lead_suggest_index', wait=0, queries=0, stdout=StringIO())
+
+    def test_success_ids_beyond_32_bits(self):
+
+        index = LeadSuggestIndex().build()
+        index.add(2 ** 32 + 5, 'Medrano Grande', 'grande@enid.com', None)
+
+        self.assertEqual([lead['id'] for lead in index.search('medrano')], [2 ** 32 + 5, self.lead.id])
+
+    def test_success_backend_while_index_builds(self):
+
+        with mock.patch.object(suggest, '_index', LeadSuggestIndex()), \
+                mock.patch.object(suggest, 'start_build') as start_build:
+            self.assertEqual(self.suggest('medrano'), [self.lead.id])
+        start_build.assert_called_once_with()
+
+    @override_settings(SHARED_CACHE=False)
+    def test_success_backend_without_shared_cache(self):
+
+        # El índice no vería cambios de otros workers: se consulta la base
+        Lead.objects.filter(id=self.other.id).update(name='Otro Medrano')
+
+        self.assertEqual(self.suggest('medrano'), [self.other.id, self.lead.id])
+        self.assertEqual(self.suggest('medrano', limit=1), [self.other.id])
+        self.assertEqual(self.suggest(''), [])
+
+        cache.delete(suggest.CHANGES_SEQ_KEY)
+        publish_changes([self.other.id])
+        self.assertIsNone(cache.get(suggest.CHANGES_SEQ_KEY))
+
+
+@override_settings(LEAD_SEARCH_CACHE_TTL=60, SHARED_CACHE=True)
+class TestsLeadSearchResultCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.api = reverse('lead_search:lead-search')
+        self.api_stats = reverse('lead_search:lead-search-cache-stats')
+        self.lead_type = LeadType.objects.create(name="En intento de compra")
+        for i in range(3):
+            Lead.objects.create(name=f'Medrano {i}', email=f'm{i}@enid.com', lead_type=self.lead_type)
+
+    def test_success_hit_after_miss_without_queries(self):
+
+        first = self.client.get(self.api, {'q': 'medrano', 'limit': 2})
+        self.assertEqual(first['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.api, {'q': 'medrano', 'limit': 2})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+
+        # Otra página (cursor) u otros parámetros son otra entrada
+        third = self.client.get(first.data['next'])
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertEqual(len(third.data['results']), 1)
+
+        stats = self.client.get(self.api_stats).data
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 2, 0.3333))
+
+    def test_success_lead_write_invalidates(self):
+
+        self.client.get(self.api, {'q': 'medrano'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Lead.objects.create(name='Medrano nuevo', email='nuevo@enid.com', lead_type=self.lead_type)
+
+        response = self.client.get(self.api, {'q': 'medrano'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_success_existence_invalidates(self):
+
+        self.client.get(self.api, {'status': 'all'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('lead-existence'), {
+                'email': 'm0@enid.com', 'lead_type': self.lead_type.id, 'name': 'Renombrado',
+            }, format='json', HTTP_X_STORE_ID=1)
+
+        response = self.client.get(self.api, {'status': 'all'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Renombrado', [lead['name'] for lead in response.data['results']])
+
+    def test_success_reset_stats(self):
+
+        self.client.get(self.api)
+        response = self.client.delete(self.api_stats)
+        self.assertEqual((response.data['hits'], response.data['misses']), (0, 0))
+
+    @override_settings(LEAD_SEARCH_CACHE_TTL=0)
+    def test_success_disabled_by_default(self):
+
+        response = self.client.get(self.api)
+        self.assertNotIn('X-Cache', response)
+        self.assertFalse(self.client.get(self.api_stats).data['enabled'])
+
+    @override_settings(SHARED_CACHE=False)
+    def test_success_disabled_without_shared_cache(self):
+
+        response = self.client.get(self.api)
+        self.assertNotIn('X-Cache', response)
+
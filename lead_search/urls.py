@@ -6,4 +6,7 @@ app_name = 'lead_search'
 
 urlpatterns = [
     path('', views.LeadSearchViewSet.as_view({'get': 'search'}), name='lead-search'),
+    path('suggest/', views.LeadSearchViewSet.as_view({'get': 'suggest'}), name='lead-suggest'),
+    path('cache-stats/', views.LeadSearchViewSet.as_view({'get': 'cache_stats', 'delete': 'cache_stats'}),
+         name='lead-search-cache-stats'),
 ]
\ No newline at end of file
@@ -1,21 +1,61 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
+from lead.lookup import exact_lookup
 from lead.models import Lead
-from lead_search.serializers import LeadSearchSerializer
-from django.db.models import Q
+from lead.pagination import KeysetPagination
+from lead_search import result_cache
+from lead_search.backends import get_search_backend
+from lead.row_serializers import STATUS_CHOICES
+from lead_search.serializers import LeadSearchRowSerializer
+from lead_search import suggest as suggest_index
 from rest_framework.decorators import action
 
+SUGGEST_DEFAULT_LIMIT = 10
+SUGGEST_MAX_LIMIT = 25
+
+
 class LeadSearchViewSet(viewsets.ViewSet):
+    pagination_class = KeysetPagination
         
     def search(self, request):
-        leads = self.perform_search(request)        
-        serializer = LeadSearchSerializer(leads, many=True)
-        return Response(serializer.data)
-    
+        # El tamaño de página sale de ?limit= (con tope) y la continuación de ?cursor=
+        paginator = self.pagination_class()
+        rows_serializer = LeadSearchRowSerializer(request.query_params.get('fields'))
+        if not result_cache.is_enabled():
+            data = self.search_page(request, paginator, rows_serializer)
+            return paginator.get_paginated_response(data, status_choices=STATUS_CHOICES)
+
+        key = result_cache.make_key(
+            request.query_params.get('q', ''),
+            request.query_params.get('status', 'pending'),
+            paginator.get_page_size(request),
+            request.query_params.get(paginator.cursor_query_param),
+            rows_serializer.names,
+        )
+        cached = result_cache.fetch(key)
+        if cached is None:
+            data = self.search_page(request, paginator, rows_serializer)
+            result_cache.store(key, (data, paginator.next_position))
+        else:
+            # La URL de next se arma con la petición actual, no se guarda
+            data, paginator.next_position = cached
+            paginator.request = request
+        response = paginator.get_paginated_response(data, status_choices=STATUS_CHOICES)
+        response['X-Cache'] = 'MISS' if cached is None else 'HIT'
+        return response
+
+    def search_page(self, request, paginator, rows_serializer):
+        queryset = self.perform_search(request)
+        if 'rank' in queryset.query.annotations:
+            # Backends con ranking: primero relevancia y luego el orden habitual
+            paginator.ordering = ('-rank',) + paginator.ordering
+        queryset = queryset.values(*rows_serializer.columns(*paginator.fields))
+        rows = paginator.paginate_queryset(queryset, request, view=self)
+        return rows_serializer.serialize(rows)
+
     def perform_search(self, request):
         q = request.query_params.get('q', '')
         status = request.query_params.get('status', 'pending')
-        limit = request.query_params.get('limit', 30)
         
         # Si status es 'all', comenzamos con todos los leads
         if status == 'all':
@@ -25,10 +65,39 @@ class LeadSearchViewSet(viewsets.ViewSet):
             queryset = Lead.objects.filter(status=status)
 
         if q:
-            queryset = queryset.filter(
-                Q(name__icontains=q) |        
-                Q(email__icontains=q) |            
-                Q(phone_number__icontains=q)
-            )
+            # Email o teléfono completos: búsqueda exacta por las columnas normalizadas
+            lookup = exact_lookup(q)
+            if lookup is not None:
+                queryset = queryset.filter(lookup)
+            else:
+                queryset = get_search_backend().search(queryset, q)
             
-        return queryset.order_by('-created_at')[:int(limit)]
\ No newline at end of file
+        return queryset
+
+    def suggest(self, request):
+        # Typeahead: se responde desde el índice en memoria del worker, sin consultar leads
+        # (desde el backend de búsqueda mientras el índice se construye)
+        q = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', SUGGEST_DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'limit': 'Debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), SUGGEST_MAX_LIMIT)
+        index = suggest_index.get_suggest_index() if suggest_index.is_enabled() else None
+        if index is None:
+            return Response({'results': self.suggest_from_backend(q, limit)})
+        return Response({'results': index.search(q, limit)})
+
+    def suggest_from_backend(self, q, limit):
+        """Sugerencias desde la base (backend de búsqueda) cuando el índice en memoria no está disponible"""
+        q = q.strip()
+        if not q:
+            return []
+        queryset = get_search_backend().search(Lead.objects.all(), q).order_by('-created_at', '-id')
+        return list(queryset.values(*suggest_index.FIELDS)[:limit])
+
+    def cache_stats(self, request):
+        # Aciertos / fallos del cache de resultados para ajustar LEAD_SEARCH_CACHE_TTL
+        if request.method == 'DELETE':
+            result_cache.reset_stats()
+        return Response(result_cache.stats())
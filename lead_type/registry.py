@@ -0,0 +1,91 @@
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from lead_type.models import LeadType
+
+VERSION_KEY = 'lead_type:registry:version'
+# Segundos entre lecturas de la versión compartida (evita un round trip al cache por fila)
+CHECK_INTERVAL = 1.0
+
+
+class LeadTypeRegistry:
+    """
+    Cache en proceso de la tabla lead_type (son pocos registros).
+
+    La versión se comparte en el cache de Django: los signals de LeadType la
+    cambian y cada worker recarga su copia en la siguiente consulta. Sin
+    SHARED_CACHE la versión no llega a los demás workers y la copia se
+    recarga cada CHECK_INTERVAL segundos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}
+        self._version = None
+        self._checked_at = 0.0
+
+    def current_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        self._checked_at = 0.0
+
+    def reload(self, version=None):
+        # La versión se lee antes que la tabla: una invalidación que llegue durante la
+        # carga cambia la versión compartida y la copia se vuelve a cargar
+        if version is None:
+            version = self.current_version()
+        with self._lock:
+            self._types = LeadType.objects.in_bulk()
+            self._version = version
+        return self._types
+
+    def all(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < CHECK_INTERVAL:
+            return self._types
+
+        self._checked_at = now
+        if not settings.SHARED_CACHE:
+            return self.reload()
+        version = self.current_version()
+        if version != self._version:
+            return self.reload(version)
+        return self._types
+
+    def get(self, pk):
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise LeadType.DoesNotExist(f'LeadType {pk!r} no existe')
+
+        lead_type = self.all().get(pk)
+        if lead_type is None:
+            # Puede haberse creado sin pasar por signals (bulk_create); se recarga una vez
+            lead_type = self.reload().get(pk)
+        if lead_type is None:
+            raise LeadType.DoesNotExist(f'LeadType {pk} no existe')
+        return lead_type
+
+    def many(self, pks):
+        """Diccionario {id: LeadType} que incluye los ids pedidos si existen (recarga a lo más una vez)"""
+        types = self.all()
+        if any(pk not in types for pk in pks):
+            types = self.reload()
+        return types
+
+    def name(self, pk):
+        try:
+            return self.get(pk).name
+        except LeadType.DoesNotExist:
+            return None
+
+
+lead_types = LeadTypeRegistry()
@@ -1,8 +1,25 @@
 from rest_framework import serializers
 from lead_type.models import LeadType
+from lead_type.registry import lead_types
 
 class LeadTypeSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = LeadType
         fields = '__all__'
+
+
+class LeadTypeRegistryField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField que valida contra el registro en memoria en lugar de consultar la tabla"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', LeadType.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return lead_types.get(data)
+        except LeadType.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
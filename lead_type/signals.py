@@ -1,7 +1,9 @@
 import os
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.db.models.signals import post_migrate, post_save, post_delete
 from django.dispatch import receiver
 from lead_type.models import LeadType
+from lead_type.registry import lead_types
 from decouple import config
 
 @receiver(post_migrate)
@@ -21,5 +23,12 @@ def create_lead_types(sender, **kwargs):
                 
                 LeadType.objects.get_or_create(
                     id=lead_type_id, defaults={'name': lead_type_name})
-                        
 
+
+@receiver(post_save, sender=LeadType)
+@receiver(post_delete, sender=LeadType)
+def invalidate_lead_types(sender, **kwargs):
+    # Se invalida ya (este proceso ve el cambio dentro de su transacción) y otra vez
+    # después del commit, para que ningún worker se quede con datos previos al commit
+    lead_types.invalidate()
+    transaction.on_commit(lead_types.invalidate)
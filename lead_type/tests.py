@@ -1,3 +1,83 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from unittest import mock
+from lead_type.models import LeadType
+from lead_type.registry import LeadTypeRegistry, lead_types
 
-# Create your tests here.
+
+@override_settings(SHARED_CACHE=True)
+class TestsLeadTypeRegistry(TestCase):
+
+    def setUp(self):
+        self.lead_type = LeadType.objects.create(name="Al registrar orden")
+
+    def test_success_get_without_queries_once_loaded(self):
+
+        lead_types.get(self.lead_type.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(lead_types.get(self.lead_type.id).name, "Al registrar orden")
+            self.assertEqual(lead_types.name(str(self.lead_type.id)), "Al registrar orden")
+
+    def test_success_unknown_type_raises(self):
+
+        with self.assertRaises(LeadType.DoesNotExist):
+            lead_types.get(999999)
+
+        with self.assertRaises(LeadType.DoesNotExist):
+            lead_types.get('abc')
+
+    def test_success_invalidation_on_save_and_delete(self):
+
+        lead_types.get(self.lead_type.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead_type.name = "Renombrado"
+            self.lead_type.save()
+        self.assertEqual(lead_types.get(self.lead_type.id).name, "Renombrado")
+
+        pk = self.lead_type.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead_type.delete()
+        self.assertIsNone(lead_types.name(pk))
+
+    def test_success_other_worker_sees_shared_version(self):
+
+        other_worker = LeadTypeRegistry()
+        self.assertEqual(other_worker.get(self.lead_type.id).name, "Al registrar orden")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead_type.name = "Renombrado"
+            self.lead_type.save()
+
+        with mock.patch('lead_type.registry.CHECK_INTERVAL', 0):
+            self.assertEqual(other_worker.get(self.lead_type.id).name, "Renombrado")
+
+    def test_success_invalidation_during_reload_is_not_lost(self):
+
+        other_worker = LeadTypeRegistry()
+        in_bulk = LeadType.objects.in_bulk
+
+        def in_bulk_then_rename(*args, **kwargs):
+            # Otro proceso renombra e invalida después de que se leyó la tabla
+            types = in_bulk(*args, **kwargs)
+            LeadType.objects.filter(id=self.lead_type.id).update(name="Renombrado")
+            other_worker.invalidate()
+            return types
+
+        with mock.patch.object(LeadType.objects, 'in_bulk', in_bulk_then_rename):
+            self.assertEqual(other_worker.reload()[self.lead_type.id].name, "Al registrar orden")
+
+        with mock.patch('lead_type.registry.CHECK_INTERVAL', 0):
+            self.assertEqual(other_worker.get(self.lead_type.id).name, "Renombrado")
+
+    @override_settings(SHARED_CACHE=False)
+    def test_success_reloads_without_shared_cache(self):
+
+        other_worker = LeadTypeRegistry()
+        other_worker.get(self.lead_type.id)
+        # Sin cache compartido la versión no llega a otros workers: se recarga por intervalo
+        LeadType.objects.filter(id=self.lead_type.id).update(name="Renombrado")
+
+        self.assertEqual(other_worker.get(self.lead_type.id).name, "Al registrar orden")
+        with mock.patch('lead_type.registry.CHECK_INTERVAL', 0):
+            self.assertEqual(other_worker.get(self.lead_type.id).name, "Renombrado")
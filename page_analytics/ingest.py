@@ -0,0 +1,106 @@
+import json
+from datetime import datetime
+from django.db import transaction
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import BaseParser
+from .models import PageAccess
+from .serializers import PageAccessCreateSerializer
+
+# Máximo de eventos por petición en page-access/batch y filas por INSERT
+BATCH_MAX_SIZE = 500
+INSERT_CHUNK_SIZE = 250
+
+
+class InvalidLine:
+    """Línea de un cuerpo NDJSON que no es JSON válido; se rechaza sola, no todo el lote"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class NDJSONParser(BaseParser):
+    """Un evento JSON por línea (application/x-ndjson); las líneas vacías se ignoran"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            text = stream.read().decode('utf-8') if stream is not None else ''
+        except UnicodeDecodeError:
+            raise ParseError('El cuerpo NDJSON debe estar en UTF-8')
+        items = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as error:
+                items.append(InvalidLine(f'JSON inválido: {error}'))
+        return items
+
+
+# Un serializer para todo el proceso: sus campos validan cada evento igual que
+# PageAccessCreateSerializer (null, caracteres nulos, espacios, longitudes, tipos)
+SERIALIZER = PageAccessCreateSerializer()
+SERIALIZER_FIELDS = [(name, field, getattr(SERIALIZER, f'validate_{name}', None))
+                     for name, field in SERIALIZER.fields.items() if not field.read_only]
+
+
+def clean_event(item):
+    """
+    Validación ligera de un evento (sin instanciar un serializer por fila):
+    regresa (valores, None) o (None, {campo: [error]}). Cada valor pasa por
+    run_validation del campo del serializer y por su validate_<campo>; las
+    llaves desconocidas se ignoran, como en PageAccessCreateSerializer.
+    """
+    if isinstance(item, InvalidLine):
+        return None, {'non_field_errors': [item.error]}
+    if not isinstance(item, dict):
+        return None, {'non_field_errors': ['Se esperaba un objeto']}
+
+    values = {}
+    errors = {}
+    for name, field, validate in SERIALIZER_FIELDS:
+        if name not in item:
+            if field.required:
+                errors[name] = [str(field.error_messages['required'])]
+            continue
+        try:
+            value = field.run_validation(item[name])
+            values[name] = validate(value) if validate is not None else value
+        except ValidationError as error:
+            errors[name] = [str(detail) for detail in error.detail]
+    return (None, errors) if errors else (values, None)
+
+
+def validate_events(items):
+    """Regresa ([valores válidos], [{'index': i, 'errors': {...}}]) para `items`"""
+    valid = []
+    rejected = []
+    for index, item in enumerate(items):
+        values, errors = clean_event(item)
+        if errors:
+            rejected.append({'index': index, 'errors': errors})
+        else:
+            valid.append(values)
+    return valid, rejected
+
+
+def insert_events(records):
+    """
+    Inserta con bulk_create, en bloques de INSERT_CHUNK_SIZE y en una
+    transacción, registros {'values': {...}} ya validados; con 'ingest_id' y
+    'received_at' (los del spool) los ingest_id repetidos se ignoran y
+    created_at es el momento en que se recibió el evento.
+    """
+    rows = []
+    for record in records:
+        row = PageAccess(**record['values'])
+        if record.get('ingest_id'):
+            row.ingest_id = record['ingest_id']
+        if record.get('received_at'):
+            row.created_at = datetime.fromisoformat(record['received_at'])
+        rows.append(row)
+
+    with transaction.atomic():
+        PageAccess.objects.bulk_create(rows, batch_size=INSERT_CHUNK_SIZE, ignore_conflicts=True)
+    return len(rows)
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
-from page_analytics.models import PageAccess, PageSection, UserJourney, PagePerformance
+from page_analytics.models import (
+    PageAccess, PageLoadDigest, PageSection, PageSessionSketch, UserJourney, PagePerformance
+)
 
 
 class Command(BaseCommand):
@@ -25,6 +27,9 @@ class Command(BaseCommand):
         PageAccess.objects.all().delete()
         UserJourney.objects.all().delete()
         PagePerformance.objects.all().delete()
+        # Los sketches de sesiones y los digests de tiempos se recalculan al leerse
+        PageSessionSketch.objects.all().delete()
+        PageLoadDigest.objects.all().delete()
         
         if options['sections']:
             PageSection.objects.all().delete()
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from page_analytics import spool
+
+
+class Command(BaseCommand):
+    help = 'Carga a la base los accesos pendientes en el spool de ingesta de page_analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Seguir cargando cada PAGE_ANALYTICS_SPOOL_FLUSH_SECONDS (en lugar del hilo en cada worker)'
+        )
+
+    def handle(self, *args, **options):
+        if not spool.is_enabled():
+            raise CommandError('PAGE_ANALYTICS_SPOOL_DIR no está configurado')
+
+        pending = spool.get_spool()
+        if options['loop']:
+            self.stdout.write(
+                f"Cargando el spool {settings.PAGE_ANALYTICS_SPOOL_DIR} "
+                f"cada {settings.PAGE_ANALYTICS_SPOOL_FLUSH_SECONDS}s..."
+            )
+            spool.run_flusher(pending)
+            return
+
+        loaded = pending.flush()
+        stats = pending.stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Se cargaron {loaded} accesos; quedan {stats['ready_segments']} segmentos listos "
+                f"y {stats['open_segments']} abiertos ({stats['pending_bytes']} bytes)"
+            )
+        )
@@ -40,8 +40,12 @@ class PageAccess(models.Model):
     # Metadatos adicionales
     metadata = models.JSONField(default=dict, blank=True, help_text="Metadatos adicionales en formato JSON")
     
-    # Timestamps
-    created_at = models.DateTimeField(auto_now_add=True, help_text="Fecha y hora del acceso")
+    # Identificador asignado al entrar al spool de ingesta (evita duplicados al recargar un segmento)
+    ingest_id = models.UUIDField(null=True, blank=True, unique=True, editable=False,
+                                 help_text="ID de ingesta (solo eventos que pasaron por el spool)")
+    
+    # Timestamps (created_at es cuándo se recibió el acceso, aunque se inserte después desde el spool)
+    created_at = models.DateTimeField(default=timezone.now, editable=False, help_text="Fecha y hora del acceso")
     updated_at = models.DateTimeField(auto_now=True, help_text="Fecha y hora de última actualización")
     
     class Meta:
@@ -154,4 +158,42 @@ class PagePerformance(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.page_url} - {self.date}" 
\ No newline at end of file
+        return f"{self.page_url} - {self.date}"
+
+
+class PageSessionSketch(models.Model):
+    """
+    Sketch HyperLogLog (app.hyperloglog) de los session_id con accesos cada día.
+    Hay una fila por día cerrado aunque no haya accesos; se combinan para
+    estimar sesiones únicas en cualquier rango.
+    """
+    date = models.DateField(unique=True, help_text="Fecha de los accesos")
+    registers = models.BinaryField(help_text="Registros del sketch (comprimidos)")
+
+    class Meta:
+        db_table = 'page_analytics_session_sketch'
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Sesiones únicas del {self.date}"
+
+
+class PageLoadDigest(models.Model):
+    """
+    t-digest (app.tdigest) de time_on_page de una página en un día cerrado;
+    se combinan para calcular p75/p95 de cualquier rango sin ordenar accesos.
+    Un día sin accesos se guarda como una fila con page_url vacío.
+    """
+    date = models.DateField(help_text="Fecha de los accesos")
+    page_url = models.CharField(max_length=500, blank=True, help_text="URL de la página")
+    centroids = models.BinaryField(help_text="Centroides del digest (comprimidos)")
+
+    class Meta:
+        db_table = 'page_analytics_load_digest'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'page_url'], name='page_load_digest_unique'),
+        ]
+
+    def __str__(self):
+        return f"Digest de {self.page_url} del {self.date}"
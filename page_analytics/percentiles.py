@@ -0,0 +1,98 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db.models import Aggregate, FloatField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from app.tdigest import TDigest
+from .models import PageAccess, PageLoadDigest
+from .spool import last_settled_day
+
+# Percentiles de performance: (llave en la respuesta, percentil)
+PERCENTILES = (
+    ('load_time_p75', 0.75),
+    ('load_time_p95', 0.95),
+)
+# En PostgreSQL los rangos de hasta estos días se calculan exactos con percentile_cont
+EXACT_MAX_DAYS = 31
+
+
+class PercentileCont(Aggregate):
+    """percentile_cont(p) WITHIN GROUP (ORDER BY expresión); solo PostgreSQL"""
+    function = 'PERCENTILE_CONT'
+    name = 'PercentileCont'
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+def page_digests(start_date, end_date):
+    """{(fecha, page_url): TDigest} con time_on_page de los accesos de cada página y día del rango"""
+    start = timezone.make_aware(datetime.combine(start_date, time.min))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    rows = (
+        PageAccess.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at'))
+        .values_list('day', 'page_url', 'time_on_page')
+        .order_by()
+    )
+    digests = defaultdict(TDigest)
+    for day, page_url, time_on_page in rows.iterator(chunk_size=5000):
+        digests[(day, page_url)].add(time_on_page)
+    return digests
+
+
+def stored_digests(start_date, end_date):
+    """
+    {(fecha, page_url): TDigest} de [start_date, end_date] (días cerrados)
+    leídos de PageLoadDigest. Los días que falten se calculan una vez con
+    page_digests y se guardan.
+    """
+    if start_date > end_date:
+        return {}
+    stored = {}
+    stored_days = set()
+    rows = PageLoadDigest.objects.filter(date__range=(start_date, end_date)).values_list('date', 'page_url', 'centroids')
+    for day, page_url, centroids in rows:
+        stored_days.add(day)
+        if page_url:
+            stored[(day, page_url)] = TDigest.from_bytes(centroids)
+
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    missing = [day for day in days if day not in stored_days]
+    if missing:
+        computed = page_digests(missing[0], missing[-1])
+        missing = set(missing)
+        rows = []
+        for (day, page_url), digest in computed.items():
+            if day in missing:
+                stored[(day, page_url)] = digest
+                rows.append(PageLoadDigest(date=day, page_url=page_url, centroids=digest.to_bytes()))
+        # Marca los días sin accesos como calculados
+        empty = missing - {day for day, _ in computed}
+        rows.extend(PageLoadDigest(date=day, page_url='', centroids=TDigest().to_bytes()) for day in empty)
+        PageLoadDigest.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+    return stored
+
+
+def page_percentiles(start_date, end_date):
+    """
+    {page_url: {'load_time_p75': ..., 'load_time_p95': ...}} de [start_date,
+    end_date]: combina los digests diarios de cada página (los de días
+    cerrados quedan guardados; hoy y los días que el spool todavía no termina
+    de cargar se calculan en vivo).
+    """
+    settled = last_settled_day()
+    digests = stored_digests(start_date, min(end_date, settled))
+    if end_date > settled:
+        digests.update(page_digests(max(start_date, settled + timedelta(days=1)), end_date))
+
+    by_page = defaultdict(list)
+    for (_, page_url), digest in digests.items():
+        by_page[page_url].append(digest)
+    percentiles = {}
+    for page_url, day_digests in by_page.items():
+        merged = TDigest.merge(day_digests)
+        percentiles[page_url] = {key: merged.quantile(q) for key, q in PERCENTILES}
+    return percentiles
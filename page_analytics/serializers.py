@@ -123,4 +123,25 @@ class PagePerformanceAnalyticsSerializer(serializers.Serializer):
     load_time_p95 = serializers.FloatField()
     page_views = serializers.IntegerField()
     unique_visitors = serializers.IntegerField()
-    conversion_rate = serializers.FloatField() 
\ No newline at end of file
+    conversion_rate = serializers.FloatField()
+
+
+class UniqueSessionsBucketSerializer(serializers.Serializer):
+    """
+    Serializer para sesiones únicas de un día, semana o mes
+    """
+    date = serializers.DateField()
+    unique_sessions = serializers.IntegerField()
+    error_bound = serializers.IntegerField()
+
+
+class UniqueSessionsSerializer(serializers.Serializer):
+    """
+    Serializer para sesiones únicas estimadas (HyperLogLog); error_bound es el margen con ~95% de confianza
+    """
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    unique_sessions = serializers.IntegerField()
+    error_bound = serializers.IntegerField()
+    relative_error = serializers.FloatField()
+    series = UniqueSessionsBucketSerializer(many=True)
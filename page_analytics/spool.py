@@ -0,0 +1,329 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections
+from django.utils import timezone
+from .ingest import insert_events
+
+logger = logging.getLogger(__name__)
+
+# Ciclo de vida de un segmento: .creating (recién creado, todavía sin flock) ->
+# .open (un proceso lo escribe, con flock) -> .ready
+# (rotado o de un proceso muerto) -> .flushing (un flusher lo reclamó) -> se borra
+# después del commit. ingest_id es único en PageAccess, así que volver a cargar un
+# segmento (el flusher murió entre el commit y el borrado) no duplica eventos. Un
+# segmento que falla por sus datos vuelve a .ready con el intento en el nombre
+# ('~2') y tras PAGE_ANALYTICS_SPOOL_MAX_ATTEMPTS se aparta como .failed, para no
+# detener la carga de los siguientes.
+CREATING, OPEN, READY, FLUSHING, FAILED = '.creating', '.open', '.ready', '.flushing', '.failed'
+ATTEMPT_SEPARATOR = '~'
+# Un .flushing sin tocar en este tiempo es de un flusher que murió y se reintenta;
+# un .creating de esa edad es de un proceso que murió antes de renombrarlo (está vacío)
+FLUSHING_TIMEOUT = 300
+# received_at se toma antes de abrir el segmento: margen sobre su momento de creación
+SETTLE_MARGIN = 60
+
+
+def is_enabled():
+    return bool(settings.PAGE_ANALYTICS_SPOOL_DIR)
+
+
+def segment_created_at(name):
+    """Los nombres empiezan con el momento de creación en nanosegundos"""
+    try:
+        return int(name.split('-', 1)[0]) / 1e9
+    except ValueError:
+        return None
+
+
+def split_attempts(base):
+    """('nombre sin intentos', intentos fallidos) de un nombre de segmento sin sufijo"""
+    head, separator, attempts = base.rpartition(ATTEMPT_SEPARATOR)
+    if separator and attempts.isdigit():
+        return head, int(attempts)
+    return base, 0
+
+
+class Spool:
+    """
+    Spool durable en disco para PageAccess: append() escribe los eventos
+    (una línea JSON cada uno) en el segmento abierto del proceso y regresa
+    cuando están en disco; flush() los carga a la base en bloque.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fd = None
+        self._path = None
+        self._opened_at = 0.0
+        self._size = 0
+        self._sequence = 0
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    # Escritura
+
+    def append(self, events):
+        """Agrega [valores] al spool; regresa los ingest_id asignados"""
+        received_at = timezone.now().isoformat()
+        records = [{'ingest_id': str(uuid.uuid4()), 'received_at': received_at, 'values': values}
+                   for values in events]
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode()
+        with self._lock:
+            if self._fd is not None and self._is_old():
+                self._seal()
+            if self._fd is None:
+                self._open_segment()
+            os.write(self._fd, data)
+            if settings.PAGE_ANALYTICS_SPOOL_FSYNC:
+                os.fsync(self._fd)
+            self._size += len(data)
+            if self._size >= settings.PAGE_ANALYTICS_SPOOL_SEGMENT_BYTES:
+                self._seal()
+        return [record['ingest_id'] for record in records]
+
+    def _open_segment(self):
+        self._sequence += 1
+        creating = self.path(f'{time.time_ns()}-{os.getpid()}-{self._sequence}{CREATING}')
+        fd = os.open(creating, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        # El candado marca el segmento como vivo; se libera solo si el proceso muere. Se toma
+        # antes de que exista el .open: recover nunca ve un .open sin candado de un proceso vivo
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._path = creating[:-len(CREATING)] + OPEN
+        os.rename(creating, self._path)
+        self._fd = fd
+        self._opened_at = time.monotonic()
+        self._size = 0
+
+    def _seal(self):
+        os.rename(self._path, self._path[:-len(OPEN)] + READY)
+        os.close(self._fd)
+        self._fd = None
+        self._path = None
+
+    def _is_old(self):
+        return time.monotonic() - self._opened_at >= settings.PAGE_ANALYTICS_SPOOL_SEGMENT_SECONDS
+
+    def rotate(self, force=False):
+        """Cierra el segmento abierto si ya es viejo (o si force) para que se pueda cargar"""
+        with self._lock:
+            if self._fd is not None and (force or self._is_old()):
+                self._seal()
+
+    # Carga
+
+    def recover(self):
+        """
+        Marca como .ready los .open de procesos que murieron (su flock ya no
+        existe), regresa a .ready los .flushing abandonados y borra los
+        .creating abandonados.
+        """
+        for name in os.listdir(self.directory):
+            path = self.path(name)
+            if name.endswith(OPEN) and path != self._path:
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                except FileNotFoundError:
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                else:
+                    os.rename(path, path[:-len(OPEN)] + READY)
+                finally:
+                    os.close(fd)
+            elif name.endswith(FLUSHING):
+                try:
+                    if time.time() - os.path.getmtime(path) > FLUSHING_TIMEOUT:
+                        os.rename(path, path[:-len(FLUSHING)] + READY)
+                except FileNotFoundError:
+                    continue
+            elif name.endswith(CREATING):
+                try:
+                    if time.time() - os.path.getmtime(path) > FLUSHING_TIMEOUT:
+                        os.remove(path)
+                except FileNotFoundError:
+                    continue
+
+    def claim(self):
+        """Siguiente segmento .ready (el más viejo), reclamado con un rename atómico; None si no hay"""
+        for name in sorted(name for name in os.listdir(self.directory) if name.endswith(READY)):
+            path = self.path(name)
+            claimed = path[:-len(READY)] + FLUSHING
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                # Otro flusher lo tomó primero
+                continue
+            os.utime(claimed)
+            return claimed
+        return None
+
+    def load(self, path):
+        """Carga un segmento reclamado a PageAccess y lo borra después del commit; regresa los eventos"""
+        records = []
+        with open(path, 'rb') as segment:
+            for number, line in enumerate(segment, start=1):
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Última línea a medio escribir cuando el proceso murió: nunca se confirmó al cliente
+                    logger.warning('spool: línea %s inválida en %s', number, os.path.basename(path))
+        try:
+            insert_events(records)
+        except (OperationalError, InterfaceError):
+            # Base caída o conexión perdida: se deja listo y se reintenta en la siguiente pasada
+            os.rename(path, path[:-len(FLUSHING)] + READY)
+            raise
+        except Exception:
+            self.fail(path)
+            return 0
+        os.remove(path)
+        return len(records)
+
+    def fail(self, path):
+        """Un segmento que no se pudo insertar por sus datos: otro intento o .failed"""
+        base, attempts = split_attempts(path[:-len(FLUSHING)])
+        attempts += 1
+        if attempts >= settings.PAGE_ANALYTICS_SPOOL_MAX_ATTEMPTS:
+            os.rename(path, base + FAILED)
+            logger.exception('spool: %s falló %s veces; se apartó como %s',
+                             os.path.basename(base), attempts, FAILED)
+        else:
+            os.rename(path, f'{base}{ATTEMPT_SEPARATOR}{attempts}{READY}')
+            logger.exception('spool: error al cargar %s (intento %s)', os.path.basename(base), attempts)
+
+    def flush(self):
+        """Rota el segmento propio si es viejo, recupera los abandonados y carga todos los listos"""
+        self.rotate()
+        self.recover()
+        loaded = 0
+        while True:
+            path = self.claim()
+            if path is None:
+                return loaded
+            loaded += self.load(path)
+
+    def oldest_pending(self):
+        """Momento de creación del segmento pendiente (no .failed) más viejo con eventos; None si no hay"""
+        oldest = None
+        for name in os.listdir(self.directory):
+            if os.path.splitext(name)[1] not in (OPEN, READY, FLUSHING):
+                continue
+            try:
+                size = os.path.getsize(self.path(name))
+            except FileNotFoundError:
+                continue
+            created_at = segment_created_at(name)
+            if size and created_at is not None:
+                oldest = created_at if oldest is None else min(oldest, created_at)
+        return oldest
+
+    def stats(self):
+        """
+        Profundidad y retraso del spool: segmentos y bytes pendientes y edad del
+        más viejo; los .failed se cuentan aparte (no se vuelven a cargar solos).
+        """
+        segments = {OPEN: 0, READY: 0, FLUSHING: 0, FAILED: 0}
+        pending_bytes = failed_bytes = 0
+        oldest = None
+        for name in os.listdir(self.directory):
+            suffix = os.path.splitext(name)[1]
+            if suffix not in segments:
+                continue
+            try:
+                size = os.path.getsize(self.path(name))
+            except FileNotFoundError:
+                continue
+            segments[suffix] += 1
+            if suffix == FAILED:
+                failed_bytes += size
+                continue
+            pending_bytes += size
+            created_at = segment_created_at(name)
+            if size and created_at is not None:
+                oldest = created_at if oldest is None else min(oldest, created_at)
+        return {
+            'open_segments': segments[OPEN],
+            'ready_segments': segments[READY],
+            'flushing_segments': segments[FLUSHING],
+            'failed_segments': segments[FAILED],
+            'pending_bytes': pending_bytes,
+            'failed_bytes': failed_bytes,
+            'lag_seconds': round(time.time() - oldest, 3) if oldest is not None else 0,
+        }
+
+
+_spools = {}
+_spools_lock = threading.Lock()
+_flusher = None
+
+
+def get_spool():
+    """Spool del proceso para PAGE_ANALYTICS_SPOOL_DIR"""
+    directory = settings.PAGE_ANALYTICS_SPOOL_DIR
+    with _spools_lock:
+        if directory not in _spools:
+            _spools[directory] = Spool(directory)
+        return _spools[directory]
+
+
+def last_settled_day():
+    """
+    Último día cerrado con todos sus accesos ya en PageAccess: ayer, o el día
+    anterior al del segmento pendiente más viejo (sus eventos pueden tener un
+    received_at de ese día). Solo los días hasta aquí se pueden guardar como
+    sketches o digests; los siguientes se calculan en vivo. Cada servidor ve
+    solo su spool: con varios, PAGE_ANALYTICS_SPOOL_DIR debe ser compartido.
+    """
+    yesterday = timezone.localdate() - timedelta(days=1)
+    if not is_enabled():
+        return yesterday
+    oldest = get_spool().oldest_pending()
+    if oldest is None:
+        return yesterday
+    pending_since = datetime.fromtimestamp(oldest - SETTLE_MARGIN, tz=timezone.get_current_timezone())
+    return min(yesterday, pending_since.date() - timedelta(days=1))
+
+
+def enqueue(events):
+    """Escribe los eventos en el spool y arranca el flusher del proceso si está configurado"""
+    spool = get_spool()
+    ingest_ids = spool.append(events)
+    if settings.PAGE_ANALYTICS_SPOOL_FLUSHER_THREAD:
+        start_flusher(spool)
+    return ingest_ids
+
+
+def start_flusher(spool):
+    """Hilo daemon que carga el spool cada PAGE_ANALYTICS_SPOOL_FLUSH_SECONDS (uno por proceso)"""
+    global _flusher
+    with _spools_lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=run_flusher, args=(spool,), name='page-access-spool', daemon=True)
+        _flusher.start()
+
+
+def run_flusher(spool, once=False):
+    while True:
+        try:
+            spool.flush()
+        except Exception:
+            # El segmento que falló vuelve a .ready y se reintenta en la siguiente pasada
+            logger.exception('spool: error al cargar segmentos')
+        finally:
+            close_old_connections()
+        if once:
+            return
+        time.sleep(settings.PAGE_ANALYTICS_SPOOL_FLUSH_SECONDS)
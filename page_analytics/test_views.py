@@ -1,4 +1,14 @@
-from django.test import TestCase
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from unittest import skipIf
+
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
@@ -6,8 +16,12 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 import json
 
-from .models import PageAccess, PageSection, UserJourney, PagePerformance
-from .serializers import PageAccessSerializer, PageSectionSerializer
+from app.tdigest import TDigest
+from . import spool
+from .ingest import INSERT_CHUNK_SIZE, clean_event
+from .views import MAX_PERFORMANCE_DAYS
+from .models import PageAccess, PageLoadDigest, PageSection, PageSessionSketch, UserJourney, PagePerformance
+from .serializers import PageAccessCreateSerializer, PageAccessSerializer, PageSectionSerializer
 
 
 class PageAccessViewSetTest(APITestCase):
@@ -127,6 +141,27 @@ class PageAccessViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('total_page_views', response.data)
     
+    def test_summary_values_in_fixed_queries(self):
+        """Test: summary calcula métricas, rebote y ecommerce con un número fijo de consultas"""
+        # session-0 suma dos páginas más; las otras cuatro sesiones son de una sola página
+        for event_type in ('product_view', 'purchase'):
+            PageAccess.objects.create(page_url='/page-0', session_id='session-0', device_type='mobile',
+                                      time_on_page=30, metadata={'event_type': event_type})
+        url = reverse('page-access-summary')
+
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_page_views'], 7)
+        self.assertEqual(response.data['unique_visitors'], 5)
+        self.assertEqual(response.data['bounce_rate'], 80.0)
+        self.assertAlmostEqual(response.data['avg_session_duration'], (5 * 120 + 2 * 30) / 7)
+        self.assertEqual(response.data['top_pages'][0], {'page_url': '/page-0', 'views': 3})
+        self.assertEqual(response.data['device_distribution'], {'desktop': 5, 'mobile': 2})
+        self.assertEqual(response.data['ecommerce_events'],
+                         {'product_views': 1, 'add_to_cart': 0, 'begin_checkout': 0, 'purchases': 1})
+    
     def test_trends_action(self):
         """Test: Endpoint trends de PageAccess"""
         url = reverse('page-access-trends')
@@ -151,6 +186,33 @@ class PageAccessViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsInstance(response.data, list)
     
+    def test_trends_values_in_two_queries(self):
+        """Test: trends agrupa por día en dos consultas y rellena los días sin accesos"""
+        access = PageAccess.objects.create(page_url='/page-1', session_id='session-1', time_on_page=60)
+        access.created_at = PageAccess.objects.get(session_id='session-1', time_on_page=120).created_at
+        access.save(update_fields=['created_at'])
+        url = reverse('page-access-trends')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'days': 7})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        today = timezone.localdate()
+        self.assertEqual([row['date'] for row in response.data],
+                         [str(today - timedelta(days=days)) for days in range(7, 0, -1)])
+        yesterday, two_days_ago, empty = response.data[-1], response.data[-2], response.data[0]
+        self.assertEqual((yesterday['page_views'], yesterday['unique_visitors'], yesterday['bounce_rate']), (2, 1, 0))
+        self.assertEqual(yesterday['avg_time_on_page'], 90)
+        self.assertEqual((two_days_ago['page_views'], two_days_ago['bounce_rate']), (1, 100))
+        self.assertEqual((empty['page_views'], empty['unique_visitors'], empty['bounce_rate']), (0, 0, 0))
+
+    def test_trends_invalid_days(self):
+        """Test: days fuera de rango o no numérico"""
+        url = reverse('page-access-trends')
+        for days in ('0', '366', 'abc'):
+            response = self.client.get(url, {'days': days})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
     def test_sections_action(self):
         """Test: Endpoint sections de PageAccess"""
         url = reverse('page-access-sections')
@@ -168,6 +230,376 @@ class PageAccessViewSetTest(APITestCase):
         self.assertIsInstance(response.data, list)
 
 
+@skipIf(connection.vendor == 'postgresql', 'En PostgreSQL los rangos cortos usan percentile_cont')
+class PageAccessPerformanceTest(APITestCase):
+    """Tests para los percentiles de performance (t-digests diarios)"""
+
+    def setUp(self):
+        """Configuración inicial para los tests"""
+        self.client = APIClient()
+        self.url = reverse('page-access-performance')
+        now = timezone.now()
+        # /lenta: 1..20 segundos repartidos entre hace tres días y hoy; /rapida: un solo acceso hoy
+        for value in range(1, 21):
+            self.create_access('/lenta', value, now - timedelta(days=value % 4))
+        self.create_access('/rapida', 5, now)
+
+    def create_access(self, page_url, time_on_page, created_at):
+        access = PageAccess.objects.create(page_url=page_url, session_id=f'session-{time_on_page}',
+                                           time_on_page=time_on_page)
+        access.created_at = created_at
+        access.save(update_fields=['created_at'])
+
+    def test_real_percentiles(self):
+        """Test: p75/p95 son percentiles reales (exactos con pocos valores), no el promedio"""
+        response = self.client.get(self.url, {'days': 7})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pages = {page['page_url']: page for page in response.data}
+        # percentile_cont de 1..20: posición q * 19
+        self.assertEqual((pages['/lenta']['load_time_avg'], pages['/lenta']['load_time_p75'],
+                          pages['/lenta']['load_time_p95']), (10.5, 15.25, 19.05))
+        self.assertEqual((pages['/rapida']['load_time_p75'], pages['/rapida']['load_time_p95']), (5, 5))
+
+    def test_closed_days_are_stored(self):
+        """Test: Los digests de días cerrados se guardan una vez (también los días vacíos)"""
+        self.client.get(self.url, {'days': 7})
+
+        self.assertEqual(PageLoadDigest.objects.exclude(page_url='').count(), 3)
+        self.assertEqual(PageLoadDigest.objects.filter(page_url='').count(), 4)
+        # Un acceso nuevo en un día cerrado no cambia el digest ya guardado; hoy se calcula en vivo
+        self.create_access('/lenta', 1000, timezone.now() - timedelta(days=2))
+        self.create_access('/lenta', 1000, timezone.now())
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'days': 7})
+        lenta = next(page for page in response.data if page['page_url'] == '/lenta')
+        # 1..20 más el 1000 de hoy: la posición 0.95 * 20 cae justo en 20 (con los dos 1000 sería ~951)
+        self.assertEqual(lenta['load_time_p95'], 20)
+
+    def test_invalid_days(self):
+        """Test: days fuera de rango o no numérico"""
+        for days in ('-1', str(MAX_PERFORMANCE_DAYS + 1), 'abc'):
+            response = self.client.get(self.url, {'days': days})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tdigest_accuracy_and_merge(self):
+        """Test: El t-digest estima percentiles de muchos valores y se combina por día"""
+        generator = random.Random(7)
+        values = [generator.expovariate(1 / 300) for _ in range(50000)]
+        days = []
+        for offset in range(0, len(values), 5000):
+            digest = TDigest()
+            digest.update(values[offset:offset + 5000])
+            days.append(TDigest.from_bytes(digest.to_bytes()))
+
+        merged = TDigest.merge(days)
+        ordered = sorted(values)
+        self.assertEqual(merged.count, len(values))
+        self.assertLess(len(merged.centroids), 200)
+        for q in (0.5, 0.75, 0.95):
+            expected = ordered[round(q * (len(values) - 1))]
+            self.assertAlmostEqual(merged.quantile(q), expected, delta=expected * 0.02)
+        self.assertIsNone(TDigest().quantile(0.5))
+
+
+class PageAccessBatchTest(APITestCase):
+    """Tests para la ingesta por lotes de PageAccess"""
+
+    def setUp(self):
+        """Configuración inicial para los tests"""
+        self.client = APIClient()
+        self.url = reverse('page-access-batch')
+        self.event = {
+            'page_url': '/productos',
+            'section': 'productos-destacados',
+            'session_id': 'session456',
+            'device_type': 'desktop',
+            'ip_address': '192.168.1.1',
+            'time_on_page': 120,
+            'metadata': {'event_type': 'product_view'}
+        }
+
+    def test_batch_json_array(self):
+        """Test: Lista JSON con eventos válidos e inválidos"""
+        events = [self.event, dict(self.event, page_url=''), dict(self.event, time_on_page='mucho'),
+                  dict(self.event, ip_address='999.1.1.1'), 'texto', dict(self.event, page_url='/carrito'),
+                  dict(self.event, time_on_page=None), dict(self.event, time_on_page=30.5),
+                  dict(self.event, time_on_page=True), dict(self.event, page_url='/checkout', time_on_page=30.0),
+                  dict(self.event, page_url='/pago', time_on_page=' 45 ')]
+
+        response = self.client.post(self.url, events, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (4, 7))
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3, 4, 6, 7, 8])
+        self.assertIn('time_on_page', response.data['errors'][1]['errors'])
+        # Los mismos errores que el IntegerField del serializer (p. ej. null no toma el default)
+        serializer = PageAccessCreateSerializer(data=dict(self.event, time_on_page=None))
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(response.data['errors'][4]['errors']['time_on_page'],
+                         [str(serializer.errors['time_on_page'][0])])
+        self.assertEqual(sorted(PageAccess.objects.values_list('page_url', flat=True)),
+                         ['/carrito', '/checkout', '/pago', '/productos'])
+        access = PageAccess.objects.get(page_url='/productos')
+        self.assertEqual((access.time_on_page, access.metadata, access.scroll_depth),
+                         (120, {'event_type': 'product_view'}, 0))
+        self.assertEqual(PageAccess.objects.get(page_url='/checkout').time_on_page, 30)
+        self.assertEqual(PageAccess.objects.get(page_url='/pago').time_on_page, 45)
+
+    def test_batch_matches_serializer(self):
+        """Test: La validación por lote acepta y rechaza lo mismo que PageAccessCreateSerializer"""
+        events = [{'page_url': '/a\x00b'}, dict(self.event, session_id=None), {'session_id': 'x'},
+                  dict(self.event, ip_address=''), dict(self.event, metadata=None), dict(self.event, page_url='   '),
+                  dict(self.event, page_url='  /espacios  ', session_id=' s1 ')]
+        for event in events:
+            values, errors = clean_event(event)
+            serializer = PageAccessCreateSerializer(data=event)
+            self.assertEqual(serializer.is_valid(), errors is None, event)
+            if errors is None:
+                self.assertEqual(values, dict(serializer.validated_data), event)
+            else:
+                self.assertEqual(errors, {name: [str(detail) for detail in details]
+                                          for name, details in serializer.errors.items()}, event)
+
+        response = self.client.post(self.url, events, format='json')
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (1, 6))
+        self.assertEqual(PageAccess.objects.get().page_url, '/espacios')
+
+    def test_batch_ndjson(self):
+        """Test: Cuerpo NDJSON con una línea inválida"""
+        body = '\n'.join([json.dumps(self.event), '{no es json', '', json.dumps(dict(self.event, section=''))])
+
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (2, 1))
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+
+    def test_batch_inserts_in_chunks(self):
+        """Test: Los eventos se insertan con bulk_create en bloques"""
+        events = [dict(self.event, session_id=f'session-{i}') for i in range(300)]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, {'events': events}, format='json')
+
+        self.assertEqual(response.data['accepted'], 300)
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        # Un INSERT por bloque (SQLite además limita las filas por sentencia), no uno por evento
+        fields = [field for field in PageAccess._meta.concrete_fields if not field.primary_key]
+        chunk = min(INSERT_CHUNK_SIZE, connection.ops.bulk_batch_size(fields, events) or INSERT_CHUNK_SIZE)
+        self.assertEqual(len(inserts), -(-300 // chunk))
+        self.assertEqual(PageAccess.objects.count(), 300)
+
+    def test_batch_invalid_requests(self):
+        """Test: Cuerpos vacíos, que no son lista o con demasiados eventos"""
+        for body in ([], {'otro': 1}, [self.event] * 501, [{'page_url': ''}]):
+            response = self.client.post(self.url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(PageAccess.objects.count(), 0)
+
+
+class PageAccessSpoolTest(APITestCase):
+    """Tests para la ingesta con spool en disco (write-behind)"""
+
+    def setUp(self):
+        """Configuración inicial para los tests"""
+        self.client = APIClient()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings = override_settings(PAGE_ANALYTICS_SPOOL_DIR=self.directory, PAGE_ANALYTICS_SPOOL_FLUSHER_THREAD=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.spool = spool.get_spool()
+        self.addCleanup(self.spool.rotate, force=True)
+        self.event = {'page_url': '/productos', 'session_id': 'session456', 'time_on_page': 30}
+
+    def test_create_is_written_behind(self):
+        """Test: create responde 202 y el acceso llega a la base al cargar el spool"""
+        before = timezone.now()
+        response = self.client.post(reverse('page-access-list'), self.event, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(PageAccess.objects.count(), 0)
+
+        self.spool.rotate(force=True)
+        self.assertEqual(self.spool.flush(), 1)
+        access = PageAccess.objects.get()
+        self.assertEqual((access.page_url, access.time_on_page, str(access.ingest_id)),
+                         ('/productos', 30, response.data['ingest_id']))
+        # created_at es el momento en que se recibió, no el de la carga
+        self.assertTrue(before <= access.created_at <= timezone.now())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_create_invalid_event(self):
+        """Test: Un evento inválido se rechaza sin escribirse en el spool"""
+        response = self.client.post(reverse('page-access-list'), {'page_url': ''}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.spool.stats()['pending_bytes'], 0)
+
+    def test_batch_is_written_behind(self):
+        """Test: batch responde 202 con los rechazados y solo encola los válidos"""
+        events = [self.event, {'page_url': ''}, dict(self.event, page_url='/carrito')]
+
+        response = self.client.post(reverse('page-access-batch'), events, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (2, 1))
+        self.assertEqual(PageAccess.objects.count(), 0)
+        self.spool.rotate(force=True)
+        self.assertEqual(self.spool.flush(), 2)
+        self.assertEqual(sorted(PageAccess.objects.values_list('page_url', flat=True)), ['/carrito', '/productos'])
+
+    def test_recovers_segment_of_dead_process(self):
+        """Test: Un segmento .open sin candado (proceso muerto) se carga sin su última línea incompleta"""
+        other = spool.Spool(self.directory)
+        other.append([self.event])
+        # Simula la caída del proceso a mitad de una escritura
+        os.write(other._fd, b'{"ingest_id": "incompleto')
+        os.close(other._fd)
+
+        with self.assertLogs('page_analytics.spool', level='WARNING'):
+            self.assertEqual(self.spool.flush(), 1)
+        self.assertEqual(PageAccess.objects.count(), 1)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_segment_is_locked_before_it_is_open(self):
+        """Test: Un segmento recién creado (.creating) no se recupera hasta que es viejo"""
+        creating = os.path.join(self.directory, f'1-1-1{spool.CREATING}')
+        open(creating, 'w').close()
+
+        self.spool.append([self.event])
+        self.spool.recover()
+        self.assertEqual(sorted(os.path.splitext(name)[1] for name in os.listdir(self.directory)),
+                         [spool.CREATING, spool.OPEN])
+        self.assertEqual(self.spool.stats()['open_segments'], 1)
+
+        old = time.time() - spool.FLUSHING_TIMEOUT - 1
+        os.utime(creating, (old, old))
+        self.spool.recover()
+        self.assertFalse(os.path.exists(creating))
+
+    def test_reloaded_segment_does_not_duplicate(self):
+        """Test: Volver a cargar un segmento ya insertado no duplica accesos"""
+        self.spool.append([self.event, self.event])
+        self.spool.rotate(force=True)
+        segment = os.path.join(self.directory, os.listdir(self.directory)[0])
+        copy = segment.replace(spool.READY, '-copia' + spool.READY)
+        shutil.copy(segment, copy)
+
+        self.assertEqual(self.spool.flush(), 4)
+        self.assertEqual(PageAccess.objects.count(), 2)
+
+    def test_failing_segment_is_quarantined(self):
+        """Test: Un segmento que siempre falla se aparta como .failed y no bloquea a los siguientes"""
+        bad = os.path.join(self.directory, f'1-1-1{spool.READY}')
+        with open(bad, 'w') as segment:
+            segment.write(json.dumps({'ingest_id': 'x', 'values': {'campo_desconocido': 1}}) + '\n')
+        self.spool.append([self.event])
+        self.spool.rotate(force=True)
+
+        with self.assertLogs('page_analytics.spool', level='ERROR') as logs:
+            self.assertEqual(self.spool.flush(), 1)
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(PageAccess.objects.count(), 1)
+        self.assertEqual(os.listdir(self.directory), [f'1-1-1{spool.FAILED}'])
+        stats = self.spool.stats()
+        self.assertEqual((stats['failed_segments'], stats['ready_segments'], stats['pending_bytes']), (1, 0, 0))
+        self.assertGreater(stats['failed_bytes'], 0)
+
+    def pending_segment(self, days):
+        """Segmento .ready creado hace `days` días con un evento recibido en ese momento"""
+        received_at = timezone.now() - timedelta(days=days)
+        name = f'{int(received_at.timestamp() * 1e9)}-1-1{spool.READY}'
+        with open(os.path.join(self.directory, name), 'w') as segment:
+            record = {'ingest_id': '00000000-0000-0000-0000-000000000001',
+                      'received_at': received_at.isoformat(), 'values': self.event}
+            segment.write(json.dumps(record) + '\n')
+        return received_at
+
+    def test_digests_wait_for_the_spool(self):
+        """Test: Los días que el spool no ha terminado de cargar no se guardan como digests"""
+        received_at = self.pending_segment(2)
+        settled = timezone.localdate(received_at - timedelta(seconds=spool.SETTLE_MARGIN)) - timedelta(days=1)
+
+        self.client.get(reverse('page-access-performance'), {'days': 7})
+        self.assertFalse(PageLoadDigest.objects.filter(date__gt=settled).exists())
+
+        self.assertEqual(self.spool.flush(), 1)
+        response = self.client.get(reverse('page-access-performance'), {'days': 7})
+        self.assertEqual([page['page_url'] for page in response.data], ['/productos'])
+        self.assertTrue(PageLoadDigest.objects.filter(date=timezone.localdate(received_at), page_url='/productos').exists())
+
+    def test_sketches_wait_for_the_spool(self):
+        """Test: Los días que el spool no ha terminado de cargar no se guardan como sketches"""
+        received_at = self.pending_segment(2)
+        settled = timezone.localdate(received_at - timedelta(seconds=spool.SETTLE_MARGIN)) - timedelta(days=1)
+
+        self.client.get(reverse('page-access-unique-sessions'), {'days': 7})
+        self.assertFalse(PageSessionSketch.objects.filter(date__gt=settled).exists())
+
+        self.assertEqual(self.spool.flush(), 1)
+        response = self.client.get(reverse('page-access-unique-sessions'), {'days': 7})
+        self.assertEqual(response.data['unique_sessions'], 1)
+        self.assertTrue(PageSessionSketch.objects.filter(date=timezone.localdate(received_at)).exists())
+
+    def test_ingest_status(self):
+        """Test: ingest-status reporta segmentos, bytes pendientes y retraso"""
+        self.spool.append([self.event])
+        self.spool.rotate(force=True)
+        self.spool.append([self.event])
+
+        response = self.client.get(reverse('page-access-ingest-status'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['enabled'])
+        self.assertEqual((response.data['open_segments'], response.data['ready_segments']), (1, 1))
+        self.assertGreater(response.data['pending_bytes'], 0)
+        self.assertGreaterEqual(response.data['lag_seconds'], 0)
+
+        with override_settings(PAGE_ANALYTICS_SPOOL_DIR=''):
+            response = self.client.get(reverse('page-access-ingest-status'))
+        self.assertEqual(response.data, {'enabled': False})
+
+
+class PageAccessUniqueSessionsTest(APITestCase):
+    """Tests para sesiones únicas aproximadas (sketches HyperLogLog por día)"""
+
+    def setUp(self):
+        """Accesos de tres sesiones en dos días; una sesión repite en ambos"""
+        self.client = APIClient()
+        self.url = reverse('page-access-unique-sessions')
+        for days, session_id in ((2, 'session-a'), (2, 'session-a'), (2, 'session-b'),
+                                 (0, 'session-a'), (0, 'session-c'), (0, '')):
+            page_access = PageAccess.objects.create(page_url='/productos', session_id=session_id)
+            PageAccess.objects.filter(id=page_access.id).update(created_at=timezone.now() - timedelta(days=days))
+
+    def test_unique_sessions(self):
+        """Test: Total del rango y serie por día"""
+        response = self.client.get(self.url, {'days': 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['unique_sessions'], 3)
+        self.assertEqual([row['unique_sessions'] for row in response.data['series']], [0, 2, 0, 2])
+        self.assertIn('error_bound', response.data)
+
+    def test_unique_sessions_stores_closed_days(self):
+        """Test: Los días cerrados se guardan como sketches y no se vuelven a calcular"""
+        self.client.get(self.url, {'days': 3})
+        self.assertEqual(PageSessionSketch.objects.count(), 3)
+
+        PageAccess.objects.exclude(created_at__date=timezone.localdate()).delete()
+        response = self.client.get(self.url, {'days': 3, 'granularity': 'month'})
+
+        self.assertEqual(response.data['unique_sessions'], 3)
+
+    def test_unique_sessions_invalid_params(self):
+        """Test: Parámetros inválidos"""
+        for params in ({'granularity': 'hour'}, {'days': 'x'}, {'date_from': '2025-13-01'}, {'days': 5000}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
 class PageSectionViewSetTest(APITestCase):
     """Tests para PageSectionViewSet"""
     
@@ -0,0 +1,64 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from app.hyperloglog import RELATIVE_ERROR, HyperLogLog, daily_sketches, error_bound, merge_by_bucket
+from .models import PageAccess, PageSessionSketch
+from .spool import last_settled_day
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def bucket_start(day, granularity):
+    """Primer día de la semana (lunes) o del mes de `day`"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def session_sketches(start_date, end_date):
+    """{fecha: HyperLogLog} con los session_id de los accesos de cada día del rango"""
+    start = timezone.make_aware(datetime.combine(start_date, time.min))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    rows = (
+        PageAccess.objects.filter(created_at__gte=start, created_at__lt=end)
+        .exclude(session_id='')
+        .annotate(day=TruncDate('created_at'))
+        .values_list('day', 'session_id')
+        .order_by()
+    )
+    sketches = defaultdict(HyperLogLog)
+    for day, session_id in rows.iterator(chunk_size=5000):
+        sketches[day].add(session_id)
+    return sketches
+
+
+def unique_sessions(start_date, end_date, granularity='day'):
+    """
+    Sesiones únicas estimadas en [start_date, end_date] y por día, semana o
+    mes. Los días cerrados combinan los sketches de PageSessionSketch (los que
+    falten se calculan una vez); hoy y los días que el spool todavía no
+    termina de cargar se calculan en vivo.
+    """
+    settled = last_settled_day()
+    sketches = daily_sketches(PageSessionSketch, start_date, min(end_date, settled), session_sketches)
+    if end_date > settled:
+        sketches.update(session_sketches(max(start_date, settled + timedelta(days=1)), end_date))
+
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    series = []
+    for day, sketch in merge_by_bucket(sketches, days, lambda day: bucket_start(day, granularity)):
+        estimate = sketch.estimate()
+        series.append({'date': day, 'unique_sessions': estimate, 'error_bound': error_bound(estimate)})
+
+    estimate = HyperLogLog.merge(list(sketches.values())).estimate()
+    return {
+        'date_from': start_date,
+        'date_to': end_date,
+        'unique_sessions': estimate,
+        'error_bound': error_bound(estimate),
+        'relative_error': round(RELATIVE_ERROR, 4),
+        'series': series,
+    }
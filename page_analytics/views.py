@@ -1,16 +1,39 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from collections import Counter
+from django.db import connection
 from django.db.models import Count, Avg, Sum, Q
+from django.db.models.functions import TruncDate
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from .models import PageAccess, PageSection, UserJourney, PagePerformance
 from .serializers import (
     PageAccessSerializer, PageAccessCreateSerializer, PageSectionSerializer,
     UserJourneySerializer, PagePerformanceSerializer, PageAnalyticsSummarySerializer,
     PageAnalyticsTrendSerializer, SectionAnalyticsSerializer, UserJourneyAnalyticsSerializer,
-    PagePerformanceAnalyticsSerializer
+    PagePerformanceAnalyticsSerializer, UniqueSessionsSerializer
 )
+from . import percentiles, spool, uniques
+from .ingest import BATCH_MAX_SIZE, NDJSONParser, clean_event, insert_events, validate_events
+
+# Eventos de ecommerce del resumen: (llave en la respuesta, metadata.event_type)
+ECOMMERCE_EVENTS = (
+    ('product_views', 'product_view'),
+    ('add_to_cart', 'add_to_cart'),
+    ('begin_checkout', 'begin_checkout'),
+    ('purchases', 'purchase'),
+)
+
+# Tope de days en trends (una fila por día)
+MAX_TREND_DAYS = 365
+
+# Tope del rango de unique-sessions (dos años de sketches diarios)
+MAX_UNIQUE_DAYS = 730
+
+# Tope de days en performance (un año de t-digests diarios por página)
+MAX_PERFORMANCE_DAYS = 365
 
 
 class PageAccessViewSet(viewsets.ModelViewSet):
@@ -25,6 +48,63 @@ class PageAccessViewSet(viewsets.ModelViewSet):
             return PageAccessCreateSerializer
         return PageAccessSerializer
     
+    def create(self, request, *args, **kwargs):
+        """
+        Con PAGE_ANALYTICS_SPOOL_DIR el acceso se escribe en el spool y se
+        responde 202; el flusher lo inserta después. Sin spool, creación normal.
+        """
+        if not spool.is_enabled():
+            return super().create(request, *args, **kwargs)
+
+        values, errors = clean_event(request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        ingest_ids = spool.enqueue([values])
+        return Response({'accepted': 1, 'ingest_id': ingest_ids[0]}, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['post'], url_path='batch', parser_classes=[JSONParser, NDJSONParser])
+    def batch(self, request):
+        """
+        Registra varios accesos en una petición: una lista JSON (o {'events': [...]})
+        o un cuerpo NDJSON (application/x-ndjson, un evento por línea). Los eventos
+        inválidos se rechazan uno por uno; los válidos se insertan con bulk_create,
+        o se escriben en el spool (202) si PAGE_ANALYTICS_SPOOL_DIR está configurado.
+        """
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('events')
+
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Se esperaba una lista de eventos'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(items) > BATCH_MAX_SIZE:
+            return Response(
+                {'error': f'Máximo {BATCH_MAX_SIZE} eventos por petición'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        valid, rejected = validate_events(items)
+        body = {'accepted': len(valid), 'rejected': len(rejected), 'errors': rejected}
+        if not valid:
+            return Response(body, status=status.HTTP_400_BAD_REQUEST)
+
+        if spool.is_enabled():
+            spool.enqueue(valid)
+            return Response(body, status=status.HTTP_202_ACCEPTED)
+
+        insert_events([{'values': values} for values in valid])
+        return Response(body, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='ingest-status')
+    def ingest_status(self, request):
+        """
+        Profundidad y retraso del spool de ingesta: segmentos y bytes pendientes
+        de cargar y la edad (en segundos) del evento pendiente más viejo.
+        """
+        if not spool.is_enabled():
+            return Response({'enabled': False})
+        return Response({'enabled': True, **spool.get_spool().stats()})
+
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """
@@ -37,17 +117,23 @@ class PageAccessViewSet(viewsets.ModelViewSet):
             created_at__gte=start_date
         )
         
-        # Métricas básicas
-        total_page_views = queryset.count()
-        unique_visitors = queryset.values('session_id').distinct().count()
-        avg_time = queryset.aggregate(avg_time=Avg('time_on_page'))['avg_time'] or 0
+        # Métricas básicas y eventos de ecommerce en una sola pasada (conteos condicionales)
+        totals = queryset.aggregate(
+            total_page_views=Count('id'),
+            avg_time=Avg('time_on_page'),
+            **{key: Count('id', filter=Q(metadata__event_type=event_type))
+               for key, event_type in ECOMMERCE_EVENTS}
+        )
         
-        # Calcular tasa de rebote
-        total_sessions = queryset.values('session_id').distinct().count()
-        bounce_sessions = queryset.values('session_id').annotate(
+        # Visitantes únicos y rebote: sesiones y sesiones de una sola página en un solo agrupamiento
+        sessions = queryset.order_by().values('session_id').annotate(
             page_count=Count('id')
-        ).filter(page_count=1).count()
-        bounce_rate = (bounce_sessions / total_sessions * 100) if total_sessions > 0 else 0
+        ).aggregate(
+            total_sessions=Count('session_id'),
+            bounce_sessions=Count('session_id', filter=Q(page_count=1))
+        )
+        total_sessions = sessions['total_sessions']
+        bounce_rate = (sessions['bounce_sessions'] / total_sessions * 100) if total_sessions > 0 else 0
         
         # Páginas más visitadas
         top_pages = queryset.values('page_url').annotate(
@@ -69,32 +155,16 @@ class PageAccessViewSet(viewsets.ModelViewSet):
             count=Count('id')
         ).order_by('-count')
         
-        # Eventos de ecommerce
-        ecommerce_events = {}
-        
-        # Contar eventos específicos de ecommerce desde metadata
-        product_views = queryset.filter(metadata__has_key='event_type').filter(metadata__event_type='product_view').count()
-        add_to_cart = queryset.filter(metadata__has_key='event_type').filter(metadata__event_type='add_to_cart').count()
-        begin_checkout = queryset.filter(metadata__has_key='event_type').filter(metadata__event_type='begin_checkout').count()
-        purchases = queryset.filter(metadata__has_key='event_type').filter(metadata__event_type='purchase').count()
-        
-        ecommerce_events = {
-            'product_views': product_views,
-            'add_to_cart': add_to_cart,
-            'begin_checkout': begin_checkout,
-            'purchases': purchases
-        }
-        
         data = {
-            'total_page_views': total_page_views,
-            'unique_visitors': unique_visitors,
-            'avg_session_duration': avg_time,
+            'total_page_views': totals['total_page_views'],
+            'unique_visitors': total_sessions,
+            'avg_session_duration': totals['avg_time'] or 0,
             'bounce_rate': round(bounce_rate, 2),
             'top_pages': list(top_pages),
             'top_sections': list(top_sections),
             'device_distribution': {item['device_type']: item['count'] for item in device_distribution},
             'browser_distribution': {item['browser']: item['count'] for item in browser_distribution},
-            'ecommerce_events': ecommerce_events
+            'ecommerce_events': {key: totals[key] for key, _ in ECOMMERCE_EVENTS}
         }
         
         serializer = PageAnalyticsSummarySerializer(data)
@@ -103,40 +173,53 @@ class PageAccessViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def trends(self, request):
         """
-        Obtener tendencias de analytics
+        Obtener tendencias de analytics: una fila por día de los `days` días
+        anteriores a hoy, con dos consultas agrupadas sobre [inicio, hoy)
         """
-        days = int(request.query_params.get('days', 7))
-        start_date = timezone.now() - timedelta(days=days)
-        
-        # Generar fechas para el rango
-        dates = []
-        trends_data = []
-        
-        for i in range(days):
-            date = start_date + timedelta(days=i)
-            dates.append(date.date())
-            
-            # Filtrar por fecha
-            day_queryset = self.queryset.filter(
-                created_at__date=date.date()
+        try:
+            days = int(request.query_params.get('days', 7))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= MAX_TREND_DAYS:
+            return Response(
+                {'error': f'days debe ser un entero entre 1 y {MAX_TREND_DAYS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        today = timezone.localdate()
+        dates = [today - timedelta(days=days - i) for i in range(days)]
+        # Rango semiabierto sobre created_at (usa el índice, a diferencia de created_at__date=)
+        start = timezone.make_aware(datetime.combine(dates[0], time.min))
+        end = timezone.make_aware(datetime.combine(today, time.min))
+        daily = self.queryset.filter(
+            created_at__gte=start, created_at__lt=end
+        ).annotate(day=TruncDate('created_at')).order_by()
+
+        metrics = {
+            row['day']: row
+            for row in daily.values('day').annotate(
+                page_views=Count('id'),
+                unique_visitors=Count('session_id', distinct=True),
+                avg_time=Avg('time_on_page')
             )
-            
-            page_views = day_queryset.count()
-            unique_visitors = day_queryset.values('session_id').distinct().count()
-            avg_time = day_queryset.aggregate(avg_time=Avg('time_on_page'))['avg_time'] or 0
-            
-            # Calcular tasa de rebote para el día
-            total_sessions = day_queryset.values('session_id').distinct().count()
-            bounce_sessions = day_queryset.values('session_id').annotate(
+        }
+        # Sesiones de una sola página por día (rebote)
+        bounces = Counter(
+            daily.values('day', 'session_id').annotate(
                 page_count=Count('id')
-            ).filter(page_count=1).count()
-            bounce_rate = (bounce_sessions / total_sessions * 100) if total_sessions > 0 else 0
-            
+            ).filter(page_count=1).values_list('day', flat=True)
+        )
+
+        trends_data = []
+        for date in dates:
+            row = metrics.get(date, {})
+            total_sessions = row.get('unique_visitors', 0)
+            bounce_rate = (bounces[date] / total_sessions * 100) if total_sessions > 0 else 0
             trends_data.append({
-                'date': date.date(),
-                'page_views': page_views,
-                'unique_visitors': unique_visitors,
-                'avg_time_on_page': round(avg_time, 2),
+                'date': date,
+                'page_views': row.get('page_views', 0),
+                'unique_visitors': total_sessions,
+                'avg_time_on_page': round(row.get('avg_time') or 0, 2),
                 'bounce_rate': round(bounce_rate, 2)
             })
         
@@ -179,31 +262,49 @@ class PageAccessViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def performance(self, request):
         """
-        Obtener métricas de rendimiento
+        Obtener métricas de rendimiento por página desde el inicio del día de
+        hace `days` días. p75/p95 son exactos con percentile_cont en
+        PostgreSQL (rangos de hasta EXACT_MAX_DAYS días); en otro caso son
+        aproximados: se combinan los t-digests diarios de cada página
+        (guardados para los días cerrados, en vivo para hoy).
         """
-        days = int(request.query_params.get('days', 30))
-        start_date = timezone.now() - timedelta(days=days)
-        
-        queryset = self.queryset.filter(created_at__gte=start_date)
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = -1
+        if not 0 <= days <= MAX_PERFORMANCE_DAYS:
+            return Response(
+                {'error': f'days debe ser un entero entre 0 y {MAX_PERFORMANCE_DAYS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        today = timezone.localdate()
+        start_date = today - timedelta(days=days)
+        # Inicio de día, para que coincida con los digests diarios
+        queryset = self.queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(start_date, time.min)))
+        exact = connection.vendor == 'postgresql' and days <= percentiles.EXACT_MAX_DAYS
         
         # Agrupar por página
-        pages_data = queryset.values('page_url').annotate(
-            page_views=Count('id'),
-            unique_visitors=Count('session_id', distinct=True),
-            load_time_avg=Avg('time_on_page'),
-            load_time_p75=Avg('time_on_page'),  # Simplificado
-            load_time_p95=Avg('time_on_page'),  # Simplificado
-            conversion_rate=Avg('interactions')
-        ).order_by('-page_views')
+        aggregates = {
+            'page_views': Count('id'),
+            'unique_visitors': Count('session_id', distinct=True),
+            'load_time_avg': Avg('time_on_page'),
+            'conversion_rate': Avg('interactions'),
+        }
+        if exact:
+            aggregates.update({key: percentiles.PercentileCont('time_on_page', q) for key, q in percentiles.PERCENTILES})
+        pages_data = queryset.values('page_url').annotate(**aggregates).order_by('-page_views')
+        page_percentiles = {} if exact else percentiles.page_percentiles(start_date, today)
         
         # Formatear datos
         formatted_data = []
         for item in pages_data:
+            item.update(page_percentiles.get(item['page_url'], {}))
             formatted_data.append({
                 'page_url': item['page_url'],
                 'load_time_avg': round(item['load_time_avg'] or 0, 2),
-                'load_time_p75': round(item['load_time_p75'] or 0, 2),
-                'load_time_p95': round(item['load_time_p95'] or 0, 2),
+                'load_time_p75': round(item.get('load_time_p75') or 0, 2),
+                'load_time_p95': round(item.get('load_time_p95') or 0, 2),
                 'page_views': item['page_views'],
                 'unique_visitors': item['unique_visitors'],
                 'conversion_rate': round(item['conversion_rate'] or 0, 2)
@@ -213,6 +314,41 @@ class PageAccessViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+    @action(detail=False, methods=['get'], url_path='unique-sessions')
+    def unique_sessions(self, request):
+        """
+        Sesiones únicas aproximadas (HyperLogLog, ~1.6% de error) de los últimos
+        `days` días (default 30) o de date_from/date_to, por granularity=day|week|month
+        """
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in uniques.GRANULARITIES:
+            return Response(
+                {'error': f'granularity inválido. Use {", ".join(uniques.GRANULARITIES)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            end_date = timezone.localdate()
+            if request.query_params.get('date_to'):
+                end_date = datetime.strptime(request.query_params['date_to'], '%Y-%m-%d').date()
+            if request.query_params.get('date_from'):
+                start_date = datetime.strptime(request.query_params['date_from'], '%Y-%m-%d').date()
+            else:
+                start_date = end_date - timedelta(days=int(request.query_params.get('days', 30)))
+        except ValueError:
+            return Response(
+                {'error': 'Parámetros inválidos. Use days entero y fechas YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if start_date > end_date or (end_date - start_date).days > MAX_UNIQUE_DAYS:
+            return Response(
+                {'error': f'El rango debe ser válido y de a lo más {MAX_UNIQUE_DAYS} días'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data = uniques.unique_sessions(start_date, end_date, granularity)
+        return Response(UniqueSessionsSerializer(data).data)
+
+
 class PageSectionViewSet(viewsets.ModelViewSet):
     """
     ViewSet para PageSection